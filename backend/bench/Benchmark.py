@@ -0,0 +1,154 @@
+"""Load generation, latency statistics and baseline comparison for bench/"""
+
+from collections import Counter
+import asyncio
+import itertools
+import math
+import time
+
+# (name, method, path) - {query} and {track_uri} are filled in per request
+SCENARIOS = [
+    ("profile", "GET", "/spotify/profile"),
+    ("top_tracks", "GET", "/spotify/top-tracks?time_range=short_term"),
+    ("top_artists", "GET", "/spotify/top-artists?time_range=medium_term"),
+    ("dashboard", "GET", "/spotify/dashboard"),
+    ("search", "GET", "/spotify/search?query={query}"),
+    ("playlists", "GET", "/spotify/playlists"),
+    ("recently_played", "GET", "/spotify/recently-played"),
+    ("playlist_export", "GET", "/spotify/playlists/export"),
+    (
+        "add_track",
+        "POST",
+        "/spotify/playlists/add-track?playlist_name=Bench&track_uri={track_uri}",
+    ),
+]
+
+# A small vocabulary, so searches mix shared-cache hits with misses
+SEARCH_QUERIES = [
+    f"{first} {second}"
+    for first, second in itertools.product(
+        ("midnight", "golden", "neon", "velvet", "ocean"),
+        ("river", "echo", "ghost", "signal", "fever", "glass"),
+    )
+]
+
+# Every add uses a URI no earlier add sent, so add_track measures real writes
+# to Spotify rather than the playlist index's duplicate short-circuit
+_track_numbers = itertools.count()
+
+# Regressions smaller than this are treated as noise, however large in ratio
+MIN_LATENCY_DELTA_MS = 2.0
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100 * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def summarize(latencies, statuses, elapsed):
+    """Stats for one scenario: latencies in seconds, elapsed wall time"""
+    ordered = sorted(latencies)
+    errors = sum(count for status, count in statuses.items() if not 200 <= status < 400)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def render_path(path, i):
+    values = {"query": SEARCH_QUERIES[i % len(SEARCH_QUERIES)].replace(" ", "+")}
+    if "{track_uri}" in path:
+        values["track_uri"] = f"spotify:track:bench{next(_track_numbers):07d}"
+    return path.format(**values)
+
+
+async def run_scenario(client, method, path, tokens, requests, concurrency):
+    """Send requests calls spread over tokens, at most concurrency at once
+
+    Returns summarize() of the run. Each request uses the next user's token,
+    so per-user caches and rate limits see a realistic spread of users.
+    """
+    counter = itertools.count()
+    latencies = []
+    statuses = Counter()
+
+    async def worker():
+        while (i := next(counter)) < requests:
+            headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+            start = time.perf_counter()
+            try:
+                response = await client.request(
+                    method, render_path(path, i), headers=headers
+                )
+                status = response.status_code
+            except Exception:
+                status = 599
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, requests))))
+    return summarize(latencies, statuses, time.perf_counter() - start)
+
+
+def median_run(runs):
+    """The run with the median throughput, so one noisy run doesn't decide it"""
+    return sorted(runs, key=lambda stats: stats["throughput_rps"])[len(runs) // 2]
+
+
+def compare(results, baseline, tolerance=0.35):
+    """Regressions of results against baseline, as readable strings
+
+    A scenario regresses when its p50 or p95 grows, or its throughput drops,
+    by more than tolerance (a fraction), or when it starts returning errors.
+    p99 is reported but not gated on: at a few hundred requests it rests on
+    a handful of samples and is mostly noise.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ("p50_ms", "p95_ms"):
+            limit = previous[metric] * (1 + tolerance)
+            if (
+                current[metric] > limit
+                and current[metric] - previous[metric] > MIN_LATENCY_DELTA_MS
+            ):
+                regressions.append(
+                    f"{name}: {metric} {current[metric]} > {previous[metric]} "
+                    f"(+{tolerance:.0%} allowed)"
+                )
+        floor = previous["throughput_rps"] * (1 - tolerance)
+        if current["throughput_rps"] < floor:
+            regressions.append(
+                f"{name}: throughput_rps {current['throughput_rps']} < "
+                f"{previous['throughput_rps']} (-{tolerance:.0%} allowed)"
+            )
+        if current["errors"] > previous["errors"]:
+            regressions.append(
+                f"{name}: {current['errors']} errors (baseline {previous['errors']})"
+            )
+    return regressions
+
+
+def format_table(results):
+    columns = ("requests", "errors", "throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+    width = max(len(name) for name in results) if results else 8
+    lines = [f"{'scenario':<{width}} " + " ".join(f"{c:>14}" for c in columns)]
+    for name, stats in results.items():
+        cells = " ".join(f"{stats[c]:>14}" for c in columns)
+        upstream = stats.get("upstream_calls")
+        suffix = f"  upstream={upstream}" if upstream is not None else ""
+        lines.append(f"{name:<{width}} {cells}{suffix}")
+    return "\n".join(lines)
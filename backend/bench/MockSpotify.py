@@ -0,0 +1,530 @@
+"""Offline stand-in for the Spotify Web API and accounts service
+
+Serves the endpoints SpotifyClient and AuthManager use, with Spotify-shaped
+payloads generated from a fixed seed, offset/limit pagination, ETags,
+configurable latency and injected 429s. Point the app at it with
+
+    SPOTIFY_API_URL=http://127.0.0.1:8090/v1
+    SPOTIFY_ACCOUNTS_URL=http://127.0.0.1:8090
+
+and run it with `python bench/MockSpotify.py --port 8090`.
+"""
+
+from fastapi import FastAPI, Request
+from fastapi.responses import Response
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qsl, urlencode
+from dotenv import load_dotenv
+import argparse
+import asyncio
+import hashlib
+import orjson
+import os
+import random
+import string
+
+load_dotenv()
+
+# Mean upstream latency and the spread added on top of it, in milliseconds
+MOCK_SPOTIFY_LATENCY_MS = float(os.getenv("MOCK_SPOTIFY_LATENCY_MS", "40"))
+MOCK_SPOTIFY_JITTER_MS = float(os.getenv("MOCK_SPOTIFY_JITTER_MS", "20"))
+# Fraction of Web API calls answered with 429 Too Many Requests
+MOCK_SPOTIFY_429_RATE = float(os.getenv("MOCK_SPOTIFY_429_RATE", "0"))
+MOCK_SPOTIFY_RETRY_AFTER = int(os.getenv("MOCK_SPOTIFY_RETRY_AFTER", "1"))
+MOCK_SPOTIFY_SEED = int(os.getenv("MOCK_SPOTIFY_SEED", "42"))
+
+CATALOG_TRACKS = 2000
+CATALOG_ARTISTS = 400
+CATALOG_ALBUMS = 600
+PLAYLISTS_PER_USER = 30
+TRACKS_PER_PLAYLIST = 120
+TOP_ITEMS = 50
+SEARCH_TOTAL = 1000
+RECENTLY_PLAYED = 50
+
+# Spotify lists every market a track is available in, which dominates
+# the size of a real track object
+MARKETS = (
+    "AD AE AR AT AU BE BG BH BO BR CA CH CL CO CR CY CZ DE DK DO DZ EC EE EG "
+    "ES FI FR GB GR GT HK HN HU ID IE IL IN IS IT JO JP KW LB LI LT LU LV MA "
+    "MC MT MX MY NI NL NO NZ OM PA PE PH PL PS PT PY QA RO SA SE SG SK SV TH "
+    "TN TR TW US UY VN ZA"
+).split()
+GENRES = [
+    "pop",
+    "indie rock",
+    "hip hop",
+    "uk garage",
+    "jazz",
+    "synthwave",
+    "afrobeats",
+    "k-pop",
+    "classical",
+    "metal",
+]
+WORDS = (
+    "midnight river golden echo paper neon summer ghost velvet static honey "
+    "broken city ocean signal wild satellite silver fever kingdom glass"
+).split()
+ID_ALPHABET = string.ascii_letters + string.digits
+
+
+def spotify_id(rng):
+    return "".join(rng.choice(ID_ALPHABET) for _ in range(22))
+
+
+def title(rng, words=2):
+    return " ".join(rng.choice(WORDS).capitalize() for _ in range(words))
+
+
+def images(rng, kind):
+    key = spotify_id(rng).lower()
+    return [
+        {
+            "url": f"https://i.scdn.co/image/{kind}{size}{key}",
+            "height": size,
+            "width": size,
+        }
+        for size in (640, 300, 64)
+    ]
+
+
+def link(kind, id):
+    return {
+        "external_urls": {"spotify": f"https://open.spotify.com/{kind}/{id}"},
+        "href": f"https://api.spotify.com/v1/{kind}s/{id}",
+        "id": id,
+        "type": kind,
+        "uri": f"spotify:{kind}:{id}",
+    }
+
+
+class Catalog:
+    """Tracks, artists and albums generated once from a seed"""
+
+    def __init__(self, seed=MOCK_SPOTIFY_SEED):
+        rng = random.Random(seed)
+        self.artists = [self._artist(rng) for _ in range(CATALOG_ARTISTS)]
+        self.albums = [self._album(rng) for _ in range(CATALOG_ALBUMS)]
+        self.tracks = [self._track(rng, i) for i in range(CATALOG_TRACKS)]
+        self.by_id = {
+            "tracks": {track["id"]: track for track in self.tracks},
+            "artists": {artist["id"]: artist for artist in self.artists},
+        }
+        self.by_uri = {track["uri"]: track for track in self.tracks}
+
+    def _artist(self, rng):
+        artist = link("artist", spotify_id(rng))
+        artist.update(
+            name=title(rng),
+            followers={"href": None, "total": rng.randint(100, 5_000_000)},
+            genres=rng.sample(GENRES, 2),
+            images=images(rng, "ab67616d0000"),
+            popularity=rng.randint(10, 95),
+        )
+        return artist
+
+    def _simple_artist(self, artist):
+        return {
+            key: artist[key]
+            for key in ("external_urls", "href", "id", "name", "type", "uri")
+        }
+
+    def _album(self, rng):
+        album = link("album", spotify_id(rng))
+        album.update(
+            album_type="album",
+            artists=[self._simple_artist(rng.choice(self.artists))],
+            available_markets=MARKETS,
+            images=images(rng, "ab67616d00001e02"),
+            name=title(rng, 3),
+            release_date=f"{rng.randint(1970, 2025)}-{rng.randint(1, 12):02d}-01",
+            release_date_precision="day",
+            total_tracks=rng.randint(6, 18),
+        )
+        return album
+
+    def _track(self, rng, i):
+        album = rng.choice(self.albums)
+        track = link("track", spotify_id(rng))
+        track.update(
+            album=album,
+            artists=album["artists"]
+            + [self._simple_artist(rng.choice(self.artists))] * rng.randint(0, 1),
+            available_markets=MARKETS,
+            disc_number=1,
+            duration_ms=rng.randint(90_000, 360_000),
+            explicit=rng.random() < 0.2,
+            external_ids={"isrc": f"USRC1{i:07d}"},
+            is_local=False,
+            name=title(rng, rng.randint(1, 3)),
+            popularity=rng.randint(0, 100),
+            preview_url=None,
+            track_number=rng.randint(1, album["total_tracks"]),
+        )
+        return track
+
+    def sample(self, key, count, pool):
+        """Deterministic sample of count items from pool for key"""
+        rng = random.Random(f"{key}")
+        return rng.sample(pool, min(count, len(pool)))
+
+
+class UserState:
+    """One user's profile and playlists, generated on first use"""
+
+    def __init__(self, catalog, user_id):
+        self.user_id = user_id
+        rng = random.Random(f"user:{user_id}")
+        self.profile = link("user", user_id)
+        self.profile.update(
+            display_name=f"Bench {user_id}",
+            email=f"{user_id}@example.com",
+            country="GB",
+            product="premium",
+            followers={"href": None, "total": rng.randint(0, 500)},
+            images=images(rng, "ab6775700000ee85"),
+        )
+        self.playlists = []
+        for _ in range(PLAYLISTS_PER_USER):
+            self.playlists.append(
+                {
+                    "playlist": self._playlist(rng, title(rng)),
+                    "tracks": rng.sample(catalog.tracks, TRACKS_PER_PLAYLIST),
+                }
+            )
+
+    def _playlist(self, rng, name):
+        playlist = link("playlist", spotify_id(rng))
+        playlist.update(
+            collaborative=False,
+            description="",
+            images=images(rng, "ab67706c0000da84"),
+            name=name,
+            owner={
+                **link("user", self.user_id),
+                "display_name": self.profile["display_name"],
+            },
+            primary_color=None,
+            public=False,
+            snapshot_id=spotify_id(rng),
+        )
+        return playlist
+
+    def find_playlist(self, playlist_id):
+        for entry in self.playlists:
+            if entry["playlist"]["id"] == playlist_id:
+                return entry
+        return None
+
+
+class MockSpotify:
+    """Builds the ASGI app and keeps per-user state and call counters"""
+
+    def __init__(
+        self,
+        latency_ms=MOCK_SPOTIFY_LATENCY_MS,
+        jitter_ms=MOCK_SPOTIFY_JITTER_MS,
+        rate_429=MOCK_SPOTIFY_429_RATE,
+        retry_after=MOCK_SPOTIFY_RETRY_AFTER,
+        seed=MOCK_SPOTIFY_SEED,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.catalog = Catalog(seed)
+        self.users = {}
+        self.issued = 0
+        # "METHOD /path/template" -> count, plus 429s and 304s
+        self.calls = Counter()
+        self.app = self._build_app()
+
+    def user(self, user_id):
+        if user_id not in self.users:
+            self.users[user_id] = UserState(self.catalog, user_id)
+        return self.users[user_id]
+
+    async def _delay(self):
+        delay = self.latency_ms + self.rng.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+    def _throttled(self):
+        if self.rate_429 and self.rng.random() < self.rate_429:
+            self.calls["429"] += 1
+            return Response(
+                status_code=429, headers={"Retry-After": str(self.retry_after)}
+            )
+        return None
+
+    def _json(self, request, body, status_code=200):
+        content = orjson.dumps(body)
+        if request.method != "GET" or status_code != 200:
+            return Response(content, status_code, media_type="application/json")
+        etag = f'"{hashlib.blake2b(content, digest_size=8).hexdigest()}"'
+        if request.headers.get("if-none-match") == etag:
+            self.calls["304"] += 1
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(content, media_type="application/json", headers={"ETag": etag})
+
+    def _error(self, status_code, message):
+        body = {"error": {"status": status_code, "message": message}}
+        return Response(orjson.dumps(body), status_code, media_type="application/json")
+
+    def _bearer(self, request):
+        header = request.headers.get("authorization", "")
+        return header[7:] if header.startswith("Bearer ") else None
+
+    def _user_id(self, request):
+        # Access tokens are "mock-access.<user_id>.<n>", so no lookup is needed
+        parts = (self._bearer(request) or "").split(".")
+        if len(parts) == 3 and parts[0] == "mock-access":
+            return parts[1]
+        return None
+
+    def _issue(self, kind, subject):
+        self.issued += 1
+        return f"mock-{kind}.{subject}.{self.issued}"
+
+    def _page(self, request, items, offset, limit, total):
+        def page_url(page_offset):
+            params = {**request.query_params, "offset": page_offset, "limit": limit}
+            return f"{str(request.url).split('?')[0]}?{urlencode(params)}"
+
+        return {
+            "href": page_url(offset),
+            "items": items,
+            "limit": limit,
+            "next": page_url(offset + limit) if offset + limit < total else None,
+            "offset": offset,
+            "previous": page_url(max(offset - limit, 0)) if offset else None,
+            "total": total,
+        }
+
+    def _paged(self, request, items, default_limit=20, max_limit=50):
+        params = request.query_params
+        limit = min(int(params.get("limit", default_limit)), max_limit)
+        offset = int(params.get("offset", 0))
+        page = items[offset : offset + limit]
+        return self._page(request, page, offset, limit, len(items))
+
+    def _build_app(self):
+        app = FastAPI()
+        mock = self
+
+        @app.middleware("http")
+        async def upstream_behaviour(request: Request, call_next):
+            # /_stats and /_reset are for the benchmark, not part of the API
+            if request.url.path.startswith("/_"):
+                return await call_next(request)
+            await mock._delay()
+            # 429s are only injected on the Web API; the accounts service has
+            # its own, much higher, limits
+            throttled = request.url.path.startswith("/v1/") and mock._throttled()
+            if throttled:
+                return throttled
+            response = await call_next(request)
+            route = request.scope.get("route")
+            mock.calls[f"{request.method} {getattr(route, 'path', 'unmatched')}"] += 1
+            return response
+
+        @app.post("/api/token")
+        async def token(request: Request):
+            # Parsed by hand so the stand-in doesn't need python-multipart
+            form = dict(parse_qsl((await request.body()).decode()))
+            grant_type = form.get("grant_type")
+            if grant_type == "client_credentials":
+                body = {"access_token": mock._issue("service", "app")}
+            elif grant_type == "authorization_code":
+                # The code is the user ID, so a benchmark can log in anyone
+                user_id = form.get("code")
+                body = {
+                    "access_token": mock._issue("access", user_id),
+                    "refresh_token": f"mock-refresh.{user_id}",
+                }
+            elif grant_type == "refresh_token":
+                parts = str(form.get("refresh_token", "")).split(".")
+                if len(parts) != 2 or parts[0] != "mock-refresh":
+                    return mock._error(400, "invalid_grant")
+                body = {"access_token": mock._issue("access", parts[1])}
+            else:
+                return mock._error(400, "unsupported_grant_type")
+            body.update(token_type="Bearer", expires_in=3600)
+            return mock._json(request, body)
+
+        @app.get("/v1/me")
+        async def me(request: Request):
+            user_id = mock._user_id(request)
+            if not user_id:
+                return mock._error(401, "Invalid access token")
+            return mock._json(request, mock.user(user_id).profile)
+
+        @app.get("/v1/me/top/{kind}")
+        async def top(request: Request, kind: str, time_range: str = "medium_term"):
+            user_id = mock._user_id(request)
+            if not user_id:
+                return mock._error(401, "Invalid access token")
+            pool = mock.catalog.tracks if kind == "tracks" else mock.catalog.artists
+            items = mock.catalog.sample(
+                f"{user_id}:{kind}:{time_range}", TOP_ITEMS, pool
+            )
+            return mock._json(request, mock._paged(request, items))
+
+        @app.get("/v1/me/player/recently-played")
+        async def recently_played(request: Request, limit: int = 20):
+            user_id = mock._user_id(request)
+            if not user_id:
+                return mock._error(401, "Invalid access token")
+            tracks = mock.catalog.sample(
+                f"{user_id}:recent", RECENTLY_PLAYED, mock.catalog.tracks
+            )[: min(limit, 50)]
+            now = datetime.now(timezone.utc).replace(microsecond=0)
+            items = [
+                {
+                    "track": track,
+                    "played_at": (now - timedelta(minutes=4 * i))
+                    .isoformat()
+                    .replace("+00:00", "Z"),
+                    "context": None,
+                }
+                for i, track in enumerate(tracks)
+            ]
+            played = [item["played_at"] for item in items]
+            return mock._json(
+                request,
+                {
+                    "items": items,
+                    "next": None,
+                    "cursors": (
+                        {"after": played[0], "before": played[-1]} if items else None
+                    ),
+                    "limit": limit,
+                    "href": str(request.url),
+                },
+            )
+
+        @app.get("/v1/search")
+        async def search(request: Request, q: str, type: str = "track"):
+            if not mock._bearer(request):
+                return mock._error(401, "No token provided")
+            params = request.query_params
+            limit = min(int(params.get("limit", 20)), 50)
+            offset = int(params.get("offset", 0))
+            rng = random.Random(f"search:{q.lower()}")
+            start = rng.randrange(len(mock.catalog.tracks))
+            items = [
+                mock.catalog.tracks[(start + offset + i) % len(mock.catalog.tracks)]
+                for i in range(min(limit, max(SEARCH_TOTAL - offset, 0)))
+            ]
+            page = mock._page(request, items, offset, limit, SEARCH_TOTAL)
+            return mock._json(request, {"tracks": page})
+
+        @app.get("/v1/{kind}")
+        async def several(request: Request, kind: str, ids: str = ""):
+            if kind not in ("tracks", "artists"):
+                return mock._error(404, "Not found")
+            if not mock._bearer(request):
+                return mock._error(401, "No token provided")
+            objects = mock.catalog.by_id[kind]
+            found = [objects.get(id) for id in ids.split(",")[:50] if id]
+            return mock._json(request, {kind: found})
+
+        @app.get("/v1/me/playlists")
+        async def playlists(request: Request):
+            user_id = mock._user_id(request)
+            if not user_id:
+                return mock._error(401, "Invalid access token")
+            items = [
+                {
+                    **entry["playlist"],
+                    "tracks": {
+                        "href": f"{entry['playlist']['href']}/tracks",
+                        "total": len(entry["tracks"]),
+                    },
+                }
+                for entry in mock.user(user_id).playlists
+            ]
+            return mock._json(request, mock._paged(request, items))
+
+        @app.post("/v1/users/{owner_id}/playlists")
+        async def create_playlist(request: Request, owner_id: str):
+            user_id = mock._user_id(request)
+            if user_id != owner_id:
+                return mock._error(403, "Can't create playlists for another user")
+            body = orjson.loads(await request.body() or b"{}")
+            user = mock.user(user_id)
+            playlist = user._playlist(mock.rng, body.get("name", "New Playlist"))
+            user.playlists.insert(0, {"playlist": playlist, "tracks": []})
+            return mock._json(request, playlist, status_code=201)
+
+        @app.get("/v1/playlists/{playlist_id}/tracks")
+        async def playlist_tracks(request: Request, playlist_id: str):
+            user_id = mock._user_id(request)
+            if not user_id:
+                return mock._error(401, "Invalid access token")
+            entry = mock.user(user_id).find_playlist(playlist_id)
+            if entry is None:
+                return mock._error(404, "Not found")
+            owner = entry["playlist"]["owner"]
+            items = [
+                {
+                    "added_at": "2024-01-01T00:00:00Z",
+                    "added_by": {k: owner[k] for k in owner if k != "display_name"},
+                    "is_local": False,
+                    "primary_color": None,
+                    "track": track,
+                    "video_thumbnail": {"url": None},
+                }
+                for track in entry["tracks"]
+            ]
+            return mock._json(request, mock._paged(request, items, 100, 100))
+
+        @app.post("/v1/playlists/{playlist_id}/tracks")
+        async def add_tracks(request: Request, playlist_id: str):
+            user_id = mock._user_id(request)
+            if not user_id:
+                return mock._error(401, "Invalid access token")
+            entry = mock.user(user_id).find_playlist(playlist_id)
+            if entry is None:
+                return mock._error(404, "Not found")
+            uris = orjson.loads(await request.body() or b"{}").get("uris", [])
+            if len(uris) > 100:
+                return mock._error(400, "Too many tracks")
+            for uri in uris:
+                # Unknown URIs are accepted as bare tracks, like local files
+                track = mock.catalog.by_uri.get(uri) or {"uri": uri, "id": None}
+                entry["tracks"].append(track)
+            entry["playlist"]["snapshot_id"] = spotify_id(mock.rng)
+            return mock._json(
+                request, {"snapshot_id": entry["playlist"]["snapshot_id"]}, 201
+            )
+
+        @app.get("/_stats")
+        async def stats():
+            return dict(mock.calls)
+
+        @app.post("/_reset")
+        async def reset():
+            mock.calls.clear()
+            return {}
+
+        return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=MOCK_SPOTIFY_LATENCY_MS)
+    parser.add_argument("--jitter-ms", type=float, default=MOCK_SPOTIFY_JITTER_MS)
+    parser.add_argument("--rate-429", type=float, default=MOCK_SPOTIFY_429_RATE)
+    args = parser.parse_args()
+    mock = MockSpotify(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, rate_429=args.rate_429
+    )
+    uvicorn.run(mock.app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,231 @@
+"""Benchmark main.py against the offline Spotify stand-in
+
+Starts bench/MockSpotify.py and main.py (with the in-memory cache and no
+MongoDB) as local servers, logs in --users users through /auth/callback,
+then drives each scenario at --concurrency and reports throughput and
+p50/p95/p99 per endpoint, keeping the median of --repeat runs. Results are
+compared with bench/baseline.json and the exit status is 1 on a regression,
+so it can gate CI:
+
+    python bench/run_benchmark.py                  # run and compare
+    python bench/run_benchmark.py --save-baseline  # accept the new numbers
+    python bench/run_benchmark.py --target http://127.0.0.1:8080 \\
+        --mock-url http://127.0.0.1:8090           # use servers already running
+
+Run it from backend/.
+"""
+
+from urllib.parse import parse_qs, urlparse
+import argparse
+import asyncio
+import httpx
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from Benchmark import SCENARIOS, compare, format_table, median_run, run_scenario
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def app_env(mock_url):
+    """Environment that points main.py at the stand-in and keeps it offline"""
+    return {
+        **os.environ,
+        "SPOTIFY_API_URL": f"{mock_url}/v1",
+        "SPOTIFY_ACCOUNTS_URL": mock_url,
+        "SPOT_CLIENT_ID": "bench",
+        "SPOT_CLIENT_SEC": "bench",
+        "CACHE_BACKEND": "memory",
+        # Empty rather than unset, so a local .env can't switch MongoDB on
+        "DB_URI": "",
+        "HISTORY_DB_PATH": ":memory:",
+        "ANALYTICS_DB_PATH": ":memory:",
+    }
+
+
+def start_server(args, env=None):
+    return subprocess.Popen(
+        [sys.executable, *args], cwd=BACKEND_DIR, env=env or os.environ.copy()
+    )
+
+
+async def wait_until_ready(client, url, timeout=30):
+    give_up_at = time.monotonic() + timeout
+    while time.monotonic() < give_up_at:
+        try:
+            await client.get(url)
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def log_in(client, app_url, user_id):
+    """Go through the OAuth callback; the stand-in treats the code as user_id"""
+    response = await client.get(f"{app_url}/auth/callback", params={"code": user_id})
+    query = parse_qs(urlparse(response.headers.get("location", "")).query)
+    if "access_token" not in query:
+        raise RuntimeError(f"Login failed for {user_id}: {response.status_code}")
+    return query["access_token"][0]
+
+
+async def run(args):
+    servers = []
+    mock_url = args.mock_url
+    app_url = args.target
+    if not mock_url:
+        port = free_port()
+        mock_url = f"http://127.0.0.1:{port}"
+        servers.append(
+            start_server(
+                [
+                    os.path.join(BENCH_DIR, "MockSpotify.py"),
+                    f"--port={port}",
+                    f"--latency-ms={args.latency_ms}",
+                    f"--jitter-ms={args.jitter_ms}",
+                    f"--rate-429={args.rate_429}",
+                ]
+            )
+        )
+    if not app_url:
+        port = free_port()
+        app_url = f"http://127.0.0.1:{port}"
+        servers.append(
+            start_server(
+                ["-m", "uvicorn", "main:app", f"--port={port}", "--log-level=warning"],
+                env=app_env(mock_url),
+            )
+        )
+
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    try:
+        async with httpx.AsyncClient(
+            base_url=app_url, limits=limits, timeout=60
+        ) as client:
+            await wait_until_ready(client, f"{mock_url}/_stats")
+            await wait_until_ready(client, f"{app_url}/metrics")
+            tokens = await asyncio.gather(
+                *(log_in(client, app_url, f"bench{i}") for i in range(args.users))
+            )
+
+            results = {}
+            for name, method, path in SCENARIOS:
+                if args.scenarios and name not in args.scenarios:
+                    continue
+                # Warm-up isn't measured: the first call per user fills caches
+                await run_scenario(
+                    client, method, path, tokens, args.users, args.concurrency
+                )
+                runs = []
+                for _ in range(args.repeat):
+                    await client.post(f"{mock_url}/_reset")
+                    stats = await run_scenario(
+                        client, method, path, tokens, args.requests, args.concurrency
+                    )
+                    upstream = (await client.get(f"{mock_url}/_stats")).json()
+                    stats["upstream_calls"] = sum(
+                        count
+                        for key, count in upstream.items()
+                        if key not in ("304", "429")
+                    )
+                    runs.append(stats)
+                stats = results[name] = median_run(runs)
+                print(
+                    f"{name}: {stats['throughput_rps']} req/s, "
+                    f"p95 {stats['p95_ms']}ms",
+                    flush=True,
+                )
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the API against an offline Spotify stand-in"
+    )
+    parser.add_argument("--requests", type=int, default=300, help="per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument(
+        "--repeat", type=int, default=3, help="runs per scenario; the median is kept"
+    )
+    parser.add_argument(
+        "--scenarios", type=lambda value: value.split(","), help="comma separated"
+    )
+    parser.add_argument("--latency-ms", type=float, default=40)
+    parser.add_argument("--jitter-ms", type=float, default=20)
+    parser.add_argument("--rate-429", type=float, default=0)
+    parser.add_argument("--target", help="benchmark an app that is already running")
+    parser.add_argument("--mock-url", help="use a stand-in that is already running")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance", type=float, default=0.35, help="allowed regression fraction"
+    )
+    parser.add_argument("--output", help="also write the results as JSON here")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print()
+    print(format_table(results))
+
+    report = {
+        "config": {
+            key: getattr(args, key)
+            for key in (
+                "requests",
+                "concurrency",
+                "users",
+                "repeat",
+                "latency_ms",
+                "jitter_ms",
+                "rate_429",
+            )
+        },
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("\nNo baseline to compare with; run with --save-baseline")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["config"] != report["config"]:
+        print(f"\nWarning: baseline was recorded with {baseline['config']}")
+    regressions = compare(results, baseline["scenarios"], args.tolerance)
+    if regressions:
+        print("\nRegressions against baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nNo regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
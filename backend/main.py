@@ -1,17 +1,90 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import RedirectResponse
+from fastapi.responses import (
+    ORJSONResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field
+from typing import List
 import uvicorn
-from src.RedisCache import RedisCache
-from src.SpotifyClient import SpotifyClient
+import asyncio
+import orjson
+import os
+from src.CacheBackend import create_cache_backend
+from src.TieredCache import TieredCache
+from src.SpotifyClient import SpotifyClient, SpotifyPageError
 from src.AuthManager import AuthManager
+from src.TokenRenewer import TokenRenewer
+from src.ResponseCache import ResponseCache
+from src.ListeningHistory import ListeningHistory, RECENTLY_PLAYED_PAGE_SIZE
+from src.ListeningAnalytics import ListeningAnalytics
+from src.CompressionMiddleware import CompressionMiddleware
+from src.ETagMiddleware import ETagMiddleware
+from src.MongoClient import MongoDBClient, MONGO_ENABLED
+from src.WriteBehindTokenStore import WriteBehindTokenStore
+from src.Metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from src.MetricsMiddleware import MetricsMiddleware
+from src.Tracing import TRACING_ENABLED
+from src.TracingMiddleware import TracingMiddleware
+
+# Search results are shared across users, so give them their own bound
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "50000"))
 
 # App setup
-app = FastAPI()
-access_cache = RedisCache()
-spotify_client = SpotifyClient(access_cache)
-auth_manager = AuthManager(access_cache)
+access_cache = TieredCache(create_cache_backend())
+token_renewer = TokenRenewer()
+spotify_client = SpotifyClient(
+    access_cache,
+    renewer=token_renewer,
+    response_cache=ResponseCache(),
+    search_cache=ResponseCache(max_entries=SEARCH_CACHE_MAX_ENTRIES),
+)
+listening_history = ListeningHistory()
+listening_analytics = ListeningAnalytics()
+session_store = MongoDBClient() if MONGO_ENABLED else None
+# Durable copy of user tokens, so losing the cache doesn't log everyone out
+token_store = WriteBehindTokenStore(session_store) if session_store else None
+auth_manager = AuthManager(
+    access_cache,
+    http_client=spotify_client.http,
+    renewer=token_renewer,
+    token_store=token_store,
+)
+
+# Counters the components already keep, exported as gauges on /metrics
+REGISTRY.register_stats("token_cache", access_cache.stats)
+REGISTRY.register_stats("response_cache", spotify_client.response_cache.stats)
+REGISTRY.register_stats("search_cache", spotify_client.search_cache.stats)
+REGISTRY.register_stats("metadata_store", spotify_client.metadata.stats)
+REGISTRY.register_stats("spotify_scheduler", spotify_client.scheduler.stats)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    token_renewer.start()
+    if session_store:
+        await session_store.ensure_indexes()
+    if token_store:
+        token_store.start()
+    yield
+    await token_renewer.stop()
+    # Write out buffered tokens while the database is still connected
+    if token_store:
+        await token_store.stop()
+    # Release pooled upstream connections on shutdown
+    await spotify_client.aclose()
+    await access_cache.close()
+    listening_history.close()
+    listening_analytics.close()
+    if session_store:
+        await session_store.close()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Security scheme
 security = HTTPBearer()
@@ -26,7 +99,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
+# ETags are computed on the uncompressed body, so compression wraps them
+app.add_middleware(ETagMiddleware)
+app.add_middleware(CompressionMiddleware)
+# Outermost, so request timings include compression
+app.add_middleware(MetricsMiddleware)
+if TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
+
+def json_bytes_response(body):
+    """Respond with JSON that is already encoded (e.g. from the response cache)"""
+    return Response(content=body, media_type="application/json")
 
 
 # Dependency to verify user token
@@ -34,7 +120,7 @@ async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
 ):
     token = credentials.credentials
-    user_id = auth_manager.verify_user_token(token)
+    user_id = await auth_manager.verify_user_token(token)
     if not user_id:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token"
@@ -53,7 +139,7 @@ async def login():
 @app.get("/auth/logout")
 async def logout(user_id: str = Depends(get_current_user)):
     """Logout user by deleting their tokens"""
-    auth_manager.delete_user_tokens(user_id)
+    await auth_manager.delete_user_tokens(user_id)
     return {"detail": "Logged out successfully"}
 
 
@@ -63,20 +149,20 @@ async def callback(code: str):
     import json
     import urllib.parse
 
-    tokens = auth_manager.exchange_code_for_tokens(code)
+    tokens = await auth_manager.exchange_code_for_tokens(code)
     if not tokens:
         # Redirect to frontend with error
         return RedirectResponse(url="http://localhost:3000?error=auth_failed")
 
     # Get user profile to identify the user
-    profile = spotify_client.fetch_user_profile(tokens["access_token"])
+    profile = await spotify_client.fetch_user_profile(tokens["access_token"])
     if not profile:
         return RedirectResponse(url="http://localhost:3000?error=profile_failed")
 
     user_id = profile["id"]
 
     # Store tokens for this user
-    auth_manager.store_user_tokens(user_id, tokens)
+    await auth_manager.store_user_tokens(user_id, tokens)
 
     # Redirect to frontend callback with tokens (use json.dumps for proper JSON)
     user_json = urllib.parse.quote(json.dumps(profile))
@@ -88,20 +174,22 @@ async def callback(code: str):
 async def get_spotify_profile(user_id: str = Depends(get_current_user)):
     """Get current user's Spotify profile (requires authentication)"""
     # Get user's access token
-    user_token = auth_manager.get_user_access_token(user_id)
+    user_token = await auth_manager.get_user_access_token(user_id)
     if not user_token:
         raise HTTPException(status_code=401, detail="No valid token found")
 
-    profile = spotify_client.fetch_user_profile(user_token)
+    profile = await spotify_client.fetch_user_profile(
+        user_token, user_id=user_id, encoded=True
+    )
     if profile:
-        return profile
+        return json_bytes_response(profile)
     raise HTTPException(status_code=500, detail="Unable to fetch Spotify profile")
 
 
 @app.get("/auth/refresh")
 async def refresh_token(user_id: str = Depends(get_current_user)):
     """Refresh user's access token"""
-    new_tokens = auth_manager.refresh_user_token(user_id)
+    new_tokens = await auth_manager.refresh_user_token(user_id)
     if not new_tokens:
         raise HTTPException(status_code=401, detail="Failed to refresh token")
     return {"access_token": new_tokens["access_token"]}
@@ -114,13 +202,15 @@ async def get_top_tracks(
     limit: int = 10,
 ):
     """Get user's top tracks (time_range: short_term, medium_term, long_term)"""
-    user_token = auth_manager.get_user_access_token(user_id)
+    user_token = await auth_manager.get_user_access_token(user_id)
     if not user_token:
         raise HTTPException(status_code=401, detail="No valid token found")
 
-    tracks = spotify_client.fetch_top_tracks(user_token, time_range, limit)
+    tracks = await spotify_client.fetch_top_tracks(
+        user_token, time_range, limit, user_id=user_id, encoded=True
+    )
     if tracks:
-        return tracks
+        return json_bytes_response(tracks)
     raise HTTPException(status_code=500, detail="Unable to fetch top tracks")
 
 
@@ -131,26 +221,64 @@ async def get_top_artists(
     limit: int = 10,
 ):
     """Get user's top artists (time_range: short_term, medium_term, long_term)"""
-    user_token = auth_manager.get_user_access_token(user_id)
+    user_token = await auth_manager.get_user_access_token(user_id)
     if not user_token:
         raise HTTPException(status_code=401, detail="No valid token found")
 
-    artists = spotify_client.fetch_top_artists(user_token, time_range, limit)
+    artists = await spotify_client.fetch_top_artists(
+        user_token, time_range, limit, user_id=user_id, encoded=True
+    )
     if artists:
-        return artists
+        return json_bytes_response(artists)
     raise HTTPException(status_code=500, detail="Unable to fetch top artists")
 
 
+@app.get("/spotify/dashboard")
+async def get_dashboard(
+    user_id: str = Depends(get_current_user),
+    time_range: str = "short_term",
+    limit: int = 10,
+):
+    """Get profile, top tracks and top artists in one call, fetched concurrently"""
+    user_token = await auth_manager.get_user_access_token(user_id)
+    if not user_token:
+        raise HTTPException(status_code=401, detail="No valid token found")
+
+    sections = {
+        "profile": spotify_client.fetch_user_profile(
+            user_token, user_id=user_id, encoded=True
+        ),
+        "top_tracks": spotify_client.fetch_top_tracks(
+            user_token, time_range, limit, user_id=user_id, encoded=True
+        ),
+        "top_artists": spotify_client.fetch_top_artists(
+            user_token, time_range, limit, user_id=user_id, encoded=True
+        ),
+    }
+    results = await asyncio.gather(*sections.values(), return_exceptions=True)
+
+    # Report failures per section so one slow or broken call doesn't sink the page.
+    # Sections arrive pre-encoded, so splice them in rather than re-encoding.
+    parts = []
+    for name, result in zip(sections, results):
+        if result is None or isinstance(result, Exception):
+            section = orjson.dumps({"data": None, "error": f"Unable to fetch {name}"})
+        else:
+            section = b'{"data":' + result + b',"error":null}'
+        parts.append(orjson.dumps(name) + b":" + section)
+    return json_bytes_response(b"{" + b",".join(parts) + b"}")
+
+
 @app.get("/spotify/recently-played")
 async def get_recently_played(
     user_id: str = Depends(get_current_user), limit: int = 20
 ):
     """Get user's recently played tracks"""
-    user_token = auth_manager.get_user_access_token(user_id)
+    user_token = await auth_manager.get_user_access_token(user_id)
     if not user_token:
         raise HTTPException(status_code=401, detail="No valid token found")
 
-    tracks = spotify_client.fetch_recently_played(user_token, limit)
+    tracks = await spotify_client.fetch_recently_played(user_token, limit)
     if tracks:
         return tracks
     raise HTTPException(
@@ -158,15 +286,119 @@ async def get_recently_played(
     )
 
 
+async def sync_listening_history(user_id, user_token):
+    """Pull only the plays we haven't stored yet into the user's history"""
+    return await listening_history.sync(
+        user_id,
+        lambda after: spotify_client.fetch_recently_played(
+            user_token, RECENTLY_PLAYED_PAGE_SIZE, after=after
+        ),
+        # Fold just the new plays into the precomputed analytics, under the
+        # same per-user lock, so no play is counted twice
+        lambda new_plays: listening_analytics.apply_plays(user_id, new_plays),
+    )
+
+
+async def refresh_analytics(user_id, user_token):
+    """Bring a user's analytics up to date with new plays and top lists"""
+    async with listening_history.user_lock(user_id):
+        if await listening_analytics.get_summary(user_id) is None:
+            # First run: seed from whatever history is already stored
+            plays = await listening_history.get_compact_plays(user_id)
+            await listening_analytics.apply_plays(user_id, plays)
+    await sync_listening_history(user_id, user_token)
+    top_artists, top_tracks = await asyncio.gather(
+        spotify_client.fetch_top_artists(
+            user_token, "medium_term", 50, user_id=user_id
+        ),
+        spotify_client.fetch_top_tracks(user_token, "medium_term", 50, user_id=user_id),
+    )
+    return await listening_analytics.apply_top_lists(user_id, top_artists, top_tracks)
+
+
+@app.post("/spotify/history/sync")
+async def sync_history(user_id: str = Depends(get_current_user)):
+    """Append new recently-played tracks to the user's listening history"""
+    user_token = await auth_manager.get_user_access_token(user_id)
+    if not user_token:
+        raise HTTPException(status_code=401, detail="No valid token found")
+
+    new_plays = await sync_listening_history(user_id, user_token)
+    if new_plays is None:
+        raise HTTPException(status_code=500, detail="Unable to sync listening history")
+    return {"new_plays": len(new_plays)}
+
+
+@app.get("/spotify/history")
+async def get_history(
+    user_id: str = Depends(get_current_user),
+    since: int = None,
+    limit: int = 200,
+    sync: bool = True,
+    hydrate: bool = False,
+):
+    """Get the user's stored listening history (since: epoch ms), newest first
+
+    With hydrate=true each play also carries its full track object.
+    """
+    if sync:
+        user_token = await auth_manager.get_user_access_token(user_id)
+        if user_token:
+            # Best effort: serve what we have even if Spotify is unreachable
+            await sync_listening_history(user_id, user_token)
+
+    plays = await listening_history.get_plays(user_id, since=since, limit=limit)
+    if hydrate:
+        # Only IDs are stored; repeats and known tracks cost no upstream calls
+        tracks = await spotify_client.get_tracks([play["track_id"] for play in plays])
+        for play, track in zip(plays, tracks):
+            play["track"] = track
+    return {"items": plays}
+
+
+@app.get("/spotify/analytics")
+async def get_analytics(user_id: str = Depends(get_current_user)):
+    """Get the user's precomputed listening analytics"""
+    summary = await listening_analytics.get_summary(user_id)
+    if summary is not None:
+        return summary
+
+    user_token = await auth_manager.get_user_access_token(user_id)
+    if not user_token:
+        raise HTTPException(status_code=401, detail="No valid token found")
+    return await refresh_analytics(user_id, user_token)
+
+
+@app.post("/spotify/analytics/refresh")
+async def refresh_analytics_route(user_id: str = Depends(get_current_user)):
+    """Recompute genre/artist affinity and fold in any new plays"""
+    user_token = await auth_manager.get_user_access_token(user_id)
+    if not user_token:
+        raise HTTPException(status_code=401, detail="No valid token found")
+    return await refresh_analytics(user_id, user_token)
+
+
 @app.get("/spotify/search")
 async def search_tracks(query: str, limit: int = 5):
     """Search for tracks (no user auth needed)"""
-    results = spotify_client.search_tracks(query, limit)
+    results = await spotify_client.search_tracks(query, limit, encoded=True)
     if results:
-        return results
+        return json_bytes_response(results)
     raise HTTPException(status_code=500, detail="Unable to search tracks")
 
 
+@app.get("/spotify/search/cache-stats")
+async def search_cache_stats():
+    """Hit/miss counters for the shared search cache"""
+    return spotify_client.search_cache.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/auth/me")
 async def get_current_user_info(user_id: str = Depends(get_current_user)):
     """Get current authenticated user ID"""
@@ -177,16 +409,88 @@ async def get_current_user_info(user_id: str = Depends(get_current_user)):
 @app.get("/spotify/playlists")
 async def get_user_playlists(user_id: str = Depends(get_current_user), limit: int = 20):
     """Get user's playlists"""
-    user_token = auth_manager.get_user_access_token(user_id)
+    user_token = await auth_manager.get_user_access_token(user_id)
     if not user_token:
         raise HTTPException(status_code=401, detail="No valid token found")
 
-    playlists = spotify_client.fetch_user_playlists(user_token, limit)
+    playlists = await spotify_client.fetch_user_playlists(
+        user_token, limit, user_id=user_id, encoded=True
+    )
     if playlists:
-        return playlists
+        return json_bytes_response(playlists)
     raise HTTPException(status_code=500, detail="Unable to fetch playlists")
 
 
+class NDJSONResponse(StreamingResponse):
+    """Streams NDJSON and closes the page source however the response ends
+
+    The body generator only runs its own cleanup once it has been iterated,
+    so a client that disconnects before the first chunk would otherwise
+    leave the page generator and its prefetch task open.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def __init__(self, content, pages):
+        super().__init__(content)
+        self.pages = pages
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.pages.aclose()
+
+
+async def ndjson_response(pages, what):
+    """Stream pages of items as NDJSON, one item per line
+
+    The first page is fetched before responding so an upstream failure can
+    still become a 500; later failures end the stream with an error line.
+    """
+    try:
+        first_page = await anext(pages, [])
+    except SpotifyPageError:
+        raise HTTPException(status_code=500, detail=f"Unable to fetch {what}")
+
+    async def stream():
+        try:
+            yield b"".join(orjson.dumps(item) + b"\n" for item in first_page)
+            async for items in pages:
+                yield b"".join(orjson.dumps(item) + b"\n" for item in items)
+        except SpotifyPageError as e:
+            yield orjson.dumps({"error": str(e)}) + b"\n"
+
+    return NDJSONResponse(stream(), pages)
+
+
+@app.get("/spotify/playlists/export")
+async def export_user_playlists(user_id: str = Depends(get_current_user)):
+    """Stream every one of the user's playlists as NDJSON"""
+    user_token = await auth_manager.get_user_access_token(user_id)
+    if not user_token:
+        raise HTTPException(status_code=401, detail="No valid token found")
+
+    return await ndjson_response(
+        spotify_client.iter_user_playlists(user_token), "playlists"
+    )
+
+
+@app.get("/spotify/playlists/{playlist_id}/tracks/export")
+async def export_playlist_tracks(
+    playlist_id: str, user_id: str = Depends(get_current_user)
+):
+    """Stream every track in a playlist as NDJSON"""
+    user_token = await auth_manager.get_user_access_token(user_id)
+    if not user_token:
+        raise HTTPException(status_code=401, detail="No valid token found")
+
+    return await ndjson_response(
+        spotify_client.iter_playlist_tracks(user_token, playlist_id),
+        "playlist tracks",
+    )
+
+
 @app.post("/spotify/playlists/add-track")
 async def add_track_to_playlist(
     playlist_name: str,
@@ -194,7 +498,7 @@ async def add_track_to_playlist(
     user_id: str = Depends(get_current_user),
 ):
     """Add track to user's playlist (create if doesn't exist)"""
-    user_token = auth_manager.get_user_access_token(user_id)
+    user_token = await auth_manager.get_user_access_token(user_id)
     if not user_token:
         raise HTTPException(status_code=401, detail="No valid token found")
 
@@ -203,11 +507,47 @@ async def add_track_to_playlist(
         # If it's just an ID, convert it
         track_uri = f"spotify:track:{track_uri}"
 
-    success = spotify_client.add_track_to_playlist(user_token, playlist_name, track_uri)
+    success = await spotify_client.add_track_to_playlist(
+        user_token, playlist_name, track_uri, user_id=user_id
+    )
     if success:
         return {"detail": "Track added to playlist successfully"}
     raise HTTPException(status_code=500, detail="Unable to add track to playlist")
 
 
+class AddTracksRequest(BaseModel):
+    playlist_name: str
+    track_uris: List[str] = Field(min_length=1, max_length=10000)
+
+
+@app.post("/spotify/playlists/add-tracks")
+async def add_tracks_to_playlist(
+    request: AddTracksRequest,
+    user_id: str = Depends(get_current_user),
+):
+    """Add many tracks to user's playlist (create if doesn't exist)"""
+    user_token = await auth_manager.get_user_access_token(user_id)
+    if not user_token:
+        raise HTTPException(status_code=401, detail="No valid token found")
+
+    # Accept bare track IDs as well as full URIs
+    track_uris = [
+        uri if uri.startswith("spotify:track:") else f"spotify:track:{uri}"
+        for uri in request.track_uris
+    ]
+
+    results = await spotify_client.add_tracks_to_playlist(
+        user_token, request.playlist_name, track_uris, user_id=user_id
+    )
+    statuses = list(results.values())
+    return {
+        "playlist_name": request.playlist_name,
+        "added": statuses.count("added"),
+        "duplicates": statuses.count("duplicate"),
+        "failed": statuses.count("failed"),
+        "results": results,
+    }
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8080, reload=True)
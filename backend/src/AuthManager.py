@@ -1,16 +1,30 @@
 import os
-import requests
+import httpx
 from urllib.parse import urlencode
 from dotenv import load_dotenv
 import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from src.SingleFlight import SingleFlight
+from src.Metrics import TOKEN_REFRESH_DURATION
+from src.Tracing import traced
 
 load_dotenv()
 
 SPOTIFY_CLIENT_ID = os.getenv("SPOT_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOT_CLIENT_SEC")
 REDIRECT_URI = os.getenv("REDIRECT_URI", "http://localhost:8080/auth/callback")
-SPOTIFY_AUTH_URL = "https://accounts.spotify.com/authorize"
-SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+# Overridable so the app can run against a local stand-in (see bench/)
+SPOTIFY_ACCOUNTS_URL = os.getenv("SPOTIFY_ACCOUNTS_URL", "https://accounts.spotify.com")
+SPOTIFY_AUTH_URL = f"{SPOTIFY_ACCOUNTS_URL}/authorize"
+SPOTIFY_TOKEN_URL = f"{SPOTIFY_ACCOUNTS_URL}/api/token"
+
+# Access tokens live ~1 hour, cache them a minute less for safety
+ACCESS_TOKEN_TTL = 3540
+# Refresh tokens don't expire, but keep them for 30 days for cleanup
+REFRESH_TOKEN_TTL = 2592000
+# Remember bearer tokens the durable store doesn't know, so repeats skip Mongo
+UNKNOWN_TOKEN_TTL = 30
 
 # Scopes needed for user data
 SCOPES = [
@@ -25,8 +39,17 @@ SCOPES = [
 
 
 class AuthManager:
-    def __init__(self, cache):
+    def __init__(self, cache, http_client=None, renewer=None, token_store=None):
         self.cache = cache
+        # Optional TokenRenewer that refreshes active users before expiry
+        self.renewer = renewer
+        # Optional WriteBehindTokenStore that refills the cache after a miss
+        self.token_store = token_store
+        self.http = http_client or httpx.AsyncClient()
+        # Concurrent refreshes for the same user share one token request
+        self.refresh_flight = SingleFlight()
+        # Concurrent misses for the same user or token share one lookup
+        self.rehydrate_flight = SingleFlight()
 
     def get_authorization_url(self):
         """Generate Spotify authorization URL"""
@@ -39,7 +62,7 @@ class AuthManager:
         }
         return f"{SPOTIFY_AUTH_URL}?{urlencode(params)}"
 
-    def exchange_code_for_tokens(self, code):
+    async def exchange_code_for_tokens(self, code):
         """Exchange authorization code for access and refresh tokens"""
         data = {
             "grant_type": "authorization_code",
@@ -50,7 +73,7 @@ class AuthManager:
         }
 
         try:
-            response = requests.post(SPOTIFY_TOKEN_URL, data=data)
+            response = await self.http.post(SPOTIFY_TOKEN_URL, data=data)
             if response.status_code == 200:
                 return response.json()
             else:
@@ -62,9 +85,26 @@ class AuthManager:
             print(f"Error exchanging code: {e}")
             return None
 
-    def refresh_user_token(self, user_id):
+    async def refresh_user_token(self, user_id):
         """Refresh a user's access token using their refresh token"""
-        refresh_token = self.cache.get(f"user:{user_id}:refresh_token")
+        return await self.refresh_flight.do(
+            user_id, lambda: self._timed_refresh(user_id)
+        )
+
+    @traced("auth.refresh")
+    async def _timed_refresh(self, user_id):
+        start = time.perf_counter()
+        tokens = await self._refresh_user_token(user_id)
+        TOKEN_REFRESH_DURATION.observe(
+            time.perf_counter() - start, "user", "ok" if tokens else "error"
+        )
+        return tokens
+
+    async def _refresh_user_token(self, user_id):
+        refresh_token = await self.cache.get(f"user:{user_id}:refresh_token")
+        if not refresh_token:
+            token_doc = await self._load_user_tokens(user_id)
+            refresh_token = token_doc["refresh_token"] if token_doc else None
         if not refresh_token:
             return None
 
@@ -76,13 +116,26 @@ class AuthManager:
         }
 
         try:
-            response = requests.post(SPOTIFY_TOKEN_URL, data=data)
+            response = await self.http.post(SPOTIFY_TOKEN_URL, data=data)
             if response.status_code == 200:
                 tokens = response.json()
-                # Store new access token
-                self.cache.set(
-                    f"user:{user_id}:access_token", tokens["access_token"], ex=3540
+                # Store the new access token and map it back to the user, so
+                # it verifies like the one handed out at login
+                values = {
+                    f"user:{user_id}:access_token": tokens["access_token"],
+                    f"token:{tokens['access_token']}": user_id,
+                }
+                ttls = dict.fromkeys(values, ACCESS_TOKEN_TTL)
+                # Spotify may rotate the refresh token as well
+                if tokens.get("refresh_token"):
+                    refresh_token = tokens["refresh_token"]
+                    values[f"user:{user_id}:refresh_token"] = refresh_token
+                    ttls[f"user:{user_id}:refresh_token"] = REFRESH_TOKEN_TTL
+                await self.cache.mset(values, ex=ttls)
+                self._persist_user_tokens(
+                    user_id, tokens["access_token"], refresh_token
                 )
+                self._schedule_renewal(user_id)
                 return tokens
             else:
                 print(
@@ -93,39 +146,131 @@ class AuthManager:
             print(f"Error refreshing token: {e}")
             return None
 
-    def store_user_tokens(self, user_id, tokens):
+    async def store_user_tokens(self, user_id, tokens):
         """Store user's access and refresh tokens in cache"""
-        # Store access token (expires in ~1 hour)
-        self.cache.set(f"user:{user_id}:access_token", tokens["access_token"], ex=3540)
-        # Store refresh token (doesn't expire, but store for 30 days for cleanup)
-        self.cache.set(
-            f"user:{user_id}:refresh_token", tokens["refresh_token"], ex=2592000
-        )
+        access_key = f"user:{user_id}:access_token"
+        refresh_key = f"user:{user_id}:refresh_token"
         # Also map the access token to user_id for verification
-        self.cache.set(f"token:{tokens['access_token']}", user_id, ex=3540)
+        token_key = f"token:{tokens['access_token']}"
+        await self.cache.mset(
+            {
+                access_key: tokens["access_token"],
+                refresh_key: tokens["refresh_token"],
+                token_key: user_id,
+            },
+            ex={
+                access_key: ACCESS_TOKEN_TTL,
+                refresh_key: REFRESH_TOKEN_TTL,
+                token_key: ACCESS_TOKEN_TTL,
+            },
+        )
+        self._persist_user_tokens(
+            user_id, tokens["access_token"], tokens["refresh_token"]
+        )
+        self._schedule_renewal(user_id)
+
+    def _schedule_renewal(self, user_id, ttl=ACCESS_TOKEN_TTL):
+        if self.renewer:
+            self.renewer.schedule(
+                f"user:{user_id}",
+                ttl,
+                lambda: self.refresh_user_token(user_id),
+            )
+
+    def _persist_user_tokens(self, user_id, access_token, refresh_token):
+        """Queue a durable copy of the tokens; the write happens in the background"""
+        if self.token_store:
+            now = datetime.now(timezone.utc)
+            self.token_store.put(
+                user_id,
+                {
+                    "access_token": access_token,
+                    "access_expires_at": now + timedelta(seconds=ACCESS_TOKEN_TTL),
+                    "refresh_token": refresh_token,
+                    "expires_at": now + timedelta(seconds=REFRESH_TOKEN_TTL),
+                },
+            )
 
-    def get_user_access_token(self, user_id):
+    async def _rehydrate(self, token_doc):
+        """Copy a durable token doc back into the cache with its remaining TTLs"""
+        user_id = token_doc["user_id"]
+        now = datetime.now(timezone.utc)
+        refresh_key = f"user:{user_id}:refresh_token"
+        values = {refresh_key: token_doc["refresh_token"]}
+        ttls = {
+            refresh_key: max(int((token_doc["expires_at"] - now).total_seconds()), 1)
+        }
+        access_ttl = int((token_doc["access_expires_at"] - now).total_seconds())
+        if access_ttl > 0:
+            access_token = token_doc["access_token"]
+            values[f"user:{user_id}:access_token"] = access_token
+            values[f"token:{access_token}"] = user_id
+            ttls[f"user:{user_id}:access_token"] = access_ttl
+            ttls[f"token:{access_token}"] = access_ttl
+            self._schedule_renewal(user_id, access_ttl)
+        await self.cache.mset(values, ex=ttls)
+
+    @traced("auth.rehydrate")
+    async def _load_user_tokens(self, user_id):
+        """Refill the cache with user_id's durable tokens, returning them"""
+        if not self.token_store:
+            return None
+
+        async def load():
+            token_doc = await self.token_store.get(user_id)
+            if token_doc:
+                await self._rehydrate(token_doc)
+            return token_doc
+
+        return await self.rehydrate_flight.do(f"user:{user_id}", load)
+
+    @traced("auth.access_token")
+    async def get_user_access_token(self, user_id):
         """Get user's current access token, refresh if needed"""
-        access_token = self.cache.get(f"user:{user_id}:access_token")
+        if self.renewer:
+            self.renewer.touch(f"user:{user_id}")
+        access_token = await self.cache.get(f"user:{user_id}:access_token")
         if access_token:
             return access_token
 
+        # The cache may have lost a token that is still valid
+        token_doc = await self._load_user_tokens(user_id)
+        if token_doc and token_doc["access_expires_at"] > datetime.now(timezone.utc):
+            return token_doc["access_token"]
+
         # Try to refresh if no valid access token
-        tokens = self.refresh_user_token(user_id)
+        tokens = await self.refresh_user_token(user_id)
         if tokens:
             return tokens["access_token"]
 
         return None
 
-    def verify_user_token(self, token):
+    @traced("auth.verify")
+    async def verify_user_token(self, token):
         """Verify a token and return the associated user_id"""
-        user_id = self.cache.get(f"token:{token}")
-        return user_id
+        user_id = await self.cache.get(f"token:{token}")
+        if user_id is not None or not self.token_store:
+            # An empty value marks a token the durable store didn't know either
+            return user_id or None
+
+        async def load():
+            token_doc = await self.token_store.find_by_access_token(token)
+            if token_doc:
+                await self._rehydrate(token_doc)
+                return token_doc["user_id"]
+            await self.cache.set(f"token:{token}", "", ex=UNKNOWN_TOKEN_TTL)
+            return None
+
+        return await self.rehydrate_flight.do(f"token:{token}", load)
 
-    def delete_user_tokens(self, user_id):
-        """Delete user's tokens from cache (logout)"""
-        access_token = self.cache.get(f"user:{user_id}:access_token")
+    async def delete_user_tokens(self, user_id):
+        """Delete user's tokens from cache and the durable store (logout)"""
+        if self.renewer:
+            self.renewer.cancel(f"user:{user_id}")
+        if self.token_store:
+            self.token_store.remove(user_id)
+        keys = [f"user:{user_id}:access_token", f"user:{user_id}:refresh_token"]
+        access_token = await self.cache.get(keys[0])
         if access_token:
-            self.cache.delete(f"token:{access_token}")
-        self.cache.delete(f"user:{user_id}:access_token")
-        self.cache.delete(f"user:{user_id}:refresh_token")
+            keys.append(f"token:{access_token}")
+        await self.cache.delete_many(keys)
@@ -0,0 +1,86 @@
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# Which store backs the token cache: "upstash" (REST), "redis" (native
+# protocol, e.g. a Redis next to the app) or "memory" (in-process)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "upstash")
+
+
+class CacheBackend(ABC):
+    """Async key/value interface shared by every cache store
+
+    Values are strings and ex is a TTL in seconds. Stores have to implement
+    get/set/delete/scan_iter/flush_all, or they can't be instantiated; the
+    bulk operations fall back to one call per key, and stores that can
+    batch override them.
+    """
+
+    @abstractmethod
+    async def get(self, key: str): ...
+
+    @abstractmethod
+    async def set(self, key: str, value: str, ex: int = 3600): ...
+
+    @abstractmethod
+    async def delete(self, key: str): ...
+
+    async def mget(self, keys):
+        return [await self.get(key) for key in keys]
+
+    async def mget_with_ttl(self, keys):
+        """[(value, seconds left or None if unknown)] for keys, in one round trip
+
+        Stores that can read a key's remaining TTL alongside its value
+        override this; by default the TTL is unknown.
+        """
+        return [(value, None) for value in await self.mget(keys)]
+
+    async def mset(self, values, ex=3600):
+        """Set many keys; ex is one TTL or a {key: ttl} mapping"""
+        for key, value in values.items():
+            await self.set(key, value, ex=ex[key] if isinstance(ex, dict) else ex)
+
+    async def delete_many(self, keys):
+        for key in keys:
+            await self.delete(key)
+
+    @abstractmethod
+    def scan_iter(self, match="*", count=None):
+        """Async iterator over lists of keys matching a glob pattern"""
+
+    @abstractmethod
+    async def flush_all(self): ...
+
+    async def get_all(self):
+        values = {}
+        async for keys in self.scan_iter():
+            for key, value in zip(keys, await self.mget(keys)):
+                # Skip keys that expired between the scan and the read
+                if value is not None:
+                    values[key] = value
+        return values
+
+    async def close(self):
+        pass
+
+
+def create_cache_backend(name=None):
+    """Build the cache store named by name, or by CACHE_BACKEND"""
+    name = (name or CACHE_BACKEND).lower()
+    # Imported here so only the selected backend's client library is loaded
+    if name == "upstash":
+        from src.RedisCache import RedisCache
+
+        return RedisCache()
+    if name == "redis":
+        from src.NativeRedisCache import NativeRedisCache
+
+        return NativeRedisCache()
+    if name == "memory":
+        from src.MemoryCache import MemoryCache
+
+        return MemoryCache()
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
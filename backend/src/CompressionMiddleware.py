@@ -0,0 +1,126 @@
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+import brotli
+import os
+import zlib
+
+load_dotenv()
+
+# Bodies smaller than this aren't worth the CPU (and gzip's ~20 byte overhead)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+# Brotli's fast qualities still beat gzip on size at similar CPU cost
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+
+def choose_encoding(accept_encoding):
+    """Pick br or gzip from an Accept-Encoding header, or None for identity"""
+    supported = ("br", "gzip")
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        params = params.strip()
+        try:
+            q = float(params[2:]) if params.startswith("q=") else 1.0
+        except ValueError:
+            continue
+        if name == "*":
+            for encoding in supported:
+                weights.setdefault(encoding, q)
+        elif name in supported:
+            weights[name] = q
+    # max() keeps the first of equal weights, so ties go to brotli
+    candidates = [encoding for encoding in supported if weights.get(encoding, 0) > 0]
+    return max(candidates, key=weights.get, default=None)
+
+
+class Compressor:
+    def __init__(self, encoding):
+        if encoding == "br":
+            self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits=31 writes a gzip header and trailer
+            self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        self.encoding = encoding
+
+    def chunk(self, data):
+        """Compress data and flush it so a streamed chunk is sent right away"""
+        if self.encoding == "br":
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data=b""):
+        if self.encoding == "br":
+            return self.compressor.process(data) + self.compressor.finish()
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+class CompressionMiddleware:
+    """Compress responses with brotli or gzip, as negotiated with the client
+
+    Whole bodies under minimum_size are sent as-is. Streamed bodies (NDJSON
+    exports) are compressed chunk by chunk and flushed as they go.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                # Hold the headers until we know whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                return await send(message)
+
+            if compressor is None:
+                headers = MutableHeaders(raw=start["headers"])
+                body = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                if "content-encoding" in headers or (
+                    not more_body and len(body) < self.minimum_size
+                ):
+                    await send(start)
+                    start = None
+                    return await send(message)
+
+                compressor = Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if more_body:
+                    del headers["Content-Length"]
+                    body = compressor.chunk(body)
+                else:
+                    body = compressor.finish(body)
+                    headers["Content-Length"] = str(len(body))
+                await send(start)
+                return await send(
+                    {"type": "http.response.body", "body": body, "more_body": more_body}
+                )
+
+            if message.get("more_body", False):
+                body = compressor.chunk(message.get("body", b""))
+            else:
+                body = compressor.finish(message.get("body", b""))
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": body,
+                    "more_body": message.get("more_body", False),
+                }
+            )
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,71 @@
+from starlette.datastructures import Headers, MutableHeaders
+import hashlib
+
+
+def make_etag(body):
+    # Weak, since compression changes the bytes but not the meaning
+    return f'W/"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against etag"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+
+class ETagMiddleware:
+    """Tag GET responses under path_prefix with an ETag and honour If-None-Match
+
+    The tag is a hash of the body, so unchanged data gets the same tag and a
+    client that already has it gets an empty 304 instead. Streamed and
+    non-200 responses are passed through untouched.
+    """
+
+    def __init__(self, app, path_prefix="/spotify/"):
+        self.app = app
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not scope["path"].startswith(self.path_prefix)
+        ):
+            return await self.app(scope, receive, send)
+        if_none_match = Headers(scope=scope).get("if-none-match")
+        start = None
+
+        async def send_with_etag(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                return await send(message)
+
+            response_start, start = start, None
+            if response_start["status"] != 200 or message.get("more_body", False):
+                await send(response_start)
+                return await send(message)
+
+            headers = MutableHeaders(raw=response_start["headers"])
+            etag = make_etag(message.get("body", b""))
+            headers["ETag"] = etag
+            if "cache-control" not in headers:
+                # Let browsers keep the body but revalidate it on every use
+                headers["Cache-Control"] = "private, no-cache"
+            if if_none_match and etag_matches(if_none_match, etag):
+                del headers["Content-Length"]
+                del headers["Content-Type"]
+                response_start["status"] = 304
+                await send(response_start)
+                return await send({"type": "http.response.body", "body": b""})
+            await send(response_start)
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
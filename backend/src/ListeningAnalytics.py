@@ -0,0 +1,267 @@
+from dotenv import load_dotenv
+import asyncio
+import numpy as np
+import orjson
+import os
+import sqlite3
+import threading
+import time
+
+load_dotenv()
+
+ANALYTICS_DB_PATH = os.getenv("ANALYTICS_DB_PATH", "listening_analytics.db")
+# Trailing windows (in days) for artist play counts; "all" is kept too
+ARTIST_WINDOWS = (7, 30)
+TOP_N = 10
+
+MS_PER_HOUR = 3_600_000
+MS_PER_DAY = 86_400_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listening_analytics (
+    user_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    updated_at INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def empty_state():
+    return {
+        "hours": [0] * 24,
+        "weekdays": [0] * 7,
+        "total_plays": 0,
+        "total_ms": 0,
+        "last_played_at": None,
+        # {artist_id: plays} over the whole history
+        "artists": {},
+        # {day_number: {artist_id: plays}} for the last max(ARTIST_WINDOWS) days
+        "artist_days": {},
+        "genres": {},
+        "affinity": {},
+    }
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def _top(counts, field="count", n=TOP_N):
+    return [
+        {"id": key, field: count}
+        for key, count in sorted(counts.items(), key=lambda kv: -kv[1])[:n]
+    ]
+
+
+def _add_counts(target, keys, counts):
+    for key, count in zip(keys.tolist(), counts.tolist()):
+        target[key] = target.get(key, 0) + count
+
+
+def rank_weights(n):
+    """Weight list positions so the #1 entry counts most (1, 1/2, 1/3, ...)"""
+    return 1.0 / np.arange(1, n + 1)
+
+
+class ListeningAnalytics:
+    """Precomputed per-user listening analytics, updated incrementally
+
+    Each user has a materialized state (hour/weekday histograms, artist play
+    counts overall and per day, genre and artist affinity scores) plus the
+    summary built from it. New plays are folded into the state with NumPy
+    instead of recomputing from the full history, and the summary is stored
+    so reads are a single row lookup. The trailing artist windows count back
+    from the current day, so a summary computed on an earlier day is rebuilt
+    from the state when it is read.
+    """
+
+    def __init__(self, path=ANALYTICS_DB_PATH):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.lock = threading.Lock()
+        # Serializes read-modify-write of a user's state across worker threads
+        self.update_lock = threading.Lock()
+
+    def _load(self, user_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT state FROM listening_analytics WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def _save(self, user_id, state, summary, now):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO listening_analytics VALUES (?, ?, ?, ?)",
+                (
+                    user_id,
+                    orjson.dumps(state),
+                    orjson.dumps(summary),
+                    now,
+                ),
+            )
+
+    def _get_summary(self, user_id):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT summary, updated_at FROM listening_analytics"
+                " WHERE user_id = ?",
+                (user_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        summary, updated_at = row
+        if updated_at // MS_PER_DAY == now_ms() // MS_PER_DAY:
+            return orjson.loads(summary)
+        # The day rolled over since it was stored: slide the trailing windows
+        return self._update(user_id)
+
+    def _prune_artist_days(self, state, now):
+        oldest_day = now // MS_PER_DAY - max(ARTIST_WINDOWS)
+        state["artist_days"] = {
+            day: counts
+            for day, counts in state["artist_days"].items()
+            if int(day) > oldest_day
+        }
+        return oldest_day
+
+    def _fold_plays(self, state, plays, now):
+        """Add compact (played_at, track_id, artist_ids, duration_ms) plays"""
+        if not plays:
+            return state
+        played_at = np.fromiter((p[0] for p in plays), dtype=np.int64, count=len(plays))
+        durations = np.fromiter(
+            (p[3] or 0 for p in plays), dtype=np.int64, count=len(plays)
+        )
+
+        hours = np.bincount((played_at // MS_PER_HOUR) % 24, minlength=24)
+        days = played_at // MS_PER_DAY
+        # 1970-01-01 was a Thursday; shift so Monday is 0
+        weekdays = np.bincount((days + 3) % 7, minlength=7)
+        state["hours"] = (np.array(state["hours"]) + hours).tolist()
+        state["weekdays"] = (np.array(state["weekdays"]) + weekdays).tolist()
+        state["total_plays"] += len(plays)
+        state["total_ms"] += int(durations.sum())
+        latest = int(played_at.max())
+        state["last_played_at"] = max(state["last_played_at"] or 0, latest)
+
+        # One (day, artist) pair per credited artist on each play
+        artist_days, artist_ids = [], []
+        for day, play in zip(days.tolist(), plays):
+            for artist_id in filter(None, play[2].split(",")):
+                artist_days.append(day)
+                artist_ids.append(artist_id)
+        if artist_ids:
+            artists = np.array(artist_ids)
+            keys, counts = np.unique(artists, return_counts=True)
+            _add_counts(state["artists"], keys, counts)
+
+            day_array = np.array(artist_days)
+            oldest_day = self._prune_artist_days(state, now)
+            for day in np.unique(day_array[day_array > oldest_day]).tolist():
+                keys, counts = np.unique(artists[day_array == day], return_counts=True)
+                _add_counts(state["artist_days"].setdefault(str(day), {}), keys, counts)
+        return state
+
+    def _fold_top_lists(self, state, top_artists, top_tracks):
+        """Recompute genre distribution and artist affinity from top lists"""
+        if top_artists is None or top_tracks is None:
+            # Keep the previous scores rather than wiping them on a failed fetch
+            return state
+        artists = top_artists.get("items", [])
+        tracks = top_tracks.get("items", [])
+
+        genres = {}
+        if artists:
+            weights = rank_weights(len(artists))
+            genre_names, genre_weights = [], []
+            for weight, artist in zip(weights.tolist(), artists):
+                for genre in artist.get("genres", []):
+                    genre_names.append(genre)
+                    genre_weights.append(weight)
+            if genre_names:
+                keys, inverse = np.unique(np.array(genre_names), return_inverse=True)
+                totals = np.bincount(inverse, weights=np.array(genre_weights))
+                totals = totals / totals.sum()
+                genres = dict(zip(keys.tolist(), np.round(totals, 4).tolist()))
+
+        affinity = {}
+        artist_scores = [
+            (artist["id"], weight)
+            for weight, artist in zip(rank_weights(len(artists)).tolist(), artists)
+        ]
+        track_scores = [
+            (artist["id"], weight / len(track.get("artists") or [None]))
+            for weight, track in zip(rank_weights(len(tracks)).tolist(), tracks)
+            for artist in track.get("artists", [])
+        ]
+        scored = artist_scores + track_scores
+        if scored:
+            keys, inverse = np.unique(
+                np.array([artist_id for artist_id, _ in scored]), return_inverse=True
+            )
+            totals = np.bincount(
+                inverse, weights=np.array([score for _, score in scored])
+            )
+            totals = totals / totals.max()
+            affinity = dict(zip(keys.tolist(), np.round(totals, 4).tolist()))
+
+        state["genres"] = genres
+        state["affinity"] = affinity
+        return state
+
+    def _summarize(self, state, now):
+        windows = {"all": _top(state["artists"])}
+        today = now // MS_PER_DAY
+        for window in ARTIST_WINDOWS:
+            counts = {}
+            for day, day_counts in state["artist_days"].items():
+                if int(day) > today - window:
+                    for artist_id, count in day_counts.items():
+                        counts[artist_id] = counts.get(artist_id, 0) + count
+            windows[f"{window}d"] = _top(counts)
+
+        return {
+            "total_plays": state["total_plays"],
+            "total_minutes": round(state["total_ms"] / 60000, 1),
+            "last_played_at": state["last_played_at"],
+            "hour_of_day": state["hours"],
+            "day_of_week": state["weekdays"],
+            "top_artists_by_plays": windows,
+            "genres": dict(
+                sorted(state["genres"].items(), key=lambda kv: -kv[1])[:TOP_N]
+            ),
+            "artist_affinity": _top(state["affinity"], "score"),
+        }
+
+    def _update(self, user_id, plays=None, top_artists=None, top_tracks=None):
+        now = now_ms()
+        with self.update_lock:
+            state = self._load(user_id) or empty_state()
+            if plays:
+                self._fold_plays(state, plays, now)
+            else:
+                self._prune_artist_days(state, now)
+            if top_artists is not None or top_tracks is not None:
+                self._fold_top_lists(state, top_artists, top_tracks)
+            summary = self._summarize(state, now)
+            self._save(user_id, state, summary, now)
+        return summary
+
+    async def apply_plays(self, user_id, plays):
+        """Fold newly synced plays into the user's analytics"""
+        return await asyncio.to_thread(self._update, user_id, plays)
+
+    async def apply_top_lists(self, user_id, top_artists, top_tracks):
+        """Refresh genre distribution and artist affinity from top lists"""
+        return await asyncio.to_thread(
+            self._update, user_id, None, top_artists, top_tracks
+        )
+
+    async def get_summary(self, user_id):
+        """Return the stored summary, or None if nothing was computed yet"""
+        return await asyncio.to_thread(self._get_summary, user_id)
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,187 @@
+from datetime import datetime
+from dotenv import load_dotenv
+import asyncio
+import os
+import sqlite3
+import threading
+import weakref
+
+load_dotenv()
+
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "listening_history.db")
+# Spotify's recently-played endpoint returns at most this many plays per call
+RECENTLY_PLAYED_PAGE_SIZE = 50
+# Safety cap on pages pulled by a single sync
+MAX_SYNC_PAGES = 20
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plays (
+    user_id TEXT NOT NULL,
+    played_at INTEGER NOT NULL,
+    track_id TEXT NOT NULL,
+    artist_ids TEXT NOT NULL,
+    duration_ms INTEGER,
+    PRIMARY KEY (user_id, played_at)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sync_cursors (
+    user_id TEXT PRIMARY KEY,
+    after INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+def parse_played_at(played_at):
+    """Convert Spotify's ISO played_at timestamp to epoch milliseconds"""
+    return int(
+        datetime.fromisoformat(played_at.replace("Z", "+00:00")).timestamp() * 1000
+    )
+
+
+def compact_play(item):
+    """Reduce a recently-played item to (played_at, track_id, artist_ids, duration_ms)"""
+    track = item["track"]
+    return (
+        parse_played_at(item["played_at"]),
+        track["id"],
+        ",".join(artist["id"] for artist in track.get("artists", [])),
+        track.get("duration_ms"),
+    )
+
+
+class ListeningHistory:
+    """Per-user listening history with an incremental recently-played sync
+
+    Plays are stored compactly in SQLite, one row per (user, played_at), so
+    re-syncing the same plays is a no-op. Each user's Spotify "after" cursor
+    is kept alongside, so a sync only asks Spotify for plays newer than the
+    last one stored. Syncs for the same user run one at a time, so each play
+    is reported as new by exactly one of them.
+    """
+
+    def __init__(self, path=HISTORY_DB_PATH):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        # sqlite3 connections aren't safe to use from several threads at once
+        self.lock = threading.Lock()
+        # Per-user asyncio locks, dropped once nobody holds or awaits them
+        self.user_locks = weakref.WeakValueDictionary()
+
+    def _execute(self, query, params=()):
+        with self.lock:
+            return self.db.execute(query, params).fetchall()
+
+    def _add_plays(self, user_id, plays):
+        added = []
+        with self.lock, self.db:
+            for play in plays:
+                cursor = self.db.execute(
+                    "INSERT OR IGNORE INTO plays VALUES (?, ?, ?, ?, ?)",
+                    (user_id, *play),
+                )
+                if cursor.rowcount:
+                    added.append(play)
+        return added
+
+    def _set_cursor(self, user_id, after):
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO sync_cursors VALUES (?, ?)", (user_id, after)
+            )
+
+    def user_lock(self, user_id):
+        """The lock sync() holds for user_id while storing and applying plays"""
+        lock = self.user_locks.get(user_id)
+        if lock is None:
+            lock = self.user_locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def add_plays(self, user_id, plays):
+        """Store compacted plays, ignoring ones already stored; returns the new ones"""
+        return await asyncio.to_thread(self._add_plays, user_id, plays)
+
+    async def get_cursor(self, user_id):
+        rows = await asyncio.to_thread(
+            self._execute,
+            "SELECT after FROM sync_cursors WHERE user_id = ?",
+            (user_id,),
+        )
+        return rows[0][0] if rows else None
+
+    async def set_cursor(self, user_id, after):
+        await asyncio.to_thread(self._set_cursor, user_id, after)
+
+    async def get_plays(self, user_id, since=None, limit=None):
+        """Return the user's plays, newest first, optionally after since (ms)"""
+        query = (
+            "SELECT played_at, track_id, artist_ids, duration_ms FROM plays"
+            " WHERE user_id = ?"
+        )
+        params = [user_id]
+        if since is not None:
+            query += " AND played_at > ?"
+            params.append(since)
+        query += " ORDER BY played_at DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = await asyncio.to_thread(self._execute, query, params)
+        return [
+            {
+                "played_at": played_at,
+                "track_id": track_id,
+                "artist_ids": artist_ids.split(",") if artist_ids else [],
+                "duration_ms": duration_ms,
+            }
+            for played_at, track_id, artist_ids, duration_ms in rows
+        ]
+
+    async def get_compact_plays(self, user_id):
+        """Return every stored play as (played_at, track_id, artist_ids, duration_ms)"""
+        return await asyncio.to_thread(
+            self._execute,
+            "SELECT played_at, track_id, artist_ids, duration_ms FROM plays"
+            " WHERE user_id = ? ORDER BY played_at",
+            (user_id,),
+        )
+
+    async def sync(self, user_id, fetch_page, on_new_plays=None):
+        """Pull plays newer than the user's cursor and store them
+
+        fetch_page(after) should return Spotify's recently-played response for
+        plays after the given epoch-ms cursor (or the latest plays when None).
+        on_new_plays(plays), if given, is awaited with the newly stored plays
+        before the user's lock is released, so state derived from them (like
+        analytics) never sees a play twice.
+        Returns the newly stored plays, or None if Spotify couldn't be reached.
+        """
+        async with self.user_lock(user_id):
+            new_plays = await self._sync(user_id, fetch_page)
+            if new_plays and on_new_plays is not None:
+                await on_new_plays(new_plays)
+            return new_plays
+
+    async def _sync(self, user_id, fetch_page):
+        after = await self.get_cursor(user_id)
+        new_plays = []
+        for _ in range(MAX_SYNC_PAGES):
+            page = await fetch_page(after)
+            if page is None:
+                return new_plays or None
+            plays = [
+                compact_play(item)
+                for item in page.get("items", [])
+                # Local files have no Spotify ID and can't be looked up later
+                if item.get("track") and item["track"].get("id")
+            ]
+            plays = [play for play in plays if after is None or play[0] > after]
+            if not plays:
+                break
+            new_plays.extend(await self.add_plays(user_id, plays))
+            after = max(play[0] for play in plays)
+            await self.set_cursor(user_id, after)
+            if len(page.get("items", [])) < RECENTLY_PLAYED_PAGE_SIZE:
+                break
+        return new_plays
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,87 @@
+from src.CacheBackend import CacheBackend
+import fnmatch
+import heapq
+import time
+
+# Keys yielded per scan_iter batch
+SCAN_BATCH_SIZE = 1000
+
+
+class MemoryCache(CacheBackend):
+    """In-process cache with per-key TTLs
+
+    For a single worker, offline tests and benchmarks. Expired keys are
+    dropped lazily on read and by a sweep over a min-heap of expiry times
+    on every write, so memory doesn't grow with keys nobody reads again.
+    """
+
+    def __init__(self):
+        # key -> (value, expires_at or None)
+        self.store = {}
+        # (expires_at, key) - stale entries are skipped when swept
+        self.expiries = []
+
+    def _sweep(self):
+        now = time.monotonic()
+        while self.expiries and self.expiries[0][0] <= now:
+            expires_at, key = heapq.heappop(self.expiries)
+            entry = self.store.get(key)
+            if entry is not None and entry[1] == expires_at:
+                del self.store[key]
+
+    def _get(self, key):
+        entry = self.store.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.store[key]
+            return None
+        return entry[0]
+
+    def _set(self, key, value, ex):
+        expires_at = time.monotonic() + ex if ex else None
+        self.store[key] = (value, expires_at)
+        if expires_at is not None:
+            heapq.heappush(self.expiries, (expires_at, key))
+
+    async def get(self, key: str):
+        return self._get(key)
+
+    async def set(self, key: str, value: str, ex: int = 3600):
+        self._sweep()
+        self._set(key, value, ex)
+
+    async def delete(self, key: str):
+        self.store.pop(key, None)
+
+    async def mget(self, keys):
+        return [self._get(key) for key in keys]
+
+    async def mget_with_ttl(self, keys):
+        now = time.monotonic()
+        results = []
+        for key in keys:
+            value = self._get(key)
+            expires_at = self.store[key][1] if value is not None else None
+            results.append((value, expires_at - now if expires_at else None))
+        return results
+
+    async def mset(self, values, ex=3600):
+        self._sweep()
+        for key, value in values.items():
+            self._set(key, value, ex[key] if isinstance(ex, dict) else ex)
+
+    async def delete_many(self, keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+    async def scan_iter(self, match="*", count=None):
+        self._sweep()
+        keys = [key for key in self.store if fnmatch.fnmatchcase(key, match)]
+        count = count or SCAN_BATCH_SIZE
+        for i in range(0, len(keys), count):
+            yield keys[i : i + count]
+
+    async def flush_all(self):
+        self.store.clear()
+        self.expiries.clear()
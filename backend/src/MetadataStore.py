@@ -0,0 +1,138 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+import asyncio
+import os
+import time
+from src.Models import Artist, Model, Track
+
+load_dotenv()
+
+METADATA_MAX_ENTRIES = int(os.getenv("METADATA_MAX_ENTRIES", "100000"))
+# Catalog objects barely change; popularity/followers may drift this long
+METADATA_TTL = int(os.getenv("METADATA_TTL", str(24 * 3600)))
+# Spotify's multi-ID endpoints (/tracks?ids=, /artists?ids=) take at most 50
+METADATA_BATCH_SIZE = 50
+
+
+class MetadataStore:
+    """Shared, deduplicated track and artist objects keyed by Spotify ID
+
+    Objects are kept as compact Track / Artist models. Cached per-user
+    responses keep only ID lists (see dehydrate) and are turned back into
+    dicts at response time (see hydrate). IDs that aren't in the store are
+    looked up in batches through fetch_many.
+    """
+
+    models = {"tracks": Track, "artists": Artist}
+
+    def __init__(self, max_entries=METADATA_MAX_ENTRIES, ttl=METADATA_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # kind ("tracks" / "artists") -> OrderedDict(id -> (object, expires_at))
+        self.objects = {"tracks": OrderedDict(), "artists": OrderedDict()}
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, kind, items):
+        """Store Spotify objects as models and return their IDs in order"""
+        model = self.models[kind]
+        ids = []
+        shared = []
+        for item in items:
+            if not item:
+                continue
+            item = model.from_spotify(item)
+            if item.id is None:
+                # Local files etc. have no ID; they can't be shared
+                ids.append(item.to_dict())
+                continue
+            shared.append(item)
+            ids.append(item.id)
+        self._store(kind, shared)
+        return ids
+
+    def _store(self, kind, models):
+        objects = self.objects[kind]
+        expires_at = time.monotonic() + self.ttl
+        for item in models:
+            objects[item.id] = (item, expires_at)
+            objects.move_to_end(item.id)
+        while len(objects) > self.max_entries:
+            objects.popitem(last=False)
+
+    def get(self, kind, item_id):
+        entry = self.objects[kind].get(item_id)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        self.objects[kind].move_to_end(item_id)
+        return entry[0]
+
+    async def get_many(self, kind, ids, fetch_many):
+        """Return models for ids, fetching missing ones in batches of 50"""
+        found = {}
+        missing = []
+        for item_id in dict.fromkeys(ids):
+            item = self.get(kind, item_id)
+            if item is None:
+                missing.append(item_id)
+            else:
+                found[item_id] = item
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            batches = [
+                missing[i : i + METADATA_BATCH_SIZE]
+                for i in range(0, len(missing), METADATA_BATCH_SIZE)
+            ]
+            results = await asyncio.gather(*(fetch_many(batch) for batch in batches))
+            model = self.models[kind]
+            for items in results:
+                # Spotify returns null for IDs it doesn't know
+                models = [model.from_spotify(item) for item in items or [] if item]
+                self._store(kind, models)
+                found.update((item.id, item) for item in models)
+        return [found.get(item_id) for item_id in ids]
+
+    def dehydrate(self, response, kind, path=("items",)):
+        """Copy a response with the list at path replaced by IDs"""
+        if response is None:
+            return None
+        response = dict(response)
+        container = response
+        for key in path[:-1]:
+            container[key] = dict(container.get(key) or {})
+            container = container[key]
+        container[path[-1]] = self.put(kind, container.get(path[-1]) or [])
+        return response
+
+    async def hydrate(self, response, kind, fetch_many, path=("items",)):
+        """Copy a dehydrated response with its ID list swapped for dicts"""
+        if response is None:
+            return None
+        response = dict(response)
+        container = response
+        for key in path[:-1]:
+            container[key] = dict(container.get(key) or {})
+            container = container[key]
+        refs = container.get(path[-1]) or []
+        ids = [ref for ref in refs if isinstance(ref, str)]
+        objects = iter(await self.get_many(kind, ids, fetch_many))
+        items = [next(objects) if isinstance(ref, str) else ref for ref in refs]
+        # Drop anything Spotify no longer returns rather than emitting nulls
+        container[path[-1]] = [
+            item.to_dict() if isinstance(item, Model) else item
+            for item in items
+            if item is not None
+        ]
+        return response
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "tracks": len(self.objects["tracks"]),
+            "artists": len(self.objects["artists"]),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
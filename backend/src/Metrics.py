@@ -0,0 +1,192 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import re
+import time
+
+# Upper bounds in seconds, from L1 cache hits up to slow paginated exports
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Path segments after these hold an ID, which would blow up label cardinality
+_ID_AFTER = {"playlists", "users", "artists", "albums", "tracks", "shows"}
+_SPOTIFY_HOST = re.compile(r"^https?://[^/]+")
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Latency distribution per label set, with cumulative buckets on render
+
+    observe() only bumps one bucket and the sum, so recording stays cheap on
+    the hot path; bucket counts are accumulated when /metrics is scraped.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self.values = {}
+
+    def observe(self, value, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def samples(self):
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = (("le", _number(bound)),)
+                yield f"{self.name}_bucket", _labels(
+                    self.labelnames, labels, le
+                ), cumulative
+            label_str = _labels(self.labelnames, labels)
+            yield f"{self.name}_sum", label_str, total
+            yield f"{self.name}_count", label_str, cumulative
+
+
+class Registry:
+    """Metrics rendered together in the Prometheus text format
+
+    Besides counters and histograms, components that already keep their own
+    stats() can be registered as gauge sources and are read at scrape time.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        # prefix -> zero-argument function returning a dict of numbers
+        self.stats_sources = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def register_stats(self, prefix, stats_fn):
+        self.stats_sources[prefix] = stats_fn
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_number(value)}")
+        for prefix, stats_fn in self.stats_sources.items():
+            for key, value in stats_fn().items():
+                # Only plain numbers map onto gauges
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {_number(value)}")
+        return ("\n".join(lines) + "\n").encode()
+
+
+def upstream_endpoint(url):
+    """Spotify URL -> path with IDs replaced, e.g. /v1/playlists/{id}/tracks"""
+    path = _SPOTIFY_HOST.sub("", str(url)).split("?", 1)[0]
+    segments = path.split("/")
+    for i in range(1, len(segments)):
+        if segments[i - 1] in _ID_AFTER and segments[i]:
+            segments[i] = "{id}"
+    return "/".join(segments)
+
+
+REGISTRY = Registry()
+
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Time to serve a request, by route template",
+    ("method", "route", "status"),
+)
+SPOTIFY_REQUEST_DURATION = REGISTRY.histogram(
+    "spotify_request_duration_seconds",
+    "Time for one HTTP attempt against Spotify, by endpoint and status",
+    ("method", "endpoint", "status"),
+)
+CACHE_OPERATION_DURATION = REGISTRY.histogram(
+    "cache_operation_duration_seconds",
+    "Time for a token cache operation; result is hit, miss or ok",
+    ("op", "result"),
+)
+CACHE_KEYS = REGISTRY.counter(
+    "cache_keys_total",
+    "Keys looked up in the token cache, by where they were found",
+    ("result",),
+)
+TOKEN_REFRESH_DURATION = REGISTRY.histogram(
+    "token_refresh_duration_seconds",
+    "Time to obtain a new access token from Spotify",
+    ("kind", "result"),
+)
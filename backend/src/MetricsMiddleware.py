@@ -0,0 +1,40 @@
+from src.Metrics import HTTP_REQUEST_DURATION
+import time
+
+
+class MetricsMiddleware:
+    """Record how long every HTTP request takes, by route template and status
+
+    Requests are labelled with the matched route's path (e.g.
+    /spotify/playlists/{playlist_id}/tracks/export) rather than the raw URL,
+    so IDs in the path don't create a new series each. Streamed responses
+    are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app, histogram=HTTP_REQUEST_DURATION):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route on the shared scope
+            route = scope.get("route")
+            self.histogram.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+            )
@@ -0,0 +1,174 @@
+def _images(images):
+    return tuple(
+        (image.get("url"), image.get("width"), image.get("height"))
+        for image in images or []
+    )
+
+
+def _image_dicts(images):
+    return [
+        {"url": url, "width": width, "height": height} for url, width, height in images
+    ]
+
+
+class Model:
+    """Base for compact Spotify objects
+
+    Subclasses keep only the fields the frontend and extension read, in
+    __slots__ instead of a per-object dict. to_dict() rebuilds them with
+    Spotify's own key paths.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.id!r})"
+
+
+class Track(Model):
+    __slots__ = (
+        "id",
+        "name",
+        "uri",
+        # ((artist_id, name), ...)
+        "artists",
+        # ((url, width, height), ...)
+        "album_images",
+        "spotify_url",
+        "duration_ms",
+    )
+
+    @classmethod
+    def from_spotify(cls, data):
+        return cls(
+            data.get("id"),
+            data.get("name"),
+            data.get("uri"),
+            tuple(
+                (artist.get("id"), artist.get("name"))
+                for artist in data.get("artists") or []
+            ),
+            _images((data.get("album") or {}).get("images")),
+            (data.get("external_urls") or {}).get("spotify"),
+            data.get("duration_ms"),
+        )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "uri": self.uri,
+            "artists": [{"id": id, "name": name} for id, name in self.artists],
+            "album": {"images": _image_dicts(self.album_images)},
+            "external_urls": {"spotify": self.spotify_url},
+            "duration_ms": self.duration_ms,
+        }
+
+
+class Artist(Model):
+    __slots__ = ("id", "name", "images", "followers", "genres")
+
+    @classmethod
+    def from_spotify(cls, data):
+        return cls(
+            data.get("id"),
+            data.get("name"),
+            _images(data.get("images")),
+            (data.get("followers") or {}).get("total"),
+            tuple(data.get("genres") or ()),
+        )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "images": _image_dicts(self.images),
+            "followers": {"total": self.followers},
+            "genres": list(self.genres),
+        }
+
+
+class Playlist(Model):
+    __slots__ = (
+        "id",
+        "name",
+        "uri",
+        "images",
+        "track_count",
+        "owner_id",
+        "spotify_url",
+        "snapshot_id",
+    )
+
+    @classmethod
+    def from_spotify(cls, data):
+        return cls(
+            data.get("id"),
+            data.get("name"),
+            data.get("uri"),
+            _images(data.get("images")),
+            (data.get("tracks") or {}).get("total"),
+            (data.get("owner") or {}).get("id"),
+            (data.get("external_urls") or {}).get("spotify"),
+            data.get("snapshot_id"),
+        )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "uri": self.uri,
+            "images": _image_dicts(self.images),
+            "tracks": {"total": self.track_count},
+            "owner": {"id": self.owner_id},
+            "external_urls": {"spotify": self.spotify_url},
+            "snapshot_id": self.snapshot_id,
+        }
+
+
+class Profile(Model):
+    __slots__ = ("id", "display_name", "email", "images", "followers", "spotify_url")
+
+    @classmethod
+    def from_spotify(cls, data):
+        return cls(
+            data.get("id"),
+            data.get("display_name"),
+            data.get("email"),
+            _images(data.get("images")),
+            (data.get("followers") or {}).get("total"),
+            (data.get("external_urls") or {}).get("spotify"),
+        )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "display_name": self.display_name,
+            "email": self.email,
+            "images": _image_dicts(self.images),
+            "followers": {"total": self.followers},
+            "external_urls": {"spotify": self.spotify_url},
+        }
+
+
+def page_from_spotify(page, model):
+    """Copy a paging object with its items converted to model instances"""
+    if page is None:
+        return None
+    return {
+        **page,
+        "items": [model.from_spotify(item) for item in page.get("items", [])],
+    }
+
+
+def page_to_dict(page):
+    if page is None:
+        return None
+    return {**page, "items": [item.to_dict() for item in page["items"]]}
@@ -1,10 +1,11 @@
-from pymongo.mongo_client import MongoClient
+from pymongo import AsyncMongoClient, ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import PyMongoError
 from pymongo.server_api import ServerApi
 from dotenv import load_dotenv
 import os
 import certifi
 from urllib.parse import quote_plus
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 
 load_dotenv()
 
@@ -13,52 +14,153 @@ DB_NAME = os.getenv("DB_NAME")
 DB_USER = os.getenv("DB_USER")
 DB_URI = os.getenv("DB_URI")
 
+# The session store is only used when a database is configured
+MONGO_ENABLED = bool(DB_URI)
 
-class MongoDBClient:
-    def __init__(self):
-        encoded_user = quote_plus(DB_USER)
-        encoded_pass = quote_plus(DB_PASS)
+# Connection pool tuning for the async driver
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+# How long a query waits for a free pooled connection before failing
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "2000"))
+
+SESSION_INDEXES = [
+    IndexModel([("session_key", ASCENDING)], unique=True, name="session_key_unique"),
+    IndexModel([("username", ASCENDING)], name="username"),
+    # Mongo's TTL monitor deletes sessions once expires_at has passed
+    IndexModel(
+        [("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"
+    ),
+]
 
-        self.uri = f"mongodb+srv://{encoded_user}:{encoded_pass}@{DB_URI}"
+TOKEN_INDEXES = [
+    IndexModel([("user_id", ASCENDING)], unique=True, name="user_id_unique"),
+    # Lets a bearer token be verified again after the cache has lost it
+    IndexModel([("access_token", ASCENDING)], name="access_token"),
+    IndexModel(
+        [("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"
+    ),
+]
 
-        self.client = MongoClient(
-            self.uri, tlsCAFile=certifi.where(), server_api=ServerApi("1")
+
+class MongoDBClient:
+    def __init__(
+        self,
+        uri=None,
+        max_pool_size=MONGO_MAX_POOL_SIZE,
+        min_pool_size=MONGO_MIN_POOL_SIZE,
+    ):
+        if uri is None:
+            encoded_user = quote_plus(DB_USER)
+            encoded_pass = quote_plus(DB_PASS)
+            uri = f"mongodb+srv://{encoded_user}:{encoded_pass}@{DB_URI}"
+        self.uri = uri
+
+        # Connects lazily on first use; every call shares one pooled client
+        self.client = AsyncMongoClient(
+            self.uri,
+            tlsCAFile=certifi.where(),
+            server_api=ServerApi("1"),
+            tz_aware=True,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min_pool_size,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
         )
         self.db = self.client[DB_NAME]
         self.user_session = self.db["user_session"]
+        self.user_tokens = self.db["user_tokens"]
 
     def _get_time_now_utc(self):
-        return datetime.now(datetime.timezone.utc)
+        return datetime.now(timezone.utc)
+
+    async def ensure_indexes(self):
+        """
+        Create the session and token indexes if they don't exist yet
+
+        Lookups by session_key, username, user_id and access_token use an
+        index instead of a collection scan, and expired documents are removed
+        by Mongo itself.
+
+        Returns:
+            True if the indexes are in place, False otherwise
+        """
+        try:
+            await self.user_session.create_indexes(SESSION_INDEXES)
+            await self.user_tokens.create_indexes(TOKEN_INDEXES)
+            return True
+        except PyMongoError as e:
+            print(f"Error creating session indexes: {e}")
+            return False
 
-    def create_session(self, username, session_key, ttl_minutes=56):
+    def _session_doc(self, username, session_key, ttl_minutes):
+        now = self._get_time_now_utc()
+        return {
+            "username": username,
+            "session_key": session_key,
+            "created_at": now,
+            "expires_at": now + timedelta(minutes=ttl_minutes),
+        }
+
+    async def create_session(self, username, session_key, ttl_minutes=56):
         """
         Create a new session for a user
 
         Args:
             username: The username
             session_key: Unique session key/token
-            ttl_hours: Time to live in hours (default 24)
+            ttl_minutes: Time to live in minutes (default 56)
 
         Returns:
             The inserted document ID or None if failed
         """
         try:
-            expires_at = self._get_time_now_utc() + timedelta(minutes=ttl_minutes)
-
-            session_doc = {
-                "username": username,
-                "session_key": session_key,
-                "created_at": self._get_time_now_utc(),
-                "expires_at": expires_at,
-            }
-
-            result = self.user_session.insert_one(session_doc)
+            session_doc = self._session_doc(username, session_key, ttl_minutes)
+            result = await self.user_session.insert_one(session_doc)
             return result.inserted_id
         except Exception as e:
             print(f"Error creating session: {e}")
             return None
 
-    def get_session(self, session_key):
+    async def upsert_sessions(self, sessions):
+        """
+        Create or replace many sessions in one round trip
+
+        Args:
+            sessions: Iterable of dicts with username, session_key and
+                optionally ttl_minutes (default 56) or expires_at
+
+        Returns:
+            Number of sessions inserted or updated
+        """
+        operations = []
+        for session in sessions:
+            doc = self._session_doc(
+                session["username"],
+                session["session_key"],
+                session.get("ttl_minutes", 56),
+            )
+            if session.get("expires_at"):
+                doc["expires_at"] = session["expires_at"]
+            created_at = doc.pop("created_at")
+            operations.append(
+                UpdateOne(
+                    {"session_key": doc["session_key"]},
+                    {"$set": doc, "$setOnInsert": {"created_at": created_at}},
+                    upsert=True,
+                )
+            )
+        if not operations:
+            return 0
+        try:
+            # Unordered so one bad write doesn't stop the rest of the batch
+            result = await self.user_session.bulk_write(operations, ordered=False)
+            return result.upserted_count + result.modified_count
+        except Exception as e:
+            print(f"Error upserting sessions: {e}")
+            return 0
+
+    async def get_session(self, session_key):
         """
         Retrieve a session by session key
 
@@ -69,17 +171,40 @@ class MongoDBClient:
             Session document or None if not found/expired
         """
         try:
-            session = self.user_session.find_one({"session_key": session_key})
-
-            # Check if session exists and hasn't expired
-            if session and session.get("expires_at") < self._get_time_now_utc():
-                return session
-            return None
+            # The TTL monitor only runs once a minute, so filter expired ones too
+            return await self.user_session.find_one(
+                {
+                    "session_key": session_key,
+                    "expires_at": {"$gt": self._get_time_now_utc()},
+                }
+            )
         except Exception as e:
             print(f"Error getting session: {e}")
             return None
 
-    def delete_session(self, session_key):
+    async def get_sessions(self, session_keys):
+        """
+        Retrieve many sessions in one query
+
+        Args:
+            session_keys: The session keys to lookup
+
+        Returns:
+            Dict of session_key -> session document, for live sessions only
+        """
+        try:
+            cursor = self.user_session.find(
+                {
+                    "session_key": {"$in": list(session_keys)},
+                    "expires_at": {"$gt": self._get_time_now_utc()},
+                }
+            )
+            return {session["session_key"]: session async for session in cursor}
+        except Exception as e:
+            print(f"Error getting sessions: {e}")
+            return {}
+
+    async def delete_session(self, session_key):
         """
         Delete a session (logout)
 
@@ -90,13 +215,32 @@ class MongoDBClient:
             True if deleted, False otherwise
         """
         try:
-            result = self.user_session.delete_one({"session_key": session_key})
+            result = await self.user_session.delete_one({"session_key": session_key})
             return result.deleted_count > 0
         except Exception as e:
             print(f"Error deleting session: {e}")
             return False
 
-    def delete_user_sessions(self, username):
+    async def delete_sessions(self, session_keys):
+        """
+        Delete many sessions in one round trip
+
+        Args:
+            session_keys: The session keys to delete
+
+        Returns:
+            Number of sessions deleted
+        """
+        try:
+            result = await self.user_session.delete_many(
+                {"session_key": {"$in": list(session_keys)}}
+            )
+            return result.deleted_count
+        except Exception as e:
+            print(f"Error deleting sessions: {e}")
+            return 0
+
+    async def delete_user_sessions(self, username):
         """
         Delete all sessions for a user (logout everywhere)
 
@@ -107,19 +251,19 @@ class MongoDBClient:
             Number of sessions deleted
         """
         try:
-            result = self.user_session.delete_many({"username": username})
+            result = await self.user_session.delete_many({"username": username})
             return result.deleted_count
         except Exception as e:
             print(f"Error deleting user sessions: {e}")
             return 0
 
-    def refresh_session(self, session_key, ttl_minutes=56):
+    async def refresh_session(self, session_key, ttl_minutes=56):
         """
         Extend the expiration time of a session
 
         Args:
             session_key: The session key to refresh
-            ttl_hours: New TTL in hours from now
+            ttl_minutes: New TTL in minutes from now
 
         Returns:
             True if refreshed, False otherwise
@@ -127,7 +271,7 @@ class MongoDBClient:
         try:
             new_expires_at = self._get_time_now_utc() + timedelta(minutes=ttl_minutes)
 
-            result = self.user_session.update_one(
+            result = await self.user_session.update_one(
                 {"session_key": session_key}, {"$set": {"expires_at": new_expires_at}}
             )
             return result.modified_count > 0
@@ -135,9 +279,98 @@ class MongoDBClient:
             print(f"Error refreshing session: {e}")
             return False
 
-    def health_check(self):
+    async def upsert_user_tokens(self, token_docs):
+        """
+        Create or replace the stored tokens of many users in one round trip
+
+        Args:
+            token_docs: Iterable of dicts with user_id, access_token,
+                access_expires_at, refresh_token and expires_at
+
+        Returns:
+            Number of users inserted or updated, or None if the write failed
+        """
+        operations = [
+            UpdateOne(
+                {"user_id": doc["user_id"]},
+                {"$set": {**doc, "updated_at": self._get_time_now_utc()}},
+                upsert=True,
+            )
+            for doc in token_docs
+        ]
+        if not operations:
+            return 0
+        try:
+            result = await self.user_tokens.bulk_write(operations, ordered=False)
+            return result.upserted_count + result.modified_count
+        except Exception as e:
+            print(f"Error upserting user tokens: {e}")
+            return None
+
+    async def get_user_tokens(self, user_id):
+        """
+        Retrieve a user's stored tokens
+
+        Args:
+            user_id: The Spotify user ID
+
+        Returns:
+            Token document or None if not found/expired
+        """
         try:
-            self.client.admin.command("ping")
+            return await self.user_tokens.find_one(
+                {"user_id": user_id, "expires_at": {"$gt": self._get_time_now_utc()}}
+            )
+        except Exception as e:
+            print(f"Error getting user tokens: {e}")
+            return None
+
+    async def find_user_tokens_by_access_token(self, access_token):
+        """
+        Retrieve the stored tokens that an access token was issued with
+
+        Args:
+            access_token: The access token to lookup
+
+        Returns:
+            Token document or None if not found or the access token expired
+        """
+        try:
+            return await self.user_tokens.find_one(
+                {
+                    "access_token": access_token,
+                    "access_expires_at": {"$gt": self._get_time_now_utc()},
+                }
+            )
+        except Exception as e:
+            print(f"Error finding user tokens: {e}")
+            return None
+
+    async def delete_user_tokens(self, user_ids):
+        """
+        Delete the stored tokens of many users in one round trip
+
+        Args:
+            user_ids: The Spotify user IDs
+
+        Returns:
+            Number of users deleted, or None if the delete failed
+        """
+        try:
+            result = await self.user_tokens.delete_many(
+                {"user_id": {"$in": list(user_ids)}}
+            )
+            return result.deleted_count
+        except Exception as e:
+            print(f"Error deleting user tokens: {e}")
+            return None
+
+    async def health_check(self):
+        try:
+            await self.client.admin.command("ping")
             return True, "Spotifly DB"
         except Exception as e:
             return False, str(e)
+
+    async def close(self):
+        await self.client.close()
@@ -0,0 +1,82 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+import os
+import time
+
+load_dotenv()
+
+# Rebuild an index from Spotify after this long, to pick up edits made
+# outside the app (renamed or deleted playlists, tracks removed in Spotify)
+PLAYLIST_INDEX_TTL = int(os.getenv("PLAYLIST_INDEX_TTL", "600"))
+PLAYLIST_INDEX_MAX_USERS = int(os.getenv("PLAYLIST_INDEX_MAX_USERS", "10000"))
+PLAYLIST_INDEX_MAX_PLAYLISTS = int(os.getenv("PLAYLIST_INDEX_MAX_PLAYLISTS", "10000"))
+
+
+class PlaylistIndex:
+    """Per-user playlist name -> id index and per-playlist track URI sets
+
+    Both maps are bounded LRUs whose entries expire after ttl seconds, and
+    are updated in place after creates and adds so repeat lookups are free.
+    """
+
+    def __init__(
+        self,
+        ttl=PLAYLIST_INDEX_TTL,
+        max_users=PLAYLIST_INDEX_MAX_USERS,
+        max_playlists=PLAYLIST_INDEX_MAX_PLAYLISTS,
+    ):
+        self.ttl = ttl
+        self.max_users = max_users
+        self.max_playlists = max_playlists
+        # user_id -> ({name: playlist_id}, expires_at)
+        self.playlists = OrderedDict()
+        # playlist_id -> ({track_uri}, expires_at)
+        self.tracks = OrderedDict()
+
+    def _get(self, entries, key):
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, entries, key, value, limit):
+        entries[key] = (value, time.monotonic() + self.ttl)
+        entries.move_to_end(key)
+        while len(entries) > limit:
+            entries.popitem(last=False)
+
+    def get_playlists(self, user_id):
+        """Return the user's {name: playlist_id} map, or None if not indexed"""
+        return self._get(self.playlists, user_id)
+
+    def set_playlists(self, user_id, playlists):
+        self._put(self.playlists, user_id, playlists, self.max_users)
+
+    def add_playlist(self, user_id, name, playlist_id):
+        playlists = self.get_playlists(user_id)
+        if playlists is not None:
+            playlists.setdefault(name, playlist_id)
+        # A freshly created playlist is known to be empty
+        self.set_tracks(playlist_id, set())
+
+    def get_tracks(self, playlist_id):
+        """Return the playlist's set of track URIs, or None if not indexed"""
+        return self._get(self.tracks, playlist_id)
+
+    def set_tracks(self, playlist_id, track_uris):
+        self._put(self.tracks, playlist_id, set(track_uris), self.max_playlists)
+
+    def add_tracks(self, playlist_id, track_uris):
+        tracks = self.get_tracks(playlist_id)
+        if tracks is not None:
+            tracks.update(track_uris)
+
+    def forget(self, user_id, playlist_id=None):
+        """Drop a user's index (and a playlist's tracks) so they are rebuilt"""
+        self.playlists.pop(user_id, None)
+        if playlist_id:
+            self.tracks.pop(playlist_id, None)
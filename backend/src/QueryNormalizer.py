@@ -0,0 +1,35 @@
+import re
+import unicodedata
+
+# Words that mark a bracketed segment of a video title as noise
+NOISE_WORDS = r"official|video|audio|lyrics?|visuali[sz]er|hd|hq|4k|m/?v|explicit|clean"
+
+# "(Official Video)", "[Lyrics]", "【MV】" ...
+BRACKETED_NOISE = re.compile(
+    rf"[\(\[\{{【][^\)\]\}}】]*\b(?:{NOISE_WORDS})\b[^\)\]\}}】]*[\)\]\}}】]"
+)
+# Unbracketed trailing noise such as "- Official Music Video" or "| Lyrics"
+TRAILING_NOISE = re.compile(
+    r"\b(?:official\s+)?(?:music\s+|lyric\s+)?(?:video|audio|lyrics)\s*$"
+)
+# "ft.", "ft", "feat.", "featuring" all collapse to nothing; the artist stays
+FEATURING = re.compile(r"\b(?:ft|feat|featuring)\b\.?")
+PUNCTUATION = re.compile(r"[^\w\s]")
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Normalize a raw video title so near-identical titles share a search key
+
+    >>> normalize_query("Artist - Song ft. Other (Official Video) [HD]")
+    'artist song other'
+    """
+    text = unicodedata.normalize("NFKC", query).casefold()
+    text = BRACKETED_NOISE.sub(" ", text)
+    text = FEATURING.sub(" ", text)
+    text = PUNCTUATION.sub(" ", text)
+    text = WHITESPACE.sub(" ", text).strip()
+    # Bare trailing noise is only recognisable once punctuation is gone
+    text = TRAILING_NOISE.sub("", text).strip()
+    # Never normalize a query away entirely
+    return text or WHITESPACE.sub(" ", query).strip().casefold()
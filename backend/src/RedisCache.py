@@ -1,35 +1,89 @@
-from upstash_redis import Redis
+from upstash_redis.asyncio import Redis
 from dotenv import load_dotenv
+from src.CacheBackend import CacheBackend
 import os
 
 load_dotenv()
 REDIS_URL = os.getenv("UPSTASH_REDIS_REST_URL")
 REDIS_TOKEN = os.getenv("UPSTASH_REDIS_REST_TOKEN")
+# Keys requested per SCAN call (and fetched per MGET by get_all)
+SCAN_BATCH_SIZE = int(os.getenv("REDIS_SCAN_BATCH_SIZE", "1000"))
 
 
-class RedisCache:
-    def __init__(self):
-        self.cache = Redis(url=REDIS_URL, token=REDIS_TOKEN)
+class RedisCache(CacheBackend):
+    """Cache backed by Upstash Redis over its REST API"""
+
+    def __init__(self, url=REDIS_URL, token=REDIS_TOKEN):
+        self.cache = Redis(url=url, token=token)
         print("Connected to Upstash Redis")
 
-    def get(self, key: str):
-        return self.cache.get(key)
+    async def get(self, key: str):
+        return await self.cache.get(key)
 
-    def set(self, key: str, value: str, ex: int = 3600):
-        self.cache.set(key, value, ex=ex)
+    async def set(self, key: str, value: str, ex: int = 3600):
+        await self.cache.set(key, value, ex=ex)
 
-    def delete(self, key: str):
-        self.cache.delete(key)
+    async def delete(self, key: str):
+        await self.cache.delete(key)
 
-    def flush_all(self):
-        self.cache.flushall()
+    async def mget(self, keys):
+        """Get many keys in one round trip; missing keys come back as None"""
+        if not keys:
+            return []
+        return await self.cache.mget(*keys)
 
-    def get_all(self):
-        keys = self.cache.keys("*")
-        values = {}
+    async def mget_with_ttl(self, keys):
+        """Values and remaining TTLs (None when unknown) in one round trip"""
+        if not keys:
+            return []
+        pipeline = self.cache.pipeline()
         for key in keys:
-            values[key] = self.cache.get(key)
-        return values
+            pipeline.get(key)
+            pipeline.pttl(key)
+        replies = await pipeline.exec()
+        return [
+            (value, pttl / 1000 if pttl >= 0 else None)
+            for value, pttl in zip(replies[::2], replies[1::2])
+        ]
+
+    async def mset(self, values, ex=3600):
+        """Set many keys atomically in one round trip
+
+        ex is a TTL in seconds for every key, or a {key: ttl} mapping.
+        """
+        if not values:
+            return
+        # MSET can't set expiries, so queue SET ... EX in a MULTI/EXEC instead
+        transaction = self.cache.multi()
+        for key, value in values.items():
+            transaction.set(key, value, ex=ex[key] if isinstance(ex, dict) else ex)
+        await transaction.exec()
+
+    async def delete_many(self, keys):
+        if keys:
+            await self.cache.delete(*keys)
+
+    async def scan_iter(self, match="*", count=None):
+        """Yield lists of keys matching match, one SCAN batch at a time
+
+        Unlike KEYS, SCAN doesn't block the server, so this is safe on large
+        keyspaces. Keys changed during the scan may be missed or repeated.
+        """
+        cursor = 0
+        while True:
+            cursor, keys = await self.cache.scan(
+                cursor, match=match, count=count or SCAN_BATCH_SIZE
+            )
+            if keys:
+                yield keys
+            if int(cursor) == 0:
+                return
+
+    async def flush_all(self):
+        await self.cache.flushall()
+
+    async def close(self):
+        await self.cache.close()
 
 
 # USAGE
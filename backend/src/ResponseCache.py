@@ -0,0 +1,205 @@
+from collections import OrderedDict
+from src.SingleFlight import SingleFlight
+from src.Tracing import span
+import asyncio
+import time
+
+# Seconds a response is considered fresh, per endpoint (and time_range)
+DEFAULT_TTLS = {
+    "profile": 3600,
+    "playlists": 300,
+    "top_tracks": {"short_term": 900, "medium_term": 6 * 3600, "long_term": 86400},
+    "top_artists": {"short_term": 900, "medium_term": 6 * 3600, "long_term": 86400},
+    "search": 6 * 3600,
+}
+DEFAULT_TTL = 300
+# How long past its TTL an entry may still be served while it is refreshed,
+# as a multiple of that TTL
+STALE_FACTOR = 1.0
+MAX_ENTRIES = 10000
+# Budget for rendered bodies, kept apart from the entries so that bodies
+# embedding shared catalog objects can't grow memory without bound
+MAX_BODY_BYTES = 64 << 20
+
+
+class ResponseCache:
+    """Per-user cache of Spotify read responses with stale-while-revalidate
+
+    Entries are keyed by (user_id, endpoint, params). Fresh entries are served
+    as-is; stale ones are served immediately while a background fetch
+    replaces them. Writes call invalidate() to drop a user's affected entries.
+    get_or_render() also keeps the encoded response body of an entry, in a
+    separate LRU bounded by max_body_bytes, until the entry changes.
+    """
+
+    def __init__(
+        self,
+        ttls=None,
+        stale_factor=STALE_FACTOR,
+        max_entries=MAX_ENTRIES,
+        max_body_bytes=MAX_BODY_BYTES,
+    ):
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.stale_factor = stale_factor
+        self.max_entries = max_entries
+        self.max_body_bytes = max_body_bytes
+        # key -> (value, fresh_until, stale_until, generation)
+        self.entries = OrderedDict()
+        # key -> rendered body of the current entry for key
+        self.bodies = OrderedDict()
+        self.body_bytes = 0
+        # Bumped by invalidate(); entries from an older generation are ignored
+        self.generations = {}
+        # scope -> entries and in-flight fetches holding a generation for it.
+        # A scope's counter is dropped along with its last reference
+        self.refs = {}
+        self.flight = SingleFlight()
+        self.background = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def ttl_for(self, endpoint, params):
+        ttl = self.ttls.get(endpoint, DEFAULT_TTL)
+        if isinstance(ttl, dict):
+            ttl = ttl.get(params.get("time_range"), DEFAULT_TTL)
+        return ttl
+
+    def _key(self, user_id, endpoint, params):
+        return (user_id, endpoint, tuple(sorted(params.items())))
+
+    def _scopes(self, key):
+        user_id, endpoint, _ = key
+        return (user_id, (user_id, endpoint))
+
+    def _generation(self, key):
+        return tuple(self.generations.get(scope, 0) for scope in self._scopes(key))
+
+    def _retain(self, key):
+        for scope in self._scopes(key):
+            self.refs[scope] = self.refs.get(scope, 0) + 1
+
+    def _release(self, key):
+        for scope in self._scopes(key):
+            remaining = self.refs[scope] - 1
+            if remaining:
+                self.refs[scope] = remaining
+            else:
+                # Nothing holds an older generation, so the counter can restart
+                del self.refs[scope]
+                self.generations.pop(scope, None)
+
+    def _remove(self, key):
+        del self.entries[key]
+        self._release(key)
+        self._drop_body(key)
+
+    def _drop_body(self, key):
+        body = self.bodies.pop(key, None)
+        if body is not None:
+            self.body_bytes -= len(body)
+
+    def _store_body(self, key, body):
+        self._drop_body(key)
+        if len(body) > self.max_body_bytes:
+            return
+        self.bodies[key] = body
+        self.body_bytes += len(body)
+        while self.body_bytes > self.max_body_bytes:
+            self._drop_body(next(iter(self.bodies)))
+
+    def _store(self, key, value, ttl, generation):
+        """Store value under key; the caller's reference passes to the entry"""
+        now = time.monotonic()
+        stale_until = now + ttl * (1 + self.stale_factor)
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (value, now + ttl, stale_until, generation)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    async def _fetch(self, key, ttl, fetch):
+        # Capture the generation first so a write that lands mid-fetch wins
+        self._retain(key)
+        generation = self._generation(key)
+        stored = False
+        try:
+            value = await fetch()
+            if value is not None:
+                self._store(key, value, ttl, generation)
+                stored = True
+            return value
+        finally:
+            if not stored:
+                self._release(key)
+
+    def _revalidate(self, key, ttl, fetch):
+        task = asyncio.ensure_future(
+            self.flight.do(key, lambda: self._fetch(key, ttl, fetch))
+        )
+        # Hold a reference so the refresh isn't garbage collected mid-flight
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    async def get_or_fetch(self, user_id, endpoint, params, fetch):
+        """Return the cached response for this call, fetching it if needed"""
+        key = self._key(user_id, endpoint, params)
+        ttl = self.ttl_for(endpoint, params)
+        entry = self.entries.get(key)
+        now = time.monotonic()
+        if entry and entry[3] == self._generation(key):
+            value, fresh_until, stale_until = entry[:3]
+            if now < fresh_until:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return value
+            if now < stale_until:
+                self.stale_hits += 1
+                self._revalidate(key, ttl, fetch)
+                return value
+        if entry:
+            self._remove(key)
+
+        self.misses += 1
+        # Only misses are traced; hits return without awaiting anything
+        with span(f"response_cache.miss {endpoint}"):
+            return await self.flight.do(key, lambda: self._fetch(key, ttl, fetch))
+
+    async def get_or_render(self, user_id, endpoint, params, fetch, render):
+        """Like get_or_fetch, but return render(value), rendered once per entry
+
+        render(value) returns (body, cacheable). Cacheable bodies are kept
+        until the entry is replaced or dropped (or the body budget evicts
+        them), so later hits skip rendering.
+        """
+        value = await self.get_or_fetch(user_id, endpoint, params, fetch)
+        key = self._key(user_id, endpoint, params)
+        entry = self.entries.get(key)
+        body = self.bodies.get(key)
+        if body is not None and entry is not None and entry[0] is value:
+            self.bodies.move_to_end(key)
+            return body
+        body, cacheable = await render(value)
+        # The entry may have been refreshed or evicted while rendering
+        entry = self.entries.get(key)
+        if cacheable and body is not None and entry is not None and entry[0] is value:
+            self._store_body(key, body)
+        return body
+
+    def invalidate(self, user_id, endpoint=None):
+        """Drop a user's cached responses, optionally only for one endpoint"""
+        scope = user_id if endpoint is None else (user_id, endpoint)
+        # With no entry or fetch in flight for the scope there's nothing to drop
+        if scope in self.refs:
+            self.generations[scope] = self.generations.get(scope, 0) + 1
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "body_bytes": self.body_bytes,
+        }
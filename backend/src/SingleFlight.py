@@ -0,0 +1,26 @@
+import asyncio
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight call
+
+    The first caller for a key starts the work; everyone else arriving while it
+    is still running awaits the same result instead of repeating it.
+    """
+
+    def __init__(self):
+        self.inflight = {}
+
+    def _forget(self, key, task):
+        if self.inflight.get(key) is task:
+            del self.inflight[key]
+
+    async def do(self, key, fn):
+        """Run fn() for key unless a call for key is already in flight"""
+        task = self.inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self.inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # Shield so a cancelled waiter doesn't cancel the shared call
+        return await asyncio.shield(task)
@@ -1,42 +1,193 @@
 from dotenv import load_dotenv
-import os, base64, requests
+import os, asyncio, base64, httpx, orjson, time
+from collections import OrderedDict
+from src.SingleFlight import SingleFlight
+from src.QueryNormalizer import normalize_query
+from src.PlaylistIndex import PlaylistIndex
+from src.UpstreamScheduler import UpstreamScheduler
+from src.MetadataStore import MetadataStore
+from src.Models import Playlist, Profile, page_from_spotify, page_to_dict
+from src.Metrics import (
+    SPOTIFY_REQUEST_DURATION,
+    TOKEN_REFRESH_DURATION,
+    upstream_endpoint,
+)
+from src.Tracing import span, traced
 
 load_dotenv()
 
 SPOTIFY_GRANT_TYPE = "client_credentials"
-SPOTIFY_TOKEN_URL = "https://accounts.spotify.com/api/token"
+# Overridable so the app can run against a local stand-in (see bench/)
+SPOTIFY_API_URL = os.getenv("SPOTIFY_API_URL", "https://api.spotify.com/v1")
+SPOTIFY_ACCOUNTS_URL = os.getenv("SPOTIFY_ACCOUNTS_URL", "https://accounts.spotify.com")
+SPOTIFY_TOKEN_URL = f"{SPOTIFY_ACCOUNTS_URL}/api/token"
 SPOTIFY_CLIENT_ID = os.getenv("SPOT_CLIENT_ID")
 SPOTIFY_CLIENT_SECRET = os.getenv("SPOT_CLIENT_SEC")
 
 # Special username for Spotify service token
 SPOTIFY_SERVICE_USER = "_spotify_service_arox"
 
+# Service tokens live ~1 hour, cache them a minute less for safety
+SERVICE_TOKEN_TTL = 3540
+
+# Spotify accepts at most this many URIs per "add items to playlist" call
+PLAYLIST_ADD_BATCH_SIZE = 100
+
+# Cached responses that embed catalog objects: endpoint -> (kind, path to list).
+# These are cached as ID lists and hydrated from the shared MetadataStore.
+CATALOG_LISTS = {
+    "top_tracks": ("tracks", ("items",)),
+    "top_artists": ("artists", ("items",)),
+    "search": ("tracks", ("tracks", "items")),
+}
+
+# Upstream responses remembered by ETag for conditional GETs, bounded both
+# by count and by the size of the remembered response bodies
+SPOTIFY_ETAG_CACHE_ENTRIES = int(os.getenv("SPOTIFY_ETAG_CACHE_ENTRIES", "5000"))
+SPOTIFY_ETAG_CACHE_BYTES = int(os.getenv("SPOTIFY_ETAG_CACHE_BYTES", str(32 << 20)))
+
+# Connection pool sizing for the shared HTTP client
+SPOTIFY_MAX_CONNECTIONS = int(os.getenv("SPOTIFY_MAX_CONNECTIONS", "200"))
+SPOTIFY_MAX_KEEPALIVE = int(os.getenv("SPOTIFY_MAX_KEEPALIVE", "50"))
+SPOTIFY_TIMEOUT = float(os.getenv("SPOTIFY_TIMEOUT", "10"))
+
 # Handling spotify authentication
 auth_header = base64.b64encode(
     f"{SPOTIFY_CLIENT_ID}:{SPOTIFY_CLIENT_SECRET}".encode()
 ).decode()
 
 
+def _at(response, path):
+    for key in path:
+        response = response.get(key) or {}
+    return response or []
+
+
+class SpotifyPageError(Exception):
+    """Raised when a page of a paginated listing can't be fetched"""
+
+
+def create_http_client(**kwargs):
+    """Create a pooled, keep-alive HTTP/2 client for talking to Spotify"""
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=SPOTIFY_MAX_CONNECTIONS,
+            max_keepalive_connections=SPOTIFY_MAX_KEEPALIVE,
+        ),
+        timeout=SPOTIFY_TIMEOUT,
+        **kwargs,
+    )
+
+
 class SpotifyClient:
-    def __init__(self, access_cache):
-        self.base_url = "https://api.spotify.com/v1"
+    def __init__(
+        self,
+        access_cache,
+        http_client=None,
+        renewer=None,
+        response_cache=None,
+        search_cache=None,
+        scheduler=None,
+        metadata=None,
+    ):
+        self.base_url = SPOTIFY_API_URL
         self.headers = {
             "Authorization": f"Bearer ",
             "Content-Type": "application/json",
         }
         self.access_cache = access_cache
+        # One shared client so every call reuses pooled TLS connections
+        self.http = http_client or create_http_client()
+        # Paces every upstream call and retries 429s / transient failures
+        self.scheduler = scheduler or UpstreamScheduler()
+        # Concurrent service token fetches share one request per credential
+        self.token_flight = SingleFlight()
+        # Optional TokenRenewer that refreshes the service token before expiry
+        self.renewer = renewer
+        # Optional ResponseCache for per-user read endpoints
+        self.response_cache = response_cache
+        # Optional ResponseCache shared by all users for search results
+        self.search_cache = search_cache
+        # Playlist name -> id and playlist -> track URIs, for add_track_to_playlist
+        self.playlist_index = PlaylistIndex()
+        # Track/artist objects shared by every user's cached responses
+        self.metadata = metadata or MetadataStore()
+        # (url, params, user_id) -> (etag, decoded body, body size), for
+        # If-None-Match. Keyed by user rather than token, which rotates hourly
+        self.etags = OrderedDict()
+        self.etag_bytes = 0
+        self.not_modified = 0
+
+    async def aclose(self):
+        """Close the shared HTTP client and its pooled connections"""
+        await self.http.aclose()
+
+    async def _send(self, method, url, user_key=None, **kwargs):
+        """Send a request to Spotify through the rate-limit-aware scheduler"""
+        endpoint = upstream_endpoint(url)
+
+        async def attempt():
+            # Timed per attempt, so retried 429s and 5xxs show up on their own
+            start = time.perf_counter()
+            status = "error"
+            with span(f"spotify {method} {endpoint}") as attempt_span:
+                try:
+                    response = await self.http.request(method, url, **kwargs)
+                    status = str(response.status_code)
+                    return response
+                finally:
+                    attempt_span.set(status=status)
+                    SPOTIFY_REQUEST_DURATION.observe(
+                        time.perf_counter() - start, method, endpoint, status
+                    )
 
-    def get_token(self):
+        return await self.scheduler.send(
+            attempt,
+            user_key=user_key,
+            idempotent=method == "GET",
+        )
+
+    def _auth_headers(self, access_token):
+        return {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        }
+
+    async def get_token(self):
         """Get a valid service token, either from cache or fetch a new one"""
-        token = self.access_cache.get(SPOTIFY_SERVICE_USER)
+        token = await self.access_cache.get(SPOTIFY_SERVICE_USER)
         if token is None:
-            token = self._fetch_new_spotify_token()
-            if token:
-                # Cache the token with an expiration time (e.g., 3540 seconds) 3540 for safety
-                self.access_cache.set(SPOTIFY_SERVICE_USER, token, ex=3540)
+            token = await self.refresh_service_token()
+        return token
+
+    async def refresh_service_token(self):
+        """Fetch and cache a new service token, sharing any fetch in flight"""
+        return await self.token_flight.do(
+            SPOTIFY_CLIENT_ID, self._refresh_service_token
+        )
+
+    async def _refresh_service_token(self):
+        start = time.perf_counter()
+        token = await self._fetch_new_spotify_token()
+        TOKEN_REFRESH_DURATION.observe(
+            time.perf_counter() - start, "service", "ok" if token else "error"
+        )
+        if token:
+            # Cache the token with an expiration time (e.g., 3540 seconds) 3540 for safety
+            await self.access_cache.set(
+                SPOTIFY_SERVICE_USER, token, ex=SERVICE_TOKEN_TTL
+            )
+            if self.renewer:
+                self.renewer.schedule(
+                    SPOTIFY_SERVICE_USER,
+                    SERVICE_TOKEN_TTL,
+                    self.refresh_service_token,
+                    track_idle=False,
+                )
         return token
 
-    def _fetch_new_spotify_token(self):
+    async def _fetch_new_spotify_token(self):
         """Fetch a fresh service token from Spotify API"""
         headers = {
             "Authorization": f"Basic {auth_header}",
@@ -44,243 +195,529 @@ class SpotifyClient:
         }
         data = {"grant_type": SPOTIFY_GRANT_TYPE}
         try:
-            response = requests.post(SPOTIFY_TOKEN_URL, headers=headers, data=data)
+            response = await self._send(
+                "POST", SPOTIFY_TOKEN_URL, headers=headers, data=data
+            )
             if response.status_code == 200:
                 return response.json().get("access_token")
         except Exception as e:
             print(f"Error fetching Spotify token: {e}")
         return None
 
-    def fetch_user_profile(self, user_access_token):
-        """Fetch user profile using their access token"""
-        headers = {
-            "Authorization": f"Bearer {user_access_token}",
-            "Content-Type": "application/json",
-        }
+    async def _get_json(
+        self,
+        path,
+        access_token,
+        params=None,
+        what="data",
+        per_user=True,
+        etag_user=None,
+    ):
+        """GET a Spotify API path and return the decoded JSON, or None on failure
+
+        With etag_user set, the response's ETag is remembered for that user
+        and sent back as If-None-Match next time; a 304 then reuses the
+        remembered body.
+        """
         try:
-            response = requests.get(f"{self.base_url}/me", headers=headers)
+            # Pagination "next" links are already absolute URLs
+            url = path if path.startswith("http") else f"{self.base_url}{path}"
+            headers = self._auth_headers(access_token)
+            etag_key = None
+            remembered = None
+            if etag_user is not None:
+                etag_key = (url, tuple(sorted((params or {}).items())), etag_user)
+                remembered = self.etags.get(etag_key)
+                if remembered:
+                    headers["If-None-Match"] = remembered[0]
+            response = await self._send(
+                "GET",
+                url,
+                # The service token is app-wide, so it only counts against the app
+                user_key=access_token if per_user else None,
+                headers=headers,
+                params=params,
+            )
+            if response.status_code == 304 and remembered:
+                self.not_modified += 1
+                self.etags.move_to_end(etag_key)
+                return remembered[1]
             if response.status_code == 200:
-                return response.json()
+                data = response.json()
+                etag = response.headers.get("ETag")
+                if etag_key and etag:
+                    self._remember_etag(etag_key, etag, data, len(response.content))
+                return data
             else:
                 print(
-                    f"Error fetching profile: {response.status_code} - {response.text}"
+                    f"Error fetching {what}: {response.status_code} - {response.text}"
                 )
         except Exception as e:
-            print(f"Error fetching profile: {e}")
+            print(f"Error fetching {what}: {e}")
         return None
 
-    def fetch_top_tracks(self, user_access_token, time_range="short_term", limit=10):
-        """Fetch user's top tracks"""
-        headers = {
-            "Authorization": f"Bearer {user_access_token}",
-            "Content-Type": "application/json",
-        }
-        params = {"time_range": time_range, "limit": limit}
+    def _remember_etag(self, etag_key, etag, data, size):
+        previous = self.etags.pop(etag_key, None)
+        if previous:
+            self.etag_bytes -= previous[2]
+        if size > SPOTIFY_ETAG_CACHE_BYTES:
+            return
+        self.etags[etag_key] = (etag, data, size)
+        self.etag_bytes += size
+        while (
+            len(self.etags) > SPOTIFY_ETAG_CACHE_ENTRIES
+            or self.etag_bytes > SPOTIFY_ETAG_CACHE_BYTES
+        ):
+            self.etag_bytes -= self.etags.popitem(last=False)[1][2]
+
+    async def iter_pages(
+        self, path, access_token, params=None, what="data", etag_user=None
+    ):
+        """Yield the items of each page of a listing, following "next" links
+
+        The next page is requested while the caller is still consuming the
+        current one. Raises SpotifyPageError if any page can't be fetched.
+        """
+        page = await self._get_json(
+            path, access_token, params, what=what, etag_user=etag_user
+        )
+        next_page = None
+        try:
+            while page is not None:
+                next_url = page.get("next")
+                if next_url:
+                    next_page = asyncio.ensure_future(
+                        self._get_json(
+                            next_url, access_token, what=what, etag_user=etag_user
+                        )
+                    )
+                yield page.get("items", [])
+                if not next_url:
+                    return
+                page = await next_page
+                next_page = None
+        finally:
+            # The consumer went away mid-listing; don't leave a fetch running
+            if next_page is not None:
+                next_page.cancel()
+        raise SpotifyPageError(f"Unable to fetch {what}")
+
+    async def _get_all_items(
+        self, path, access_token, params=None, what="data", etag_user=None
+    ):
+        """Follow "next" links and return every item of a paged listing"""
+        items = []
+        pages = self.iter_pages(path, access_token, params, what, etag_user)
         try:
-            response = requests.get(
-                f"{self.base_url}/me/top/tracks", headers=headers, params=params
+            async for page_items in pages:
+                items.extend(page_items)
+        except SpotifyPageError:
+            return None
+        return items
+
+    def iter_user_playlists(self, user_access_token):
+        """Yield pages of every playlist the user has"""
+        return self.iter_pages(
+            "/me/playlists", user_access_token, {"limit": 50}, what="playlists"
+        )
+
+    def iter_playlist_tracks(self, user_access_token, playlist_id):
+        """Yield pages of every track item in a playlist"""
+        return self.iter_pages(
+            f"/playlists/{playlist_id}/tracks",
+            user_access_token,
+            {"limit": 100},
+            what="playlist tracks",
+        )
+
+    async def _cached(
+        self, cache, user_id, endpoint, params, fetch, serve=None, encoded=False
+    ):
+        """Read through a response cache and serve the cached value
+
+        fetch() returns the value to cache and serve(value) builds the
+        response from it. With encoded=True the response is returned as JSON
+        bytes, which the cache keeps in its size-bounded body LRU so hits
+        skip re-encoding. Catalog list entries themselves stay ID-only.
+        """
+        if endpoint in CATALOG_LISTS:
+            fetch, serve = self._catalog_refs(endpoint, fetch)
+        serve = serve or self._serve_as_is
+
+        async def render(value):
+            body, complete = await serve(value)
+            if body is None:
+                return None, False
+            return orjson.dumps(body), complete
+
+        if cache is None:
+            value = await fetch()
+            return (await render(value))[0] if encoded else (await serve(value))[0]
+        if encoded:
+            return await cache.get_or_render(user_id, endpoint, params, fetch, render)
+        value = await cache.get_or_fetch(user_id, endpoint, params, fetch)
+        return (await serve(value))[0]
+
+    def _user_cache(self, user_id):
+        """The per-user response cache, when enabled and the user is known"""
+        return self.response_cache if user_id is not None else None
+
+    @staticmethod
+    async def _serve_as_is(value):
+        return value, True
+
+    @staticmethod
+    async def _serve_model(value):
+        return (value.to_dict() if value else None), True
+
+    @staticmethod
+    async def _serve_page(value):
+        return page_to_dict(value), True
+
+    def _catalog_refs(self, endpoint, fetch):
+        """Cache only IDs for endpoint, with objects in the metadata store"""
+        kind, path = CATALOG_LISTS[endpoint]
+        lookup = self.fetch_tracks if kind == "tracks" else self.fetch_artists
+
+        async def fetch_refs():
+            return self.metadata.dehydrate(await fetch(), kind, path)
+
+        async def serve(refs):
+            response = await self.metadata.hydrate(refs, kind, lookup, path)
+            # Don't keep a body that's missing items we failed to look up
+            complete = response is None or len(_at(response, path)) == len(
+                _at(refs, path)
             )
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(
-                    f"Error fetching top tracks: {response.status_code} - {response.text}"
-                )
-        except Exception as e:
-            print(f"Error fetching top tracks: {e}")
-        return None
+            return response, complete
+
+        return fetch_refs, serve
+
+    @traced("spotify.catalog")
+    async def _fetch_catalog(self, kind, ids):
+        """Look up at most 50 tracks or artists by ID with the service token"""
+        token = await self.get_token()
+        if not token:
+            return None
+        response = await self._get_json(
+            f"/{kind}", token, {"ids": ",".join(ids)}, what=kind, per_user=False
+        )
+        return response.get(kind) if response else None
+
+    async def fetch_tracks(self, track_ids):
+        """Fetch up to 50 full track objects in one call"""
+        return await self._fetch_catalog("tracks", track_ids)
+
+    async def fetch_artists(self, artist_ids):
+        """Fetch up to 50 full artist objects in one call"""
+        return await self._fetch_catalog("artists", artist_ids)
+
+    async def get_tracks(self, track_ids):
+        """Return track dicts for any number of IDs, looking up only unknown ones"""
+        tracks = await self.metadata.get_many("tracks", track_ids, self.fetch_tracks)
+        return [track.to_dict() if track else None for track in tracks]
+
+    async def get_artists(self, artist_ids):
+        """Return artist dicts for any number of IDs, looking up only unknown ones"""
+        artists = await self.metadata.get_many(
+            "artists", artist_ids, self.fetch_artists
+        )
+        return [artist.to_dict() if artist else None for artist in artists]
 
-    def fetch_top_artists(self, user_access_token, time_range="short_term", limit=10):
+    async def fetch_user_profile(self, user_access_token, user_id=None, encoded=False):
+        """Fetch user profile using their access token"""
+
+        async def fetch():
+            profile = await self._get_json("/me", user_access_token, what="profile")
+            return Profile.from_spotify(profile) if profile else None
+
+        return await self._cached(
+            self._user_cache(user_id),
+            user_id,
+            "profile",
+            {},
+            fetch,
+            self._serve_model,
+            encoded,
+        )
+
+    async def fetch_top_tracks(
+        self,
+        user_access_token,
+        time_range="short_term",
+        limit=10,
+        user_id=None,
+        encoded=False,
+    ):
+        """Fetch user's top tracks"""
+        params = {"time_range": time_range, "limit": limit}
+        return await self._cached(
+            self._user_cache(user_id),
+            user_id,
+            "top_tracks",
+            params,
+            lambda: self._get_json(
+                "/me/top/tracks", user_access_token, params, what="top tracks"
+            ),
+            encoded=encoded,
+        )
+
+    async def fetch_top_artists(
+        self,
+        user_access_token,
+        time_range="short_term",
+        limit=10,
+        user_id=None,
+        encoded=False,
+    ):
         """Fetch user's top artists"""
-        headers = {
-            "Authorization": f"Bearer {user_access_token}",
-            "Content-Type": "application/json",
-        }
         params = {"time_range": time_range, "limit": limit}
-        try:
-            response = requests.get(
-                f"{self.base_url}/me/top/artists", headers=headers, params=params
-            )
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(
-                    f"Error fetching top artists: {response.status_code} - {response.text}"
-                )
-        except Exception as e:
-            print(f"Error fetching top artists: {e}")
-        return None
+        return await self._cached(
+            self._user_cache(user_id),
+            user_id,
+            "top_artists",
+            params,
+            lambda: self._get_json(
+                "/me/top/artists", user_access_token, params, what="top artists"
+            ),
+            encoded=encoded,
+        )
 
-    def fetch_recently_played(self, user_access_token, limit=20):
-        """Fetch user's recently played tracks"""
-        headers = {
-            "Authorization": f"Bearer {user_access_token}",
-            "Content-Type": "application/json",
-        }
+    async def fetch_recently_played(self, user_access_token, limit=20, after=None):
+        """Fetch user's recently played tracks, optionally only those after a cursor"""
         params = {"limit": limit}
-        try:
-            response = requests.get(
-                f"{self.base_url}/me/player/recently-played",
-                headers=headers,
-                params=params,
-            )
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(
-                    f"Error fetching recently played: {response.status_code} - {response.text}"
-                )
-        except Exception as e:
-            print(f"Error fetching recently played: {e}")
-        return None
+        if after is not None:
+            params["after"] = after
+        return await self._get_json(
+            "/me/player/recently-played",
+            user_access_token,
+            params,
+            what="recently played",
+        )
 
     """
     Example usage:
     spotify_client = SpotifyClient(access_cache)
-    results = spotify_client.search_tracks("Imagine Dragons", limit=5)
+    results = await spotify_client.search_tracks("Imagine Dragons", limit=5)
     """
 
-    def search_tracks(self, query, limit=20):
+    async def search_tracks(self, query, limit=20, encoded=False):
         """Search for tracks using service token (no user auth needed)"""
-        token = self.get_token()
+        # Near-identical video titles share one upstream query and cache entry
+        params = {"q": normalize_query(query), "type": "track", "limit": limit}
+        return await self._cached(
+            self.search_cache,
+            None,
+            "search",
+            params,
+            lambda: self._search(params),
+            encoded=encoded,
+        )
+
+    async def _search(self, params):
+        token = await self.get_token()
         if token:
-            headers = {
-                "Authorization": f"Bearer {token}",
-                "Content-Type": "application/json",
-            }
-            params = {"q": query, "type": "track", "limit": limit}
-            try:
-                response = requests.get(
-                    f"{self.base_url}/search", headers=headers, params=params
-                )
-                if response.status_code == 200:
-                    return response.json()
-            except Exception as e:
-                print(f"Error searching tracks: {e}")
+            return await self._get_json(
+                "/search", token, params, what="search", per_user=False
+            )
         return None
 
     # Get playlists
-    def fetch_user_playlists(self, user_access_token, limit=20):
+    async def fetch_user_playlists(
+        self, user_access_token, limit=20, user_id=None, encoded=False
+    ):
         """Fetch user's playlists"""
-        headers = {
-            "Authorization": f"Bearer {user_access_token}",
-            "Content-Type": "application/json",
-        }
         params = {"limit": limit}
-        try:
-            response = requests.get(
-                f"{self.base_url}/me/playlists", headers=headers, params=params
+
+        async def fetch():
+            page = await self._get_json(
+                "/me/playlists",
+                user_access_token,
+                params,
+                what="playlists",
+                etag_user=user_id,
             )
-            if response.status_code == 200:
-                return response.json()
-            else:
-                print(
-                    f"Error fetching playlists: {response.status_code} - {response.text}"
-                )
-        except Exception as e:
-            print(f"Error fetching playlists: {e}")
-        return None
+            return page_from_spotify(page, Playlist)
 
-    def fetch_playlist_tracks(self, user_access_token, playlist_id, limit=100):
-        """Fetch tracks in a specific playlist"""
-        headers = {
-            "Authorization": f"Bearer {user_access_token}",
-            "Content-Type": "application/json",
-        }
-        params = {"limit": limit}
-        try:
-            response = requests.get(
-                f"{self.base_url}/playlists/{playlist_id}/tracks",
-                headers=headers,
-                params=params,
+        return await self._cached(
+            self._user_cache(user_id),
+            user_id,
+            "playlists",
+            params,
+            fetch,
+            self._serve_page,
+            encoded,
+        )
+
+    @traced("spotify.playlist_index")
+    async def _playlist_index(self, user_access_token, user_id):
+        """Return the user's {name: playlist_id} map, building it on first use"""
+        playlists = self.playlist_index.get_playlists(user_id)
+        if playlists is None:
+            items = await self._get_all_items(
+                "/me/playlists",
+                user_access_token,
+                {"limit": 50},
+                what="playlists",
+                etag_user=user_id,
             )
-            if response.status_code == 200:
-                items = response.json().get("items", [])
-                track_uris = [
-                    item["track"]["uri"] for item in items if item.get("track")
-                ]
-                return track_uris
-            else:
-                print(
-                    f"Error fetching playlist tracks: {response.status_code} - {response.text}"
-                )
-        except Exception as e:
-            print(f"Error fetching playlist tracks: {e}")
+            if items is None:
+                return None
+            playlists = {}
+            for playlist in items:
+                # Keep the first match, like Spotify's own listing order
+                playlists.setdefault(playlist["name"], playlist["id"])
+            self.playlist_index.set_playlists(user_id, playlists)
+        return playlists
+
+    @traced("spotify.playlist_track_uris")
+    async def _playlist_track_uris(self, user_access_token, user_id, playlist_id):
+        """Return the set of track URIs in a playlist, building it on first use"""
+        track_uris = self.playlist_index.get_tracks(playlist_id)
+        if track_uris is None:
+            params = {"limit": 100, "fields": "items(track(uri)),next"}
+            items = await self._get_all_items(
+                f"/playlists/{playlist_id}/tracks",
+                user_access_token,
+                params,
+                what="playlist tracks",
+                etag_user=user_id,
+            )
+            if items is None:
+                return None
+            track_uris = {item["track"]["uri"] for item in items if item.get("track")}
+            self.playlist_index.set_tracks(playlist_id, track_uris)
+        return track_uris
+
+    async def _create_playlist(self, user_access_token, user_id, playlist_name):
+        create_payload = {
+            "name": playlist_name,
+            "description": "Playlist created via API",
+            "public": False,
+        }
+        create_response = await self._send(
+            "POST",
+            f"{self.base_url}/users/{user_id}/playlists",
+            user_key=user_access_token,
+            headers=self._auth_headers(user_access_token),
+            json=create_payload,
+        )
+        if create_response.status_code == 201:
+            playlist_id = create_response.json().get("id")
+            self.playlist_index.add_playlist(user_id, playlist_name, playlist_id)
+            return playlist_id
+        print(
+            f"Error creating playlist: {create_response.status_code} - {create_response.text}"
+        )
         return None
 
     # Add track to playlist called playlist_name, create if doesn't exist. If track exists, do nothing
-    def add_track_to_playlist(self, user_access_token, playlist_name, track_uri):
+    @traced("spotify.add_track_to_playlist")
+    async def add_track_to_playlist(
+        self, user_access_token, playlist_name, track_uri, user_id=None
+    ):
         """Add a track to a user's playlist, creating the playlist if it doesn't exist"""
-        headers = {
-            "Authorization": f"Bearer {user_access_token}",
-            "Content-Type": "application/json",
-        }
+        results = await self.add_tracks_to_playlist(
+            user_access_token, playlist_name, [track_uri], user_id=user_id
+        )
+        return results.get(track_uri) in ("added", "duplicate")
 
-        # Step 1: Check if the playlist exists
-        params = {"limit": 50}  # Fetch up to 50 playlists
+    @traced("spotify.add_tracks_to_playlist")
+    async def add_tracks_to_playlist(
+        self, user_access_token, playlist_name, track_uris, user_id=None
+    ):
+        """Add many tracks to a user's playlist, creating it if it doesn't exist
+
+        Returns a {track_uri: "added" | "duplicate" | "failed"} map.
+        """
+        # Dedupe the request itself, keeping the caller's order
+        track_uris = list(dict.fromkeys(track_uris))
+        results = None
         try:
-            response = requests.get(
-                f"{self.base_url}/me/playlists", headers=headers, params=params
+            if user_id is None:
+                user_profile = await self.fetch_user_profile(user_access_token)
+                if not user_profile:
+                    print("Error fetching user profile to add tracks")
+                    return dict.fromkeys(track_uris, "failed")
+                user_id = user_profile["id"]
+
+            results = await self._add_tracks_to_playlist(
+                user_access_token, user_id, playlist_name, track_uris
             )
-            if response.status_code == 200:
-                playlists = response.json().get("items", [])
-                playlist_id = None
-                for playlist in playlists:
-                    if playlist["name"] == playlist_name:
-                        playlist_id = playlist["id"]
-                        break
-
-                # Step 2: If the playlist doesn't exist, create it
-                if not playlist_id:
-                    user_profile = self.fetch_user_profile(user_access_token)
-                    if not user_profile:
-                        print("Error fetching user profile to create playlist")
-                        return False
-                    user_id = user_profile["id"]
-                    create_payload = {
-                        "name": playlist_name,
-                        "description": "Playlist created via API",
-                        "public": False,
-                    }
-                    create_response = requests.post(
-                        f"{self.base_url}/users/{user_id}/playlists",
-                        headers=headers,
-                        json=create_payload,
-                    )
-                    if create_response.status_code == 201:
-                        playlist_id = create_response.json().get("id")
-                    else:
-                        print(
-                            f"Error creating playlist: {create_response.status_code} - {create_response.text}"
-                        )
-                        return False
+            if results is None:
+                # The playlist was deleted or renamed outside the app; rebuild once
+                results = await self._add_tracks_to_playlist(
+                    user_access_token, user_id, playlist_name, track_uris
+                )
+        except Exception as e:
+            print(f"Error adding tracks to playlist: {e}")
 
-                # Step 3: Add the track to the playlist
+        if results is None:
+            return dict.fromkeys(track_uris, "failed")
+        if "added" in results.values() and self.response_cache:
+            # The user's playlist listing (track counts, new playlist) changed
+            self.response_cache.invalidate(user_id, "playlists")
+        return results
 
-                # Step 3.5: Make sure track is not already in playlist
-                existing_tracks = self.fetch_playlist_tracks(
-                    user_access_token, playlist_id
-                )
-                if existing_tracks and track_uri in existing_tracks:
-                    print("Track is already in the playlist")
-                    return True
+    async def _add_tracks_to_playlist(
+        self, user_access_token, user_id, playlist_name, track_uris
+    ):
+        """Returns per-URI results, or None if the indexed playlist no longer exists"""
+        failed = dict.fromkeys(track_uris, "failed")
 
-                add_payload = {"uris": [track_uri]}
-                add_response = requests.post(
-                    f"{self.base_url}/playlists/{playlist_id}/tracks",
-                    headers=headers,
-                    json=add_payload,
-                )
-                if add_response.status_code == 201:
-                    return True
-                else:
-                    print(
-                        f"Error adding track to playlist: {add_response.status_code} - {add_response.text}"
-                    )
+        # Step 1: Look the playlist up in the user's index
+        playlists = await self._playlist_index(user_access_token, user_id)
+        if playlists is None:
+            return failed
+        playlist_id = playlists.get(playlist_name)
+
+        # Step 2: If the playlist doesn't exist, create it
+        if not playlist_id:
+            playlist_id = await self._create_playlist(
+                user_access_token, user_id, playlist_name
+            )
+            if not playlist_id:
+                return failed
+
+        # Step 3: Skip tracks that are already in the playlist
+        existing_tracks = await self._playlist_track_uris(
+            user_access_token, user_id, playlist_id
+        )
+        if existing_tracks is None:
+            self.playlist_index.forget(user_id, playlist_id)
+            return None
+        results = {}
+        new_uris = []
+        for track_uri in track_uris:
+            if track_uri in existing_tracks:
+                results[track_uri] = "duplicate"
             else:
-                print(
-                    f"Error fetching playlists: {response.status_code} - {response.text}"
+                new_uris.append(track_uri)
+
+        # Step 4: Add the rest in batches of the most Spotify accepts per call
+        for i in range(0, len(new_uris), PLAYLIST_ADD_BATCH_SIZE):
+            batch = new_uris[i : i + PLAYLIST_ADD_BATCH_SIZE]
+            try:
+                add_response = await self._send(
+                    "POST",
+                    f"{self.base_url}/playlists/{playlist_id}/tracks",
+                    user_key=user_access_token,
+                    headers=self._auth_headers(user_access_token),
+                    json={"uris": batch},
                 )
-        except Exception as e:
-            print(f"Error adding track to playlist: {e}")
-        return False
+            except Exception as e:
+                # Earlier batches are already in the playlist; only this one failed
+                print(f"Error adding tracks to playlist: {e}")
+                results.update(dict.fromkeys(batch, "failed"))
+                continue
+            if add_response.status_code == 201:
+                self.playlist_index.add_tracks(playlist_id, batch)
+                results.update(dict.fromkeys(batch, "added"))
+                continue
+            print(
+                f"Error adding tracks to playlist: {add_response.status_code} - {add_response.text}"
+            )
+            if add_response.status_code == 404 and i == 0:
+                self.playlist_index.forget(user_id, playlist_id)
+                return None
+            results.update(dict.fromkeys(batch, "failed"))
+        return results
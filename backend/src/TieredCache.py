@@ -0,0 +1,192 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+from src.CacheBackend import CacheBackend
+from src.Metrics import CACHE_KEYS, CACHE_OPERATION_DURATION
+from src.Tracing import span
+import os
+import sys
+import time
+
+load_dotenv()
+
+L1_CACHE_MAX_ENTRIES = int(os.getenv("L1_CACHE_MAX_ENTRIES", "10000"))
+L1_CACHE_MAX_BYTES = int(os.getenv("L1_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Upper bound on how long a value may live locally, so a logout handled by
+# another worker is picked up here within this many seconds
+L1_CACHE_MAX_TTL = int(os.getenv("L1_CACHE_MAX_TTL", "300"))
+# Longest a value pulled up from L2 lives locally. It is also capped at the
+# key's remaining TTL in L2, so a local copy never outlives the shared one;
+# this bound is how long a delete on another worker can go unnoticed here
+L1_CACHE_FILL_TTL = int(os.getenv("L1_CACHE_FILL_TTL", "10"))
+
+# Rough per-entry bookkeeping cost (OrderedDict node + tuple)
+ENTRY_OVERHEAD = 120
+
+
+class TieredCache(CacheBackend):
+    """In-process LRU (L1) in front of a shared cache backend (L2)
+
+    Exposes the same async CacheBackend interface as the store it wraps.
+    Writes and deletes go through to the backend, reads are served locally
+    while the entry is still within the expiry it was stored with. Values
+    read from the backend are kept for fill_ttl at most, and never past
+    their remaining TTL in the backend.
+    """
+
+    def __init__(
+        self,
+        backend,
+        max_entries=L1_CACHE_MAX_ENTRIES,
+        max_bytes=L1_CACHE_MAX_BYTES,
+        max_ttl=L1_CACHE_MAX_TTL,
+        fill_ttl=L1_CACHE_FILL_TTL,
+    ):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self.fill_ttl = fill_ttl
+        # key -> (value, expires_at, size)
+        self.local = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _entry_size(self, key, value):
+        return sys.getsizeof(key) + sys.getsizeof(value) + ENTRY_OVERHEAD
+
+    def _remove(self, key):
+        entry = self.local.pop(key, None)
+        if entry:
+            self.size_bytes -= entry[2]
+
+    def _store(self, key, value, ex):
+        self._remove(key)
+        ttl = min(ex, self.max_ttl) if ex else self.max_ttl
+        if ttl <= 0:
+            return
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        self.local[key] = (value, time.monotonic() + ttl, size)
+        self.size_bytes += size
+        # Evict least recently used entries until we are back within budget
+        while len(self.local) > self.max_entries or self.size_bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self.local.popitem(last=False)
+            self.size_bytes -= evicted_size
+            self.evictions += 1
+
+    def _fill(self, key, value, ttl_left):
+        if value is not None:
+            fill_ttl = (
+                self.fill_ttl if ttl_left is None else min(ttl_left, self.fill_ttl)
+            )
+            self._store(key, value, fill_ttl)
+
+    def _get_local(self, key):
+        entry = self.local.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            self._remove(key)
+            return None
+        self.local.move_to_end(key)
+        return entry[0]
+
+    async def get(self, key: str):
+        start = time.perf_counter()
+        value = self._get_local(key)
+        if value is not None:
+            self.hits += 1
+            CACHE_KEYS.inc("local")
+            CACHE_OPERATION_DURATION.observe(
+                time.perf_counter() - start, "get", "local"
+            )
+            return value
+
+        self.misses += 1
+        with span("cache.get") as get_span:
+            [(value, ttl_left)] = await self.backend.mget_with_ttl([key])
+            result = "miss" if value is None else "hit"
+            get_span.set(result=result)
+        self._fill(key, value, ttl_left)
+        CACHE_KEYS.inc(result)
+        CACHE_OPERATION_DURATION.observe(time.perf_counter() - start, "get", result)
+        return value
+
+    async def set(self, key: str, value: str, ex: int = 3600):
+        with CACHE_OPERATION_DURATION.time("set", "ok"), span("cache.set"):
+            await self.backend.set(key, value, ex=ex)
+        self._store(key, value, ex)
+
+    async def delete(self, key: str):
+        self._remove(key)
+        with CACHE_OPERATION_DURATION.time("delete", "ok"), span("cache.delete"):
+            await self.backend.delete(key)
+
+    async def mget(self, keys):
+        start = time.perf_counter()
+        values = [self._get_local(key) for key in keys]
+        missing = [key for key, value in zip(keys, values) if value is None]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        CACHE_KEYS.inc("local", amount=len(keys) - len(missing))
+        if missing:
+            with span("cache.mget", keys=len(missing)):
+                replies = await self.backend.mget_with_ttl(missing)
+            fetched = {}
+            for key, (value, ttl_left) in zip(missing, replies):
+                fetched[key] = value
+                self._fill(key, value, ttl_left)
+            found = sum(value is not None for value in fetched.values())
+            CACHE_KEYS.inc("hit", amount=found)
+            CACHE_KEYS.inc("miss", amount=len(missing) - found)
+            values = [
+                fetched[key] if value is None else value
+                for key, value in zip(keys, values)
+            ]
+        result = "local" if not missing else "ok"
+        CACHE_OPERATION_DURATION.observe(time.perf_counter() - start, "mget", result)
+        return values
+
+    async def mset(self, values, ex=3600):
+        with CACHE_OPERATION_DURATION.time("mset", "ok"), span("cache.mset"):
+            await self.backend.mset(values, ex=ex)
+        for key, value in values.items():
+            self._store(key, value, ex[key] if isinstance(ex, dict) else ex)
+
+    async def delete_many(self, keys):
+        for key in keys:
+            self._remove(key)
+        with CACHE_OPERATION_DURATION.time("delete_many", "ok"), span(
+            "cache.delete_many"
+        ):
+            await self.backend.delete_many(keys)
+
+    def scan_iter(self, match="*", count=None):
+        return self.backend.scan_iter(match, count)
+
+    async def flush_all(self):
+        self.local.clear()
+        self.size_bytes = 0
+        await self.backend.flush_all()
+
+    async def get_all(self):
+        return await self.backend.get_all()
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self):
+        """Hit/miss counters and current L1 occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self.local),
+            "bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+        }
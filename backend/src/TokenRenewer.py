@@ -0,0 +1,120 @@
+from dotenv import load_dotenv
+import asyncio
+import heapq
+import os
+import time
+
+load_dotenv()
+
+# Renew this many seconds before a token's cache entry expires
+TOKEN_RENEW_LEAD_TIME = int(os.getenv("TOKEN_RENEW_LEAD_TIME", "300"))
+# Stop renewing user tokens that haven't been used for this long
+TOKEN_RENEW_IDLE_TIMEOUT = int(os.getenv("TOKEN_RENEW_IDLE_TIMEOUT", "1800"))
+
+
+class TokenRenewer:
+    """Background scheduler that renews tokens shortly before they expire
+
+    Tokens are registered with schedule() when they are stored. A min-heap
+    ordered by renewal time acts as the expiry index, so the loop only ever
+    looks at the next token due rather than scanning the cache.
+    """
+
+    def __init__(
+        self, lead_time=TOKEN_RENEW_LEAD_TIME, idle_timeout=TOKEN_RENEW_IDLE_TIMEOUT
+    ):
+        self.lead_time = lead_time
+        self.idle_timeout = idle_timeout
+        # (renew_at, key) - stale heap entries are skipped when popped
+        self.heap = []
+        # key -> (renew_at, renew_fn, track_idle)
+        self.entries = {}
+        # key -> last use, only for keys with a scheduled renewal
+        self.last_seen = {}
+        self.task = None
+        # Created by start() so it belongs to the loop that runs the scheduler
+        self.wakeup = None
+
+    def schedule(self, key, ttl, renew_fn, track_idle=True):
+        """Register renew_fn to run lead_time seconds before ttl runs out"""
+        renew_at = time.time() + max(ttl - self.lead_time, 0)
+        self.entries[key] = (renew_at, renew_fn, track_idle)
+        self.last_seen.setdefault(key, time.monotonic())
+        heapq.heappush(self.heap, (renew_at, key))
+        if self.wakeup:
+            self.wakeup.set()
+
+    def touch(self, key):
+        """Mark key as in use so its token keeps getting renewed"""
+        # Unscheduled keys are ignored, so every caller can't grow last_seen
+        if key in self.entries:
+            self.last_seen[key] = time.monotonic()
+
+    def cancel(self, key):
+        self.entries.pop(key, None)
+        self.last_seen.pop(key, None)
+
+    def _is_idle(self, key):
+        last_seen = self.last_seen.get(key, 0)
+        return time.monotonic() - last_seen > self.idle_timeout
+
+    def _pop_due(self):
+        """Pop every entry whose renewal time has passed"""
+        due = []
+        now = time.time()
+        while self.heap and self.heap[0][0] <= now:
+            renew_at, key = heapq.heappop(self.heap)
+            entry = self.entries.get(key)
+            # Skip entries that were cancelled or rescheduled since
+            if entry is None or entry[0] != renew_at:
+                continue
+            del self.entries[key]
+            due.append((key, entry))
+        return due
+
+    async def _renew(self, key, renew_fn):
+        try:
+            if not await renew_fn():
+                print(f"Token renewal failed for {key}")
+        except Exception as e:
+            print(f"Error renewing token for {key}: {e}")
+
+    async def run_pending(self):
+        """Renew every token that is due, skipping idle users"""
+        renewals = []
+        due = self._pop_due()
+        for key, (_, renew_fn, track_idle) in due:
+            if track_idle and self._is_idle(key):
+                continue
+            renewals.append(self._renew(key, renew_fn))
+        if renewals:
+            await asyncio.gather(*renewals)
+        for key, _ in due:
+            # Skipped or failed renewals leave nothing scheduled for the key
+            if key not in self.entries:
+                self.last_seen.pop(key, None)
+
+    async def run(self):
+        while True:
+            await self.run_pending()
+            timeout = self.heap[0][0] - time.time() if self.heap else None
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+            self.wakeup = None
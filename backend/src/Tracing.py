@@ -0,0 +1,150 @@
+from contextvars import ContextVar
+from dotenv import load_dotenv
+import functools
+import os
+import time
+
+load_dotenv()
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+# Requests slower than this get their waterfall logged; 0 logs every request
+TRACE_LOG_THRESHOLD_MS = float(os.getenv("TRACE_LOG_THRESHOLD_MS", "1000"))
+# Spans kept per request, so a huge export can't grow a trace without bound
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+
+_trace = ContextVar("trace", default=None)
+_span = ContextVar("span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "name", "parent", "depth", "attrs", "start", "end", "token")
+
+    def __init__(self, trace, name, parent, attrs):
+        self.trace = trace
+        self.name = name
+        self.parent = parent
+        self.depth = parent.depth + 1 if parent else 0
+        self.attrs = attrs
+        self.start = None
+        self.end = None
+        self.token = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    @property
+    def duration(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.token = _span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.attrs.setdefault("error", exc_type.__name__)
+        _span.reset(self.token)
+        self.trace.add(self)
+        return False
+
+
+class _NoopSpan:
+    """Stands in for a span when the current request isn't traced"""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    """Spans recorded for one request, rendered as a timing waterfall
+
+    The trace and the open span live in context variables, so spans opened
+    in tasks spawned by the request (gather, pagination prefetch) still land
+    in its trace, nested under whichever span spawned them.
+    """
+
+    def __init__(self, request_id, max_spans=TRACE_MAX_SPANS):
+        self.request_id = request_id
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped = 0
+
+    def add(self, span):
+        if len(self.spans) < self.max_spans:
+            self.spans.append(span)
+        else:
+            self.dropped += 1
+
+    def waterfall(self):
+        """Spans in start order, as offset/duration lines indented by depth"""
+        spans = sorted(self.spans, key=lambda span: span.start)
+        if not spans:
+            return f"[{self.request_id}] no spans"
+        origin = spans[0].start
+        lines = [f"[{self.request_id}] trace, {len(spans)} spans"]
+        for span in spans:
+            attrs = " ".join(f"{key}={value}" for key, value in span.attrs.items())
+            lines.append(
+                f"[{self.request_id}] {(span.start - origin) * 1000:9.1f}ms "
+                f"{span.duration * 1000:9.1f}ms {'  ' * span.depth}{span.name} {attrs}".rstrip()
+            )
+        if self.dropped:
+            lines.append(f"[{self.request_id}] {self.dropped} more spans dropped")
+        return "\n".join(lines)
+
+
+def start_trace(request_id):
+    """Begin tracing the current request; returns a token for end_trace()"""
+    return _trace.set(Trace(request_id))
+
+
+def end_trace(token):
+    trace = _trace.get()
+    _trace.reset(token)
+    return trace
+
+
+def current_trace():
+    return _trace.get()
+
+
+def current_request_id():
+    trace = _trace.get()
+    return trace.request_id if trace else None
+
+
+def span(name, **attrs):
+    """Time a block as a child of the current span
+
+    Costs one context variable lookup when the request isn't traced.
+    """
+    trace = _trace.get()
+    if trace is None:
+        return NOOP_SPAN
+    return Span(trace, name, _span.get(), attrs)
+
+
+def traced(name):
+    """Decorator that runs an async function inside span(name)"""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
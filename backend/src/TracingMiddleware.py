@@ -0,0 +1,124 @@
+from starlette.datastructures import Headers, MutableHeaders
+from dotenv import load_dotenv
+from src.Tracing import (
+    TRACE_LOG_THRESHOLD_MS,
+    end_trace,
+    span,
+    start_trace,
+)
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import uuid
+
+load_dotenv()
+
+# Profiling is off unless a token is configured; a request opts in by sending
+# it in X-Profile, so clients can't make the server profile at will
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+# Fraction of requests profiled without the header (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Where .prof dumps go (open with snakeviz or pstats); unset only logs a summary
+PROFILE_DIR = os.getenv("PROFILE_DIR")
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "25"))
+
+# Incoming request IDs are echoed into logs, so only accept plain tokens
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+
+def request_id_from(headers):
+    request_id = headers.get("x-request-id")
+    if request_id and REQUEST_ID_PATTERN.match(request_id):
+        return request_id
+    return uuid.uuid4().hex
+
+
+class Profiler:
+    """cProfile for one request at a time
+
+    cProfile hooks the whole thread, so while a request is profiled the
+    dump also includes whatever other requests the event loop ran
+    meanwhile. Only one request is profiled at once for the same reason.
+    """
+
+    def __init__(
+        self,
+        token=PROFILE_TOKEN,
+        sample_rate=PROFILE_SAMPLE_RATE,
+        output_dir=PROFILE_DIR,
+        top_n=PROFILE_TOP_N,
+    ):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.top_n = top_n
+        self.active = None
+
+    def wants(self, headers):
+        if self.active is not None:
+            return False
+        if self.token and headers.get("x-profile") == self.token:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def start(self):
+        self.active = cProfile.Profile()
+        self.active.enable()
+
+    def stop(self, request_id):
+        profiler, self.active = self.active, None
+        profiler.disable()
+        if self.output_dir:
+            os.makedirs(self.output_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.output_dir, f"{request_id}.prof"))
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats("cumulative").print_stats(self.top_n)
+        print(f"[{request_id}] profile\n{summary.getvalue()}")
+
+
+class TracingMiddleware:
+    """Trace each HTTP request and log a waterfall of its slow ones
+
+    The request ID comes from X-Request-ID (or is generated) and is returned
+    in the same header. The root span is labelled with the matched route;
+    spans opened below it (auth, cache, upstream) nest under it. Requests
+    slower than log_threshold_ms, and every profiled request, are logged.
+    """
+
+    def __init__(self, app, log_threshold_ms=TRACE_LOG_THRESHOLD_MS, profiler=None):
+        self.app = app
+        self.log_threshold_ms = log_threshold_ms
+        self.profiler = profiler or Profiler()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = Headers(scope=scope)
+        request_id = request_id_from(headers)
+        profiling = self.profiler.wants(headers)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(raw=message["headers"])["X-Request-ID"] = request_id
+                root.set(status=message["status"])
+            await send(message)
+
+        token = start_trace(request_id)
+        if profiling:
+            self.profiler.start()
+        try:
+            with span(f"{scope['method']} {scope['path']}") as root:
+                await self.app(scope, receive, send_with_request_id)
+        finally:
+            if profiling:
+                self.profiler.stop(request_id)
+            trace = end_trace(token)
+            route = scope.get("route")
+            if route is not None:
+                root.set(route=route.path)
+            if profiling or root.duration * 1000 >= self.log_threshold_ms:
+                print(trace.waterfall())
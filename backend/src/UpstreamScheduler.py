@@ -0,0 +1,211 @@
+from collections import OrderedDict
+from dotenv import load_dotenv
+from src.Tracing import span
+import asyncio
+import os
+import random
+import time
+
+load_dotenv()
+
+# Ceiling on requests per second (and burst size) for the app credential.
+# The app bucket only paces below this after Spotify answers with a 429
+SPOTIFY_APP_RATE = float(os.getenv("SPOTIFY_APP_RATE", "1000"))
+SPOTIFY_APP_BURST = float(os.getenv("SPOTIFY_APP_BURST", "1000"))
+# Floor the app rate is never cut below, however many 429s arrive
+SPOTIFY_APP_MIN_RATE = float(os.getenv("SPOTIFY_APP_MIN_RATE", "10"))
+# Requests per second (and burst size) allowed per user
+SPOTIFY_USER_RATE = float(os.getenv("SPOTIFY_USER_RATE", "5"))
+SPOTIFY_USER_BURST = float(os.getenv("SPOTIFY_USER_BURST", "10"))
+SPOTIFY_MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "3"))
+# Longest a request may wait for a slot (including retries) before giving up
+SPOTIFY_QUEUE_DEADLINE = float(os.getenv("SPOTIFY_QUEUE_DEADLINE", "5"))
+
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 4.0
+MAX_USER_BUCKETS = 10000
+# After a 429 the app rate is halved; each success then wins back this much
+APP_RATE_DECREASE = 0.5
+APP_RATE_RECOVERY = 0.1
+# 429s that arrive together count as one signal to slow down
+APP_RATE_DECREASE_INTERVAL = 1.0
+
+
+class UpstreamBusyError(Exception):
+    """Raised when a request can't get an upstream slot before its deadline"""
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        # Set from a 429's Retry-After; nothing is sent before this time
+        self.blocked_until = 0.0
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before using it"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Tokens may go negative: each waiter reserves the next free slot
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.blocked_until - now)
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1)
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """A token bucket whose rate backs off on 429s and creeps back on success
+
+    Spotify doesn't publish its app-wide limit, so rather than guessing one
+    the rate starts at max_rate, is halved (down to min_rate) when Spotify
+    throttles us, and recovers additively while requests succeed.
+    """
+
+    def __init__(self, max_rate, burst, min_rate):
+        super().__init__(max_rate, burst)
+        self.max_rate = max_rate
+        self.max_burst = burst
+        self.min_rate = min(min_rate, max_rate)
+        self.decreased_at = float("-inf")
+
+    def _set_rate(self, rate):
+        self.rate = rate
+        # Shrink the burst with the rate, so a throttled bucket can't dump
+        # a full burst the moment Retry-After runs out
+        self.burst = max(1.0, self.max_burst * rate / self.max_rate)
+        self.tokens = min(self.tokens, self.burst)
+
+    def throttle(self):
+        now = time.monotonic()
+        if now - self.decreased_at >= APP_RATE_DECREASE_INTERVAL:
+            self.decreased_at = now
+            self._set_rate(max(self.min_rate, self.rate * APP_RATE_DECREASE))
+
+    def recover(self):
+        if self.rate < self.max_rate:
+            self._set_rate(min(self.max_rate, self.rate + APP_RATE_RECOVERY))
+
+
+def parse_retry_after(value):
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class UpstreamScheduler:
+    """Paces Spotify requests and retries them on 429s and transient errors
+
+    Every request takes a token from the app bucket and, when a user key is
+    given, from that user's bucket. The app bucket is shared by every call
+    in the process, so instead of a fixed guess at Spotify's limit it runs
+    at app_rate (high enough not to pace a healthy process) until a 429
+    arrives, then halves its rate and wins it back as requests succeed. A
+    429 also blocks the app bucket for its Retry-After. 429s are retried
+    for any method, since Spotify did not process the request. 5xx and
+    transport errors are only retried for idempotent requests, with
+    exponential backoff and full jitter. A request that can't be sent
+    before its deadline raises UpstreamBusyError.
+    """
+
+    def __init__(
+        self,
+        app_rate=SPOTIFY_APP_RATE,
+        app_burst=SPOTIFY_APP_BURST,
+        app_min_rate=SPOTIFY_APP_MIN_RATE,
+        user_rate=SPOTIFY_USER_RATE,
+        user_burst=SPOTIFY_USER_BURST,
+        max_retries=SPOTIFY_MAX_RETRIES,
+        deadline=SPOTIFY_QUEUE_DEADLINE,
+    ):
+        self.app_bucket = AdaptiveTokenBucket(app_rate, app_burst, app_min_rate)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.user_buckets = OrderedDict()
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.throttled = 0
+        self.retries = 0
+        self.rejected = 0
+
+    def _user_bucket(self, user_key):
+        bucket = self.user_buckets.get(user_key)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self.user_buckets[user_key] = bucket
+            while len(self.user_buckets) > MAX_USER_BUCKETS:
+                self.user_buckets.popitem(last=False)
+        self.user_buckets.move_to_end(user_key)
+        return bucket
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+    async def _acquire(self, buckets, give_up_at):
+        wait = max(bucket.reserve() for bucket in buckets)
+        if time.monotonic() + wait > give_up_at:
+            for bucket in buckets:
+                bucket.refund()
+            self.rejected += 1
+            raise UpstreamBusyError("Spotify request queue deadline exceeded")
+        if wait > 0:
+            with span("spotify.rate_limit_wait"):
+                await asyncio.sleep(wait)
+
+    async def send(self, request_fn, user_key=None, idempotent=True):
+        """Run request_fn() once a slot is free, retrying where it is safe"""
+        buckets = [self.app_bucket]
+        if user_key is not None:
+            buckets.append(self._user_bucket(user_key))
+        give_up_at = time.monotonic() + self.deadline
+
+        attempt = 0
+        while True:
+            await self._acquire(buckets, give_up_at)
+            try:
+                response = await request_fn()
+            except Exception:
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                response = None
+
+            if response is not None and response.status_code == 429:
+                self.throttled += 1
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                self.app_bucket.throttle()
+                self.app_bucket.block(
+                    retry_after if retry_after is not None else self._backoff(attempt)
+                )
+            elif response is not None and (
+                response.status_code < 500 or not idempotent
+            ):
+                self.app_bucket.recover()
+                return response
+
+            if attempt >= self.max_retries:
+                return response
+            attempt += 1
+            self.retries += 1
+            if response is None or response.status_code >= 500:
+                delay = self._backoff(attempt)
+                if time.monotonic() + delay > give_up_at:
+                    if response is None:
+                        raise UpstreamBusyError("Spotify request deadline exceeded")
+                    return response
+                await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "app_rate": round(self.app_bucket.rate, 1),
+        }
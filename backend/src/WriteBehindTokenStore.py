@@ -0,0 +1,136 @@
+from dotenv import load_dotenv
+from datetime import datetime, timezone
+import asyncio
+import os
+
+load_dotenv()
+
+# How often buffered token writes are flushed to the durable store
+TOKEN_WRITE_BEHIND_INTERVAL = float(os.getenv("TOKEN_WRITE_BEHIND_INTERVAL", "1.0"))
+# Users per bulk write; a full batch is flushed without waiting for the interval
+TOKEN_WRITE_BEHIND_BATCH_SIZE = int(os.getenv("TOKEN_WRITE_BEHIND_BATCH_SIZE", "500"))
+
+
+class WriteBehindTokenStore:
+    """Buffers token writes in memory and persists them to Mongo in batches
+
+    The cache stays the hot path; this only keeps a durable copy so a flushed
+    or evicted cache can be refilled without sending users back through
+    OAuth. Writes for the same user are coalesced, so a burst of refreshes
+    costs one upsert. Reads check the buffer first, so a write is visible
+    before it has been flushed.
+    """
+
+    def __init__(
+        self,
+        store,
+        flush_interval=TOKEN_WRITE_BEHIND_INTERVAL,
+        batch_size=TOKEN_WRITE_BEHIND_BATCH_SIZE,
+    ):
+        # MongoDBClient, or anything with the same user token methods
+        self.store = store
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # user_id -> token doc, or None for a pending delete
+        self.pending = {}
+        # The batch being written, still readable until the write lands
+        self.flushing = {}
+        self.task = None
+        # Created by start() so they belong to the loop that runs the flusher
+        self.lock = None
+        self.wakeup = None
+
+    def put(self, user_id, token_doc):
+        self._queue(user_id, {**token_doc, "user_id": user_id})
+
+    def remove(self, user_id):
+        self._queue(user_id, None)
+
+    def _queue(self, user_id, token_doc):
+        self.pending[user_id] = token_doc
+        if self.wakeup and len(self.pending) >= self.batch_size:
+            self.wakeup.set()
+
+    def _buffered(self):
+        # Newer writes shadow the batch that is being flushed
+        return {**self.flushing, **self.pending}
+
+    async def get(self, user_id):
+        """Return the token doc for user_id, or None"""
+        buffered = self._buffered()
+        if user_id in buffered:
+            return buffered[user_id]
+        return await self.store.get_user_tokens(user_id)
+
+    async def find_by_access_token(self, access_token):
+        """Return the token doc an unexpired access token belongs to, or None"""
+        buffered = self._buffered()
+        now = datetime.now(timezone.utc)
+        for token_doc in buffered.values():
+            if token_doc and token_doc["access_token"] == access_token:
+                return token_doc if token_doc["access_expires_at"] > now else None
+        token_doc = await self.store.find_user_tokens_by_access_token(access_token)
+        # Ignore a stale copy of a user whose newer tokens haven't landed yet
+        if token_doc and token_doc["user_id"] in buffered:
+            return None
+        return token_doc
+
+    async def flush(self):
+        """Write every buffered change; failed batches are retried next flush"""
+        if self.lock is None:
+            # flush() may be called without start(), e.g. from a script
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if not self.pending and not self.flushing:
+                return True
+            # A batch left over from a cancelled flush goes out again too
+            self.flushing, self.pending = self._buffered(), {}
+            items = list(self.flushing.items())
+            ok = True
+            try:
+                for start in range(0, len(items), self.batch_size):
+                    batch = items[start : start + self.batch_size]
+                    upserts = [doc for _, doc in batch if doc is not None]
+                    deletes = [user_id for user_id, doc in batch if doc is None]
+                    if upserts:
+                        ok &= await self.store.upsert_user_tokens(upserts) is not None
+                    if deletes:
+                        ok &= await self.store.delete_user_tokens(deletes) is not None
+            except Exception as e:
+                print(f"Error flushing token writes: {e}")
+                ok = False
+            if not ok:
+                # Writes are idempotent, so requeue the lot behind newer ones
+                for user_id, token_doc in self.flushing.items():
+                    self.pending.setdefault(user_id, token_doc)
+            self.flushing = {}
+            return ok
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self.task is None:
+            self.lock = asyncio.Lock()
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Stop the flusher and write out whatever is still buffered"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+            self.wakeup = None
+        if not await self.flush():
+            print(f"Lost {len(self.pending)} buffered token writes on shutdown")
+        self.lock = None
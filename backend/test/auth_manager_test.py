@@ -0,0 +1,190 @@
+import asyncio
+import httpx
+from datetime import datetime, timedelta, timezone
+from AuthManager import AuthManager
+from WriteBehindTokenStore import WriteBehindTokenStore
+
+
+class MockCache:
+    def __init__(self):
+        self.store = {}
+        self.calls = 0
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+
+    async def delete(self, key):
+        self.store.pop(key, None)
+
+    async def mset(self, values, ex=None):
+        self.calls += 1
+        self.store.update(values)
+
+    async def delete_many(self, keys):
+        self.calls += 1
+        for key in keys:
+            self.store.pop(key, None)
+
+
+class MockStore:
+    def __init__(self):
+        self.docs = {}
+        self.lookups = 0
+
+    async def upsert_user_tokens(self, token_docs):
+        for doc in token_docs:
+            self.docs[doc["user_id"]] = doc
+        return len(token_docs)
+
+    async def get_user_tokens(self, user_id):
+        return self.docs.get(user_id)
+
+    async def find_user_tokens_by_access_token(self, access_token):
+        self.lookups += 1
+        for doc in self.docs.values():
+            if doc["access_token"] == access_token:
+                if doc["access_expires_at"] > datetime.now(timezone.utc):
+                    return doc
+        return None
+
+
+def test_concurrent_refreshes_are_coalesced():
+    token_requests = []
+
+    async def handler(request):
+        token_requests.append(request)
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json={"access_token": "fresh"})
+
+    async def run():
+        cache = MockCache()
+        cache.store["user:arox:refresh_token"] = "refresh"
+        auth_manager = AuthManager(
+            cache, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        return await asyncio.gather(
+            *(auth_manager.get_user_access_token("arox") for _ in range(20))
+        )
+
+    tokens = asyncio.run(run())
+    assert tokens == ["fresh"] * 20
+    assert len(token_requests) == 1
+
+
+def test_store_and_delete_are_single_writes():
+    async def run():
+        cache = MockCache()
+        auth_manager = AuthManager(cache, http_client=httpx.AsyncClient())
+        tokens = {"access_token": "abc", "refresh_token": "refresh"}
+        await auth_manager.store_user_tokens("arox", tokens)
+        stored = dict(cache.store)
+        await auth_manager.delete_user_tokens("arox")
+        return cache, stored
+
+    cache, stored = asyncio.run(run())
+    assert stored == {
+        "user:arox:access_token": "abc",
+        "user:arox:refresh_token": "refresh",
+        "token:abc": "arox",
+    }
+    assert cache.store == {}
+    assert cache.calls == 2
+
+
+def test_refreshed_tokens_verify():
+    async def handler(request):
+        return httpx.Response(200, json={"access_token": "fresh"})
+
+    async def run():
+        cache = MockCache()
+        cache.store["user:arox:refresh_token"] = "refresh"
+        auth_manager = AuthManager(
+            cache, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        await auth_manager.refresh_user_token("arox")
+        return await auth_manager.verify_user_token("fresh")
+
+    assert asyncio.run(run()) == "arox"
+
+
+def test_tokens_are_rehydrated_after_cache_loss():
+    token_requests = []
+
+    async def handler(request):
+        token_requests.append(request)
+        return httpx.Response(200, json={"access_token": "fresh"})
+
+    async def run():
+        cache = MockCache()
+        token_store = WriteBehindTokenStore(MockStore())
+        auth_manager = AuthManager(
+            cache,
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            token_store=token_store,
+        )
+        tokens = {"access_token": "abc", "refresh_token": "refresh"}
+        await auth_manager.store_user_tokens("arox", tokens)
+        await token_store.flush()
+        cache.store.clear()
+        user_id = await auth_manager.verify_user_token("abc")
+        access_token = await auth_manager.get_user_access_token("arox")
+        return user_id, access_token, cache.store
+
+    user_id, access_token, store = asyncio.run(run())
+    assert (user_id, access_token) == ("arox", "abc")
+    assert store["user:arox:refresh_token"] == "refresh"
+    # Nothing went back to Spotify for a token
+    assert token_requests == []
+
+
+def test_unknown_tokens_are_negatively_cached():
+    async def run():
+        cache = MockCache()
+        store = MockStore()
+        auth_manager = AuthManager(
+            cache,
+            http_client=httpx.AsyncClient(),
+            token_store=WriteBehindTokenStore(store),
+        )
+        results = [await auth_manager.verify_user_token("bogus") for _ in range(3)]
+        # A later login for the same token replaces the marker
+        await auth_manager.store_user_tokens(
+            "arox", {"access_token": "bogus", "refresh_token": "refresh"}
+        )
+        results.append(await auth_manager.verify_user_token("bogus"))
+        return results, store.lookups
+
+    results, lookups = asyncio.run(run())
+    assert results == [None, None, None, "arox"]
+    assert lookups == 1
+
+
+def test_expired_access_token_is_refreshed_from_durable_refresh_token():
+    async def handler(request):
+        assert b"refresh_token=refresh" in request.content
+        return httpx.Response(200, json={"access_token": "fresh"})
+
+    async def run():
+        store = MockStore()
+        now = datetime.now(timezone.utc)
+        store.docs["arox"] = {
+            "user_id": "arox",
+            "access_token": "abc",
+            "access_expires_at": now - timedelta(seconds=1),
+            "refresh_token": "refresh",
+            "expires_at": now + timedelta(days=30),
+        }
+        auth_manager = AuthManager(
+            MockCache(),
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            token_store=WriteBehindTokenStore(store),
+        )
+        return (
+            await auth_manager.verify_user_token("abc"),
+            await auth_manager.get_user_access_token("arox"),
+        )
+
+    assert asyncio.run(run()) == (None, "fresh")
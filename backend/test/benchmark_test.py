@@ -0,0 +1,58 @@
+from collections import Counter
+from bench.Benchmark import (
+    SCENARIOS,
+    compare,
+    median_run,
+    percentile,
+    render_path,
+    summarize,
+)
+
+
+def test_percentiles_use_nearest_rank():
+    values = [i / 1000 for i in range(1, 101)]
+    assert percentile(values, 50) == 0.05
+    assert percentile(values, 99) == 0.099
+    assert percentile([0.2], 95) == 0.2
+    assert percentile([], 95) == 0.0
+
+
+def test_summary_counts_errors_and_throughput():
+    stats = summarize([0.01] * 9 + [0.1], Counter({200: 9, 500: 1}), elapsed=2)
+    assert stats["requests"] == 10
+    assert stats["errors"] == 1
+    assert stats["throughput_rps"] == 5.0
+    assert stats["p50_ms"] == 10.0
+    assert stats["p99_ms"] == 100.0
+
+
+def test_compare_flags_only_real_regressions():
+    baseline = {
+        "profile": {"p50_ms": 10.0, "p95_ms": 20.0, "throughput_rps": 300, "errors": 0},
+        "search": {"p50_ms": 0.5, "p95_ms": 1.0, "throughput_rps": 500, "errors": 0},
+    }
+    results = {
+        "profile": {"p50_ms": 11.0, "p95_ms": 30.0, "throughput_rps": 200, "errors": 0},
+        # Doubled, but by a millisecond, so it's noise
+        "search": {"p50_ms": 1.0, "p95_ms": 2.0, "throughput_rps": 480, "errors": 0},
+    }
+    regressions = compare(results, baseline, tolerance=0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("profile: p95_ms 30.0 > 20.0")
+    assert regressions[1].startswith("profile: throughput_rps 200")
+
+
+def test_every_add_track_request_uses_a_new_uri():
+    path = dict((name, path) for name, _, path in SCENARIOS)["add_track"]
+    # Request numbers restart each run, URIs must not
+    uris = [render_path(path, i) for i in range(3)] + [render_path(path, 0)]
+    assert len(set(uris)) == 4
+
+
+def test_median_run_is_picked_by_throughput():
+    runs = [
+        {"throughput_rps": 100, "p95_ms": 5},
+        {"throughput_rps": 300, "p95_ms": 90},
+        {"throughput_rps": 200, "p95_ms": 50},
+    ]
+    assert median_run(runs)["throughput_rps"] == 200
@@ -0,0 +1,67 @@
+import gzip
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+from CompressionMiddleware import CompressionMiddleware, choose_encoding
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+
+@app.get("/small")
+async def small():
+    return PlainTextResponse("tiny")
+
+
+@app.get("/large")
+async def large():
+    return PlainTextResponse("spotify " * 200)
+
+
+@app.get("/stream")
+async def stream():
+    async def lines():
+        for i in range(3):
+            yield f'{{"line":{i}}}\n'.encode()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+client = TestClient(app)
+
+
+def raw_get(path, accept_encoding):
+    # Read the raw bytes so the test client doesn't decode them for us
+    with client.stream(
+        "GET", path, headers={"Accept-Encoding": accept_encoding}
+    ) as response:
+        return response, b"".join(response.iter_raw())
+
+
+def test_large_bodies_are_gzipped():
+    response, body = raw_get("/large", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) == len(body)
+    assert gzip.decompress(body) == ("spotify " * 200).encode()
+
+
+def test_small_bodies_and_identity_clients_are_left_alone():
+    response, body = raw_get("/small", "gzip")
+    assert "content-encoding" not in response.headers
+    assert body == b"tiny"
+    response, body = raw_get("/large", "identity")
+    assert "content-encoding" not in response.headers
+
+
+def test_streams_are_compressed_chunk_by_chunk():
+    response, body = raw_get("/stream", "gzip")
+    assert response.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(body) == b'{"line":0}\n{"line":1}\n{"line":2}\n'
+
+
+def test_choose_encoding_honours_q_values():
+    assert choose_encoding("gzip;q=0, deflate") is None
+    assert choose_encoding("deflate, *;q=0.5") == "br"
+    assert choose_encoding("gzip, br;q=0.9") == "gzip"
+    assert choose_encoding("") is None
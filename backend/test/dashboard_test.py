@@ -0,0 +1,78 @@
+import os
+
+# Keep the app offline and off the local databases
+os.environ.setdefault("CACHE_BACKEND", "memory")
+os.environ.setdefault("DB_URI", "")
+os.environ.setdefault("HISTORY_DB_PATH", ":memory:")
+os.environ.setdefault("ANALYTICS_DB_PATH", ":memory:")
+
+import orjson
+from fastapi.testclient import TestClient
+import main
+
+
+class StubAuthManager:
+    async def get_user_access_token(self, user_id):
+        return "token"
+
+
+class StubSpotifyClient:
+    """Returns pre-encoded sections like SpotifyClient(encoded=True) does"""
+
+    def __init__(self, failing=()):
+        self.failing = failing
+
+    async def _section(self, name, body):
+        if name in self.failing:
+            raise RuntimeError(f"{name} is down")
+        return orjson.dumps(body)
+
+    async def fetch_user_profile(self, user_token, user_id=None, encoded=False):
+        return await self._section(
+            "profile", {"id": user_id, "name": 'A "quoted" name'}
+        )
+
+    async def fetch_top_tracks(
+        self, user_token, time_range, limit, user_id=None, encoded=False
+    ):
+        return await self._section("top_tracks", {"items": [{"id": "t1"}]})
+
+    async def fetch_top_artists(
+        self, user_token, time_range, limit, user_id=None, encoded=False
+    ):
+        return await self._section("top_artists", {"items": [{"id": "a1"}]})
+
+
+def get_dashboard(monkeypatch, spotify_client):
+    monkeypatch.setattr(main, "auth_manager", StubAuthManager())
+    monkeypatch.setattr(main, "spotify_client", spotify_client)
+    main.app.dependency_overrides[main.get_current_user] = lambda: "arox"
+    try:
+        return TestClient(main.app).get("/spotify/dashboard")
+    finally:
+        main.app.dependency_overrides.clear()
+
+
+def test_dashboard_splices_sections_into_valid_json(monkeypatch):
+    response = get_dashboard(monkeypatch, StubSpotifyClient())
+    assert response.status_code == 200
+    assert response.json() == {
+        "profile": {
+            "data": {"id": "arox", "name": 'A "quoted" name'},
+            "error": None,
+        },
+        "top_tracks": {"data": {"items": [{"id": "t1"}]}, "error": None},
+        "top_artists": {"data": {"items": [{"id": "a1"}]}, "error": None},
+    }
+
+
+def test_failing_section_does_not_sink_the_dashboard(monkeypatch):
+    response = get_dashboard(monkeypatch, StubSpotifyClient(failing=("top_tracks",)))
+    assert response.status_code == 200
+    dashboard = response.json()
+    assert dashboard["top_tracks"] == {
+        "data": None,
+        "error": "Unable to fetch top_tracks",
+    }
+    assert dashboard["profile"]["data"]["id"] == "arox"
+    assert dashboard["top_artists"]["data"] == {"items": [{"id": "a1"}]}
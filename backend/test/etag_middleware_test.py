@@ -0,0 +1,59 @@
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from ETagMiddleware import ETagMiddleware, etag_matches
+
+app = FastAPI()
+app.add_middleware(ETagMiddleware)
+counter = {"version": 1}
+
+
+@app.get("/spotify/profile")
+async def profile():
+    return {"id": "arox", "version": counter["version"]}
+
+
+@app.get("/spotify/export")
+async def export():
+    async def lines():
+        yield b'{"id":"p1"}\n'
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.get("/auth/me")
+async def me():
+    return {"user_id": "arox"}
+
+
+client = TestClient(app)
+
+
+def test_unchanged_responses_get_304():
+    first = client.get("/spotify/profile")
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    second = client.get("/spotify/profile", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+
+
+def test_changed_responses_get_a_new_etag():
+    etag = client.get("/spotify/profile").headers["etag"]
+    counter["version"] += 1
+    response = client.get("/spotify/profile", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_other_routes_and_streams_are_untouched():
+    assert "etag" not in client.get("/auth/me").headers
+    assert "etag" not in client.get("/spotify/export").headers
+
+
+def test_etag_matching_is_weak():
+    assert etag_matches('"abc", W/"def"', 'W/"abc"')
+    assert etag_matches("*", 'W/"abc"')
+    assert not etag_matches('"abc"', 'W/"abcd"')
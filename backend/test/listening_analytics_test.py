@@ -0,0 +1,66 @@
+import asyncio
+import ListeningAnalytics as analytics_module
+from ListeningAnalytics import ListeningAnalytics, MS_PER_DAY, MS_PER_HOUR
+
+# 2025-01-06 (a Monday) at midnight UTC
+MONDAY = 20094 * MS_PER_DAY
+
+
+def test_plays_are_folded_incrementally(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_module, "now_ms", lambda: MONDAY + 41 * MS_PER_DAY)
+    analytics = ListeningAnalytics(str(tmp_path / "analytics.db"))
+    first_batch = [
+        (MONDAY + 9 * MS_PER_HOUR, "t1", "a1", 60000),
+        (MONDAY + 9 * MS_PER_HOUR + 1, "t2", "a1,a2", 60000),
+    ]
+    second_batch = [(MONDAY + 40 * MS_PER_DAY + 21 * MS_PER_HOUR, "t3", "a2", 60000)]
+
+    async def run():
+        await analytics.apply_plays("arox", first_batch)
+        await analytics.apply_plays("arox", second_batch)
+        return await analytics.get_summary("arox")
+
+    summary = asyncio.run(run())
+    assert summary["total_plays"] == 3
+    assert summary["total_minutes"] == 3.0
+    assert summary["hour_of_day"][9] == 2
+    assert summary["hour_of_day"][21] == 1
+    assert summary["day_of_week"][0] == 2
+    assert summary["top_artists_by_plays"]["all"] == [
+        {"id": "a1", "count": 2},
+        {"id": "a2", "count": 2},
+    ]
+    # The first batch is outside the trailing 30-day window
+    assert summary["top_artists_by_plays"]["30d"] == [{"id": "a2", "count": 1}]
+
+
+def test_trailing_windows_count_back_from_today(tmp_path, monkeypatch):
+    now = MONDAY + MS_PER_HOUR
+    monkeypatch.setattr(analytics_module, "now_ms", lambda: now)
+    analytics = ListeningAnalytics(str(tmp_path / "analytics.db"))
+    asyncio.run(analytics.apply_plays("arox", [(MONDAY, "t1", "a1", 60000)]))
+    assert asyncio.run(analytics.get_summary("arox"))["top_artists_by_plays"]["7d"] == [
+        {"id": "a1", "count": 1}
+    ]
+
+    # A month without listening empties the trailing windows, not "all"
+    now = MONDAY + 31 * MS_PER_DAY
+    windows = asyncio.run(analytics.get_summary("arox"))["top_artists_by_plays"]
+    assert windows["7d"] == []
+    assert windows["30d"] == []
+    assert windows["all"] == [{"id": "a1", "count": 1}]
+
+
+def test_top_lists_drive_genres_and_affinity(tmp_path):
+    analytics = ListeningAnalytics(str(tmp_path / "analytics.db"))
+    top_artists = {
+        "items": [
+            {"id": "a1", "genres": ["indie", "rock"]},
+            {"id": "a2", "genres": ["rock"]},
+        ]
+    }
+    top_tracks = {"items": [{"id": "t1", "artists": [{"id": "a2"}]}]}
+
+    summary = asyncio.run(analytics.apply_top_lists("arox", top_artists, top_tracks))
+    assert list(summary["genres"]) == ["rock", "indie"]
+    assert summary["artist_affinity"][0] == {"id": "a2", "score": 1.0}
@@ -0,0 +1,79 @@
+import asyncio
+from ListeningHistory import ListeningHistory, parse_played_at
+
+
+def play(minute, track_id):
+    return {
+        "played_at": f"2025-01-01T12:{minute:02d}:00.000Z",
+        "track": {"id": track_id, "artists": [{"id": "a1"}], "duration_ms": 1000},
+    }
+
+
+def test_sync_only_stores_new_plays(tmp_path):
+    history = ListeningHistory(str(tmp_path / "history.db"))
+    cursors = []
+    spotify_plays = [play(5, "t2"), play(1, "t1")]
+
+    async def fetch_page(after):
+        cursors.append(after)
+        items = [
+            p
+            for p in spotify_plays
+            if after is None or parse_played_at(p["played_at"]) > after
+        ]
+        return {"items": items}
+
+    async def run():
+        first = await history.sync("arox", fetch_page)
+        spotify_plays.insert(0, play(9, "t3"))
+        second = await history.sync("arox", fetch_page)
+        return first, second, await history.get_plays("arox")
+
+    first, second, plays = asyncio.run(run())
+    assert len(first) == 2
+    assert len(second) == 1
+    # The second sync asked only for plays after the newest one stored
+    assert cursors[1] == plays[1]["played_at"]
+    assert [p["track_id"] for p in plays] == ["t3", "t2", "t1"]
+
+
+def test_duplicate_plays_are_ignored(tmp_path):
+    history = ListeningHistory(str(tmp_path / "history.db"))
+    rows = [(1000, "t1", "a1", 1000), (2000, "t2", "a1", 1000)]
+
+    async def run():
+        added = await history.add_plays("arox", rows)
+        added_again = await history.add_plays("arox", rows)
+        return added, added_again
+
+    added, added_again = asyncio.run(run())
+    assert added == rows
+    assert added_again == []
+
+
+def test_concurrent_syncs_report_each_play_once(tmp_path):
+    history = ListeningHistory(str(tmp_path / "history.db"))
+    applied = []
+
+    async def fetch_page(after):
+        await asyncio.sleep(0)
+        items = [play(minute, f"t{minute}") for minute in range(10, 0, -1)]
+        return {
+            "items": [
+                p
+                for p in items
+                if after is None or parse_played_at(p["played_at"]) > after
+            ]
+        }
+
+    async def on_new_plays(plays):
+        applied.extend(plays)
+
+    async def run():
+        return await asyncio.gather(
+            *(history.sync("arox", fetch_page, on_new_plays) for _ in range(3))
+        )
+
+    results = asyncio.run(run())
+    assert sorted(len(result) for result in results) == [0, 0, 10]
+    assert len(applied) == 10
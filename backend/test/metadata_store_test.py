@@ -0,0 +1,78 @@
+import asyncio
+from MetadataStore import MetadataStore
+
+
+def make_lookup(calls):
+    async def fetch_many(ids):
+        calls.append(list(ids))
+        return [{"id": item_id, "name": f"Track {item_id}"} for item_id in ids]
+
+    return fetch_many
+
+
+def test_dehydrate_and_hydrate_round_trip():
+    store = MetadataStore()
+    response = {"items": [{"id": "a", "name": "A"}, {"id": "b", "name": "B"}]}
+
+    refs = store.dehydrate(response, "tracks")
+    assert refs["items"] == ["a", "b"]
+    # The original response isn't modified
+    assert response["items"][0] == {"id": "a", "name": "A"}
+
+    calls = []
+    hydrated = asyncio.run(store.hydrate(refs, "tracks", make_lookup(calls)))
+    assert [(t["id"], t["name"]) for t in hydrated["items"]] == [("a", "A"), ("b", "B")]
+    assert calls == []
+
+
+def test_nested_lists_are_dehydrated():
+    store = MetadataStore()
+    response = {"tracks": {"items": [{"id": "a"}], "total": 1}}
+
+    refs = store.dehydrate(response, "tracks", ("tracks", "items"))
+    assert refs == {"tracks": {"items": ["a"], "total": 1}}
+
+
+def test_objects_are_shared_between_responses():
+    store = MetadataStore()
+    store.dehydrate({"items": [{"id": "a", "name": "A"}]}, "tracks")
+    store.dehydrate({"items": [{"id": "a", "name": "A"}]}, "tracks")
+    assert store.stats()["tracks"] == 1
+
+
+def test_missing_ids_are_fetched_in_batches_of_50():
+    calls = []
+    store = MetadataStore()
+    store.put("tracks", [{"id": "known"}])
+    ids = ["known"] + [str(i) for i in range(120)] + ["0"]
+
+    items = asyncio.run(store.get_many("tracks", ids, make_lookup(calls)))
+    assert [item.id for item in items] == ids
+    assert [len(batch) for batch in calls] == [50, 50, 20]
+
+    # Everything is cached now
+    asyncio.run(store.get_many("tracks", ids, make_lookup(calls)))
+    assert len(calls) == 3
+
+
+def test_failed_lookups_are_dropped_when_hydrating():
+    store = MetadataStore()
+
+    async def failing_lookup(ids):
+        return None
+
+    refs = store.dehydrate({"items": [{"id": None, "name": "Local file"}]}, "tracks")
+    refs["items"].insert(0, "gone")
+    hydrated = asyncio.run(store.hydrate(refs, "tracks", failing_lookup))
+    assert [track["name"] for track in hydrated["items"]] == ["Local file"]
+
+
+def test_expired_and_evicted_entries_are_looked_up_again():
+    store = MetadataStore(max_entries=2, ttl=0)
+    store.put("artists", [{"id": "a"}])
+    assert store.get("artists", "a") is None
+
+    store = MetadataStore(max_entries=2)
+    store.put("artists", [{"id": "a"}, {"id": "b"}, {"id": "c"}])
+    assert store.get("artists", "a") is None
+    assert store.get("artists", "c").id == "c"
@@ -0,0 +1,67 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from Metrics import Registry, upstream_endpoint
+from MetricsMiddleware import MetricsMiddleware
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram(
+        "request_seconds", "Request time", ("route",), buckets=(0.1, 1.0)
+    )
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, "/spotify/profile")
+    lines = registry.render().decode().splitlines()
+    assert "# TYPE request_seconds histogram" in lines
+    assert 'request_seconds_bucket{route="/spotify/profile",le="0.1"} 1' in lines
+    assert 'request_seconds_bucket{route="/spotify/profile",le="1.0"} 3' in lines
+    assert 'request_seconds_bucket{route="/spotify/profile",le="+Inf"} 4' in lines
+    assert 'request_seconds_sum{route="/spotify/profile"} 4.05' in lines
+    assert 'request_seconds_count{route="/spotify/profile"} 4' in lines
+
+
+def test_counters_and_stats_sources():
+    registry = Registry()
+    counter = registry.counter("cache_keys_total", "Keys", ("result",))
+    counter.inc("hit")
+    counter.inc("hit", amount=2)
+    registry.register_stats("response_cache", lambda: {"hits": 5, "name": "x"})
+    lines = registry.render().decode().splitlines()
+    assert 'cache_keys_total{result="hit"} 3' in lines
+    assert "response_cache_hits 5" in lines
+    assert not any(line.startswith("response_cache_name") for line in lines)
+
+
+def test_upstream_endpoints_hide_ids():
+    assert (
+        upstream_endpoint("https://api.spotify.com/v1/playlists/37i9dQ/tracks?limit=50")
+        == "/v1/playlists/{id}/tracks"
+    )
+    assert upstream_endpoint("https://api.spotify.com/v1/me/top/tracks") == (
+        "/v1/me/top/tracks"
+    )
+    assert upstream_endpoint("https://accounts.spotify.com/api/token") == "/api/token"
+
+
+def test_middleware_labels_requests_by_route():
+    registry = Registry()
+    histogram = registry.histogram(
+        "http_seconds", "HTTP", ("method", "route", "status")
+    )
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, histogram=histogram)
+
+    @app.get("/spotify/playlists/{playlist_id}")
+    async def playlist(playlist_id: str):
+        return {"id": playlist_id}
+
+    client = TestClient(app)
+    client.get("/spotify/playlists/p1")
+    client.get("/spotify/playlists/p2")
+    client.get("/nope")
+    assert set(histogram.values) == {
+        ("GET", "/spotify/playlists/{playlist_id}", "200"),
+        ("GET", "unmatched", "404"),
+    }
+    count = sum(histogram.values[("GET", "/spotify/playlists/{playlist_id}", "200")][0])
+    assert count == 2
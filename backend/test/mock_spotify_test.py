@@ -0,0 +1,70 @@
+import asyncio
+import httpx
+from bench.MockSpotify import MockSpotify, TRACKS_PER_PLAYLIST
+
+
+def run_against(mock, requests):
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(mock.app), base_url="http://mock"
+        ) as client:
+            return await requests(client)
+
+    return asyncio.run(run())
+
+
+def log_in(client, user_id):
+    return client.post(
+        "/api/token", data={"grant_type": "authorization_code", "code": user_id}
+    )
+
+
+def test_login_and_profile():
+    async def requests(client):
+        tokens = (await log_in(client, "arox")).json()
+        refreshed = await client.post(
+            "/api/token",
+            data={
+                "grant_type": "refresh_token",
+                "refresh_token": tokens["refresh_token"],
+            },
+        )
+        headers = {"Authorization": f"Bearer {refreshed.json()['access_token']}"}
+        return (await client.get("/v1/me", headers=headers)).json()
+
+    profile = run_against(MockSpotify(latency_ms=0, jitter_ms=0), requests)
+    assert profile["id"] == "arox"
+    assert profile["uri"] == "spotify:user:arox"
+
+
+def test_playlist_tracks_paginate_with_etags():
+    async def requests(client):
+        token = (await log_in(client, "arox")).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        playlists = (await client.get("/v1/me/playlists", headers=headers)).json()
+        url = f"/v1/playlists/{playlists['items'][0]['id']}/tracks"
+        items = []
+        while url:
+            page = await client.get(url, headers=headers)
+            items.extend(page.json()["items"])
+            url = page.json()["next"]
+        etag = page.headers["etag"]
+        repeat = await client.get(page.url, headers={**headers, "If-None-Match": etag})
+        return items, repeat.status_code
+
+    items, repeat_status = run_against(MockSpotify(latency_ms=0, jitter_ms=0), requests)
+    assert len(items) == TRACKS_PER_PLAYLIST
+    assert items[0]["track"]["album"]["images"][0]["height"] == 640
+    assert repeat_status == 304
+
+
+def test_429s_are_injected_with_retry_after():
+    async def requests(client):
+        token = (await log_in(client, "arox")).json()["access_token"]
+        return await client.get("/v1/me", headers={"Authorization": f"Bearer {token}"})
+
+    mock = MockSpotify(latency_ms=0, jitter_ms=0, rate_429=1, retry_after=3)
+    response = run_against(mock, requests)
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "3"
+    assert mock.calls["429"] == 1
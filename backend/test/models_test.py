@@ -0,0 +1,63 @@
+import orjson
+from Models import Artist, Playlist, Profile, Track, page_from_spotify, page_to_dict
+
+SPOTIFY_TRACK = {
+    "album": {
+        "album_type": "album",
+        "artists": [{"id": "a1", "name": "Artist", "type": "artist"}],
+        "available_markets": ["US", "GB", "DE", "FR"] * 45,
+        "images": [
+            {"url": "https://i.scdn.co/image/640", "width": 640, "height": 640},
+            {"url": "https://i.scdn.co/image/300", "width": 300, "height": 300},
+            {"url": "https://i.scdn.co/image/64", "width": 64, "height": 64},
+        ],
+        "name": "Album",
+        "release_date": "2020-01-01",
+    },
+    "artists": [{"id": "a1", "name": "Artist", "type": "artist"}],
+    "available_markets": ["US", "GB", "DE", "FR"] * 45,
+    "duration_ms": 200000,
+    "explicit": False,
+    "external_ids": {"isrc": "USXXX2000001"},
+    "external_urls": {"spotify": "https://open.spotify.com/track/t1"},
+    "id": "t1",
+    "name": "Song",
+    "popularity": 70,
+    "uri": "spotify:track:t1",
+}
+
+
+def test_track_keeps_the_fields_clients_read():
+    track = Track.from_spotify(SPOTIFY_TRACK).to_dict()
+    assert track["name"] == "Song"
+    assert track["uri"] == "spotify:track:t1"
+    assert track["artists"] == [{"id": "a1", "name": "Artist"}]
+    assert track["album"]["images"][2]["url"] == "https://i.scdn.co/image/64"
+    assert track["external_urls"]["spotify"] == "https://open.spotify.com/track/t1"
+    assert "available_markets" not in track
+
+
+def test_kept_fields_are_much_smaller_than_spotify_objects():
+    track = Track.from_spotify(SPOTIFY_TRACK)
+    assert Track.from_spotify(track.to_dict()) == track
+    assert len(orjson.dumps(track.to_dict())) * 5 < len(orjson.dumps(SPOTIFY_TRACK))
+
+
+def test_missing_fields_default_to_empty():
+    artist = Artist.from_spotify({"id": "a1", "name": "Artist"}).to_dict()
+    assert artist["images"] == []
+    assert artist["followers"] == {"total": None}
+    profile = Profile.from_spotify({"id": "arox"}).to_dict()
+    assert profile["external_urls"] == {"spotify": None}
+
+
+def test_pages_keep_their_envelope():
+    page = {
+        "items": [{"id": "p1", "name": "Mix", "tracks": {"total": 3}}],
+        "next": None,
+    }
+    models = page_from_spotify(page, Playlist)
+    assert isinstance(models["items"][0], Playlist)
+    result = page_to_dict(models)
+    assert result["next"] is None
+    assert result["items"][0]["tracks"] == {"total": 3}
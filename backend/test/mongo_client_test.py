@@ -0,0 +1,185 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import pytest
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+import MongoClient
+from MongoClient import MongoDBClient, SESSION_INDEXES, TOKEN_INDEXES
+
+requires_mongo = pytest.mark.skipif(
+    not os.getenv("DB_URI"), reason="no MongoDB configured"
+)
+
+
+class StubCollection:
+    """Records what an AsyncCollection was asked to do"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    async def create_indexes(self, indexes):
+        self.calls.append(("create_indexes", indexes))
+
+    async def bulk_write(self, operations, ordered=True):
+        if self.fail:
+            raise PyMongoError("connection refused")
+        self.calls.append(("bulk_write", operations, ordered))
+        return SimpleNamespace(upserted_count=len(operations) - 1, modified_count=1)
+
+    async def delete_many(self, query):
+        self.calls.append(("delete_many", query))
+        return SimpleNamespace(deleted_count=len(query["user_id"]["$in"]))
+
+
+@pytest.fixture
+def offline_mongo(monkeypatch):
+    monkeypatch.setattr(MongoClient, "DB_NAME", "spotifly_test")
+    # The driver connects lazily, and the collections are stubbed before use
+    client = MongoDBClient(uri="mongodb://127.0.0.1:1")
+    client.user_session = StubCollection()
+    client.user_tokens = StubCollection()
+    yield client
+    asyncio.run(client.close())
+
+
+def index_specs(indexes):
+    return {index.document["name"]: index.document for index in indexes}
+
+
+def test_session_and_token_index_specs():
+    sessions = index_specs(SESSION_INDEXES)
+    assert sessions["session_key_unique"]["key"] == {"session_key": 1}
+    assert sessions["session_key_unique"]["unique"] is True
+    assert sessions["username"]["key"] == {"username": 1}
+    assert sessions["expires_at_ttl"]["expireAfterSeconds"] == 0
+
+    tokens = index_specs(TOKEN_INDEXES)
+    assert tokens["user_id_unique"]["key"] == {"user_id": 1}
+    assert tokens["user_id_unique"]["unique"] is True
+    assert "unique" not in tokens["access_token"]
+    assert tokens["expires_at_ttl"]["key"] == {"expires_at": 1}
+    assert tokens["expires_at_ttl"]["expireAfterSeconds"] == 0
+
+
+def test_ensure_indexes_creates_both_sets(offline_mongo):
+    assert asyncio.run(offline_mongo.ensure_indexes())
+    assert offline_mongo.user_session.calls == [("create_indexes", SESSION_INDEXES)]
+    assert offline_mongo.user_tokens.calls == [("create_indexes", TOKEN_INDEXES)]
+
+
+def test_bulk_session_upsert_is_one_unordered_write(offline_mongo):
+    expires_at = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    sessions = [
+        {"username": "arox", "session_key": "k1"},
+        {"username": "arox", "session_key": "k2", "expires_at": expires_at},
+    ]
+    assert asyncio.run(offline_mongo.upsert_sessions(sessions)) == 2
+    [(_, operations, ordered)] = offline_mongo.user_session.calls
+    assert ordered is False
+    assert all(isinstance(op, UpdateOne) for op in operations)
+    assert [op._filter for op in operations] == [
+        {"session_key": "k1"},
+        {"session_key": "k2"},
+    ]
+    assert operations[1]._doc["$set"]["expires_at"] == expires_at
+    # created_at is only written when the session is first inserted
+    assert "created_at" in operations[0]._doc["$setOnInsert"]
+    assert "created_at" not in operations[0]._doc["$set"]
+    assert all(op._upsert for op in operations)
+
+
+def test_bulk_token_upsert_and_delete(offline_mongo):
+    docs = [{"user_id": f"u{i}", "access_token": f"a{i}"} for i in range(3)]
+    assert asyncio.run(offline_mongo.upsert_user_tokens(docs)) == 3
+    [(_, operations, ordered)] = offline_mongo.user_tokens.calls
+    assert ordered is False
+    assert [op._filter for op in operations] == [{"user_id": f"u{i}"} for i in range(3)]
+    assert "updated_at" in operations[0]._doc["$set"]
+
+    assert asyncio.run(offline_mongo.delete_user_tokens(["u0", "u1"])) == 2
+    assert offline_mongo.user_tokens.calls[-1] == (
+        "delete_many",
+        {"user_id": {"$in": ["u0", "u1"]}},
+    )
+    # Nothing to write means no round trip at all
+    assert asyncio.run(offline_mongo.upsert_user_tokens([])) == 0
+    assert len(offline_mongo.user_tokens.calls) == 2
+
+
+def test_failed_token_write_returns_none(offline_mongo):
+    offline_mongo.user_tokens = StubCollection(fail=True)
+    assert asyncio.run(offline_mongo.upsert_user_tokens([{"user_id": "u0"}])) is None
+
+
+@pytest.fixture(scope="module")
+def run():
+    # One loop for the module so the pooled connections stay valid
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture(scope="module")
+def mongo(run):
+    client = MongoDBClient()
+    assert run(client.ensure_indexes())
+    yield client
+    run(client.close())
+
+
+@requires_mongo
+def test_session_round_trip(mongo, run):
+    key = f"test-{uuid.uuid4()}"
+    assert run(mongo.create_session("test-user", key)) is not None
+    session = run(mongo.get_session(key))
+    assert session["username"] == "test-user"
+    assert run(mongo.delete_session(key))
+    assert run(mongo.get_session(key)) is None
+
+
+@requires_mongo
+def test_expired_sessions_are_not_returned(mongo, run):
+    key = f"test-{uuid.uuid4()}"
+    run(mongo.create_session("test-user", key, ttl_minutes=-1))
+    assert run(mongo.get_session(key)) is None
+    run(mongo.delete_session(key))
+
+
+@requires_mongo
+def test_bulk_session_operations(mongo, run):
+    keys = [f"test-{uuid.uuid4()}" for _ in range(3)]
+    sessions = [{"username": "test-user", "session_key": key} for key in keys]
+    assert run(mongo.upsert_sessions(sessions)) == 3
+    assert set(run(mongo.get_sessions(keys))) == set(keys)
+    assert run(mongo.delete_sessions(keys)) == 3
+
+
+@requires_mongo
+def test_session_key_is_unique(mongo, run):
+    key = f"test-{uuid.uuid4()}"
+    assert run(mongo.create_session("test-user", key)) is not None
+    assert run(mongo.create_session("other-user", key)) is None
+    run(mongo.delete_session(key))
+
+
+@requires_mongo
+def test_user_tokens_round_trip(mongo, run):
+    user_id = f"test-{uuid.uuid4()}"
+    now = datetime.now(timezone.utc)
+    token_doc = {
+        "user_id": user_id,
+        "access_token": f"access-{user_id}",
+        "access_expires_at": now + timedelta(hours=1),
+        "refresh_token": "refresh",
+        "expires_at": now + timedelta(days=30),
+    }
+    assert run(mongo.upsert_user_tokens([token_doc])) == 1
+    assert run(mongo.get_user_tokens(user_id))["refresh_token"] == "refresh"
+    found = run(mongo.find_user_tokens_by_access_token(f"access-{user_id}"))
+    assert found["user_id"] == user_id
+    assert run(mongo.delete_user_tokens([user_id])) == 1
+    assert run(mongo.get_user_tokens(user_id)) is None
@@ -0,0 +1,64 @@
+import os
+
+# Keep the app offline and off the local databases
+os.environ.setdefault("CACHE_BACKEND", "memory")
+os.environ.setdefault("DB_URI", "")
+os.environ.setdefault("HISTORY_DB_PATH", ":memory:")
+os.environ.setdefault("ANALYTICS_DB_PATH", ":memory:")
+
+import asyncio
+import pytest
+from starlette.requests import ClientDisconnect
+import main
+
+
+def make_pages(closed):
+    async def pages():
+        try:
+            yield [{"id": "p1"}]
+            yield [{"id": "p2"}]
+        finally:
+            closed.append(True)
+
+    return pages()
+
+
+def test_pages_are_closed_when_the_client_is_gone_before_the_body():
+    closed = []
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client went away")
+
+    async def run():
+        response = await main.ndjson_response(make_pages(closed), "items")
+        with pytest.raises(ClientDisconnect):
+            await response(
+                {"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send
+            )
+        # Checked inside the loop, before asyncio.run finalizes stray generators
+        return list(closed)
+
+    assert asyncio.run(run()) == [True]
+
+
+def test_pages_are_streamed_as_ndjson():
+    closed = []
+    sent = []
+
+    async def receive():
+        await asyncio.Event().wait()
+
+    async def send(message):
+        sent.append(message)
+
+    async def run():
+        response = await main.ndjson_response(make_pages(closed), "items")
+        await response({"type": "http"}, receive, send)
+        return list(closed)
+
+    assert asyncio.run(run()) == [True]
+    body = b"".join(message.get("body", b"") for message in sent)
+    assert body == b'{"id":"p1"}\n{"id":"p2"}\n'
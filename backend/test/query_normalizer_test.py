@@ -0,0 +1,25 @@
+from QueryNormalizer import normalize_query
+
+
+def test_video_noise_is_stripped():
+    assert normalize_query("Artist - Song (Official Video)") == "artist song"
+    assert normalize_query("Artist - Song [Lyrics]") == "artist song"
+    assert normalize_query("Artist - Song | Official Music Video") == "artist song"
+
+
+def test_featuring_variants_share_a_key():
+    variants = [
+        "Artist - Song ft. Other",
+        "Artist - Song feat. Other",
+        "ARTIST - Song (feat. Other) [HD]",
+        "artist – song featuring other",
+    ]
+    assert {normalize_query(v) for v in variants} == {"artist song other"}
+
+
+def test_meaningful_words_are_kept():
+    assert (
+        normalize_query("Video Killed the Radio Star") == "video killed the radio star"
+    )
+    assert normalize_query("Song (Remastered 2011)") == "song remastered 2011"
+    assert normalize_query("Lyrics") == "lyrics"
@@ -1,36 +1,113 @@
+import asyncio
+import importlib.util
+import os
 import time
 import pytest
-from RedisCache import RedisCache
+from CacheBackend import CacheBackend, create_cache_backend
+
+# The in-memory backend always runs; the others need a server to talk to
+BACKENDS = [
+    "memory",
+    pytest.param(
+        "upstash",
+        marks=pytest.mark.skipif(
+            not os.getenv("UPSTASH_REDIS_REST_URL"), reason="no Upstash credentials"
+        ),
+    ),
+    pytest.param(
+        "redis",
+        marks=pytest.mark.skipif(
+            not os.getenv("REDIS_URL") or not importlib.util.find_spec("redis"),
+            reason="no native Redis server configured",
+        ),
+    ),
+]
 
 
 @pytest.fixture(scope="module")
-def redis_cache():
-    cache = RedisCache()
-    cache.flush_all()  # start fresh
-    return cache
+def run():
+    # One loop for the module so the client's pooled connections stay valid
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
 
+@pytest.fixture(scope="module", params=BACKENDS)
+def redis_cache(request, run):
+    cache = create_cache_backend(request.param)
+    run(cache.flush_all())  # start fresh
+    yield cache
+    run(cache.close())
 
-def test_set_and_get(redis_cache):
-    redis_cache.set("test_key", "test_value", ex=10)
-    value = redis_cache.get("test_key")
+
+def test_set_and_get(redis_cache, run):
+    run(redis_cache.set("test_key", "test_value", ex=10))
+    value = run(redis_cache.get("test_key"))
     assert value == "test_value"
 
 
-def test_get_all(redis_cache):
-    all_values = redis_cache.get_all()
+def test_get_all(redis_cache, run):
+    all_values = run(redis_cache.get_all())
     assert "test_key" in all_values
     assert all_values["test_key"] == "test_value"
 
 
-def test_expiration(redis_cache):
-    redis_cache.set("expire_key", "will_expire", ex=3)
+def test_mset_mget_and_delete_many(redis_cache, run):
+    run(
+        redis_cache.mset(
+            {"bulk_a": "1", "bulk_b": "2"}, ex={"bulk_a": 10, "bulk_b": 20}
+        )
+    )
+    assert run(redis_cache.mget(["bulk_a", "bulk_b", "bulk_missing"])) == [
+        "1",
+        "2",
+        None,
+    ]
+    run(redis_cache.delete_many(["bulk_a", "bulk_b"]))
+    assert run(redis_cache.mget(["bulk_a", "bulk_b"])) == [None, None]
+
+
+def test_scan_iter_streams_keys(redis_cache, run):
+    run(redis_cache.mset({f"scan:{i}": str(i) for i in range(25)}, ex=10))
+
+    async def collect():
+        return [
+            key
+            async for keys in redis_cache.scan_iter("scan:*", count=10)
+            for key in keys
+        ]
+
+    assert set(run(collect())) == {f"scan:{i}" for i in range(25)}
+
+
+def test_expiration(redis_cache, run):
+    run(redis_cache.set("expire_key", "will_expire", ex=3))
     time.sleep(4)
-    value = redis_cache.get("expire_key")
+    value = run(redis_cache.get("expire_key"))
     assert value is None
 
 
-def test_flush(redis_cache):
-    redis_cache.set("flush_key", "temp_value", ex=50)
-    redis_cache.flush_all()
-    all_values = redis_cache.get_all()
+def test_flush(redis_cache, run):
+    run(redis_cache.set("flush_key", "temp_value", ex=50))
+    run(redis_cache.flush_all())
+    all_values = run(redis_cache.get_all())
     assert all_values == {}
+
+
+def test_mget_with_ttl_reports_remaining_ttl(redis_cache, run):
+    run(redis_cache.set("ttl_key", "v", ex=10))
+    [(value, ttl_left), missing] = run(
+        redis_cache.mget_with_ttl(["ttl_key", "no_such_key"])
+    )
+    assert value == "v"
+    assert 0 < ttl_left <= 10
+    assert missing == (None, None)
+
+
+def test_incomplete_backend_cannot_be_instantiated():
+    class GetOnlyCache(CacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnlyCache()
@@ -0,0 +1,149 @@
+import asyncio
+from ResponseCache import ResponseCache
+
+
+def make_fetch(calls):
+    async def fetch():
+        calls.append(1)
+        return {"version": len(calls)}
+
+    return fetch
+
+
+def test_fresh_entries_are_served_from_cache():
+    calls = []
+    cache = ResponseCache()
+
+    async def run():
+        params = {"time_range": "long_term", "limit": 10}
+        first = await cache.get_or_fetch(
+            "arox", "top_tracks", params, make_fetch(calls)
+        )
+        second = await cache.get_or_fetch(
+            "arox", "top_tracks", params, make_fetch(calls)
+        )
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == {"version": 1}
+    assert len(calls) == 1
+
+
+def test_ttl_depends_on_time_range():
+    cache = ResponseCache(ttls={"top_tracks": {"short_term": 60, "long_term": 3600}})
+    assert cache.ttl_for("top_tracks", {"time_range": "short_term"}) == 60
+    assert cache.ttl_for("top_tracks", {"time_range": "long_term"}) == 3600
+
+
+def test_stale_entries_are_served_while_refreshing():
+    calls = []
+    cache = ResponseCache(ttls={"profile": 0.1})
+
+    async def run():
+        await cache.get_or_fetch("arox", "profile", {}, make_fetch(calls))
+        await asyncio.sleep(0.15)
+        stale = await cache.get_or_fetch("arox", "profile", {}, make_fetch(calls))
+        await asyncio.sleep(0.01)
+        refreshed = await cache.get_or_fetch("arox", "profile", {}, make_fetch(calls))
+        return stale, refreshed
+
+    stale, refreshed = asyncio.run(run())
+    assert stale == {"version": 1}
+    assert refreshed == {"version": 2}
+    assert cache.stats()["stale_hits"] == 1
+
+
+def test_invalidate_drops_user_entries():
+    calls = []
+    cache = ResponseCache()
+
+    async def run():
+        await cache.get_or_fetch("arox", "playlists", {}, make_fetch(calls))
+        await cache.get_or_fetch("other", "playlists", {}, make_fetch(calls))
+        cache.invalidate("arox", "playlists")
+        await cache.get_or_fetch("arox", "playlists", {}, make_fetch(calls))
+        await cache.get_or_fetch("other", "playlists", {}, make_fetch(calls))
+
+    asyncio.run(run())
+    assert len(calls) == 3
+
+
+def test_rendered_bodies_are_reused_until_the_entry_changes():
+    calls = []
+    renders = []
+    cache = ResponseCache()
+
+    async def render(value):
+        renders.append(value)
+        return f"body {value['version']}".encode(), True
+
+    async def run():
+        bodies = []
+        for _ in range(2):
+            bodies.append(
+                await cache.get_or_render(
+                    "arox", "profile", {}, make_fetch(calls), render
+                )
+            )
+        cache.invalidate("arox", "profile")
+        bodies.append(
+            await cache.get_or_render("arox", "profile", {}, make_fetch(calls), render)
+        )
+        return bodies
+
+    bodies = asyncio.run(run())
+    assert bodies == [b"body 1", b"body 1", b"body 2"]
+    assert len(renders) == 2
+
+
+def test_generation_counters_are_dropped_with_their_last_entry():
+    calls = []
+    cache = ResponseCache(max_entries=1)
+
+    async def run():
+        await cache.get_or_fetch("arox", "playlists", {}, make_fetch(calls))
+        cache.invalidate("arox", "playlists")
+        assert cache.generations == {("arox", "playlists"): 1}
+        # The stale entry is replaced, then evicted by another user's entry
+        await cache.get_or_fetch("arox", "playlists", {}, make_fetch(calls))
+        await cache.get_or_fetch("other", "profile", {}, make_fetch(calls))
+        # Invalidating a user with nothing cached leaves no counter behind
+        cache.invalidate("gone")
+
+    asyncio.run(run())
+    assert cache.generations == {}
+    assert set(cache.refs) == {"other", ("other", "profile")}
+
+
+def test_write_during_fetch_still_wins():
+    calls = []
+    cache = ResponseCache()
+
+    async def slow_fetch():
+        cache.invalidate("arox", "playlists")
+        return await make_fetch(calls)()
+
+    async def run():
+        await cache.get_or_fetch("arox", "playlists", {}, slow_fetch)
+        return await cache.get_or_fetch("arox", "playlists", {}, make_fetch(calls))
+
+    # The first result was fetched before the write landed, so it isn't reused
+    assert asyncio.run(run()) == {"version": 2}
+
+
+def test_rendered_bodies_fit_the_byte_budget():
+    calls = []
+    cache = ResponseCache(max_body_bytes=10)
+
+    async def render(value):
+        return b"x" * 6, True
+
+    async def run():
+        for user_id in ("u1", "u2"):
+            await cache.get_or_render(user_id, "profile", {}, make_fetch(calls), render)
+
+    asyncio.run(run())
+    # Both entries stay; only the newest body fits
+    assert len(cache.entries) == 2
+    assert list(cache.bodies) == [("u2", "profile", ())]
+    assert cache.stats()["body_bytes"] == 6
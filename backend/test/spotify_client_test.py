@@ -1,6 +1,12 @@
+import asyncio
+import json
+import os
 import time
+import httpx
 import pytest
 from SpotifyClient import SpotifyClient
+from ResponseCache import ResponseCache
+from bench.MockSpotify import MockSpotify
 
 
 @pytest.fixture(scope="module")
@@ -10,10 +16,10 @@ def spotify_client():
         def __init__(self):
             self.store = {}
 
-        def get(self, key):
+        async def get(self, key):
             return self.store.get(key)
 
-        def set(self, key, value, ex=None):
+        async def set(self, key, value, ex=None):
             self.store[key] = value
 
     access_cache = MockCache()
@@ -21,11 +27,342 @@ def spotify_client():
     return client
 
 
+@pytest.mark.skipif(not os.getenv("SPOT_CLIENT_ID"), reason="no Spotify credentials")
 def test_get_token(spotify_client):
-    token = spotify_client.get_token()
+    token = asyncio.run(spotify_client.get_token())
     assert token is not None
     assert isinstance(token, str)
     assert len(token) > 0
 
     # this doesnt get printed
     print(f"Fetched Spotify token: {token[:10]}...")  # Print first 10 chars for brevity
+
+
+def test_client_against_offline_stand_in(spotify_client):
+    mock = MockSpotify(latency_ms=0, jitter_ms=0)
+
+    async def run():
+        client = SpotifyClient(
+            spotify_client.access_cache.__class__(),
+            http_client=httpx.AsyncClient(transport=httpx.ASGITransport(mock.app)),
+        )
+        token = await client.get_token()
+        results = await client.search_tracks("neon river", limit=5)
+        playlists = await client.fetch_user_playlists("mock-access.arox.1")
+        return token, results, playlists
+
+    token, results, playlists = asyncio.run(run())
+    assert token.startswith("mock-service.")
+    assert len(results["tracks"]["items"]) == 5
+    assert len(playlists["items"]) == 20
+
+
+def test_concurrent_requests_share_client():
+    # Slow fake upstream: concurrent calls should overlap instead of queueing
+    async def handler(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"id": "arox"})
+
+    async def run():
+        client = SpotifyClient(
+            None, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        start = time.monotonic()
+        profiles = await asyncio.gather(
+            *(client.fetch_user_profile(f"token-{i}") for i in range(20))
+        )
+        elapsed = time.monotonic() - start
+        await client.aclose()
+        return profiles, elapsed
+
+    profiles, elapsed = asyncio.run(run())
+    assert all(profile["id"] == "arox" for profile in profiles)
+    assert elapsed < 1
+
+
+def test_concurrent_service_token_fetches_are_coalesced(spotify_client):
+    token_requests = []
+
+    async def handler(request):
+        token_requests.append(request)
+        await asyncio.sleep(0.1)
+        return httpx.Response(200, json={"access_token": "service"})
+
+    async def run():
+        client = SpotifyClient(
+            spotify_client.access_cache.__class__(),
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        )
+        return await asyncio.gather(*(client.get_token() for _ in range(20)))
+
+    tokens = asyncio.run(run())
+    assert tokens == ["service"] * 20
+    assert len(token_requests) == 1
+
+
+def test_similar_titles_share_search_cache(spotify_client):
+    search_requests = []
+
+    async def handler(request):
+        if request.url.path.endswith("/search"):
+            search_requests.append(request.url.params["q"])
+            return httpx.Response(200, json={"tracks": {"items": []}})
+        return httpx.Response(200, json={"access_token": "service"})
+
+    async def run():
+        client = SpotifyClient(
+            spotify_client.access_cache.__class__(),
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            search_cache=ResponseCache(),
+        )
+        await client.search_tracks("Artist - Song (Official Video)", limit=3)
+        await client.search_tracks("artist - song [Lyrics]", limit=3)
+        return client.search_cache.stats()
+
+    stats = asyncio.run(run())
+    assert search_requests == ["artist song"]
+    assert stats["hits"] == 1
+
+
+def test_cached_top_tracks_hold_ids_and_rehydrate(spotify_client):
+    lookups = []
+
+    async def handler(request):
+        if request.url.path.endswith("/me/top/tracks"):
+            items = [{"id": f"t{i}", "name": f"Track {i}"} for i in range(3)]
+            return httpx.Response(200, json={"items": items, "total": 3})
+        if request.url.path.endswith("/tracks"):
+            ids = request.url.params["ids"].split(",")
+            lookups.append(ids)
+            tracks = [{"id": track_id, "name": "Refetched"} for track_id in ids]
+            return httpx.Response(200, json={"tracks": tracks})
+        return httpx.Response(200, json={"access_token": "service"})
+
+    async def run():
+        client = SpotifyClient(
+            spotify_client.access_cache.__class__(),
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            response_cache=ResponseCache(),
+        )
+        first = await client.fetch_top_tracks("token", user_id="arox")
+        # Only IDs are kept in the per-user cache entry
+        cached = next(iter(client.response_cache.entries.values()))[0]
+        # Forget one shared object; it's looked up again by ID
+        del client.metadata.objects["tracks"]["t1"]
+        second = await client.fetch_top_tracks("token", user_id="arox")
+        return first, cached, second
+
+    first, cached, second = asyncio.run(run())
+    assert first["items"][1]["name"] == "Track 1"
+    assert cached["items"] == ["t0", "t1", "t2"]
+    assert second["items"][1]["name"] == "Refetched"
+    assert second["total"] == 3
+    assert lookups == [["t1"]]
+
+
+def test_encoded_catalog_hits_reuse_bytes_but_entries_hold_ids(spotify_client):
+    async def handler(request):
+        items = [{"id": f"t{i}", "name": f"Track {i}"} for i in range(3)]
+        return httpx.Response(200, json={"items": items, "total": 3})
+
+    async def run():
+        client = SpotifyClient(
+            None,
+            http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+            response_cache=ResponseCache(),
+        )
+        first = await client.fetch_top_tracks("token", user_id="arox", encoded=True)
+        hydrations = []
+        hydrate = client.metadata.hydrate
+
+        async def counting_hydrate(*args):
+            hydrations.append(args)
+            return await hydrate(*args)
+
+        client.metadata.hydrate = counting_hydrate
+        second = await client.fetch_top_tracks("token", user_id="arox", encoded=True)
+        cached = next(iter(client.response_cache.entries.values()))[0]
+        return first, second, cached, hydrations
+
+    first, second, cached, hydrations = asyncio.run(run())
+    assert json.loads(first)["items"][2]["name"] == "Track 2"
+    # The hit is the stored bytes: no hydrate, no re-encode
+    assert second is first
+    assert hydrations == []
+    assert cached["items"] == ["t0", "t1", "t2"]
+
+
+def test_repeated_adds_use_playlist_index(spotify_client):
+    requests_seen = []
+
+    async def handler(request):
+        requests_seen.append((request.method, request.url.path))
+        path = request.url.path
+        if path == "/v1/me/playlists":
+            offset = int(request.url.params.get("offset", 0))
+            if offset == 0:
+                # More playlists than fit on one page
+                items = [{"id": f"p{i}", "name": f"Mix {i}"} for i in range(50)]
+                next_url = "https://api.spotify.com/v1/me/playlists?offset=50&limit=50"
+                return httpx.Response(200, json={"items": items, "next": next_url})
+            items = [{"id": "yt", "name": "YouTubePlays"}]
+            return httpx.Response(200, json={"items": items, "next": None})
+        if request.method == "GET":
+            items = [{"track": {"uri": "spotify:track:old"}}]
+            return httpx.Response(200, json={"items": items, "next": None})
+        return httpx.Response(201, json={"snapshot_id": "s"})
+
+    async def run():
+        client = SpotifyClient(
+            None, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        first = await client.add_track_to_playlist(
+            "token", "YouTubePlays", "spotify:track:a", user_id="arox"
+        )
+        requests_seen.clear()
+        second = await client.add_track_to_playlist(
+            "token", "YouTubePlays", "spotify:track:b", user_id="arox"
+        )
+        duplicate = await client.add_track_to_playlist(
+            "token", "YouTubePlays", "spotify:track:a", user_id="arox"
+        )
+        return first, second, duplicate
+
+    assert asyncio.run(run()) == (True, True, True)
+    assert requests_seen == [("POST", "/v1/playlists/yt/tracks")]
+
+
+def test_bulk_add_batches_and_reports_per_uri(spotify_client):
+    batches = []
+
+    async def handler(request):
+        path = request.url.path
+        if path == "/v1/me/playlists":
+            items = [{"id": "yt", "name": "YouTubePlays"}]
+            return httpx.Response(200, json={"items": items, "next": None})
+        if request.method == "GET":
+            items = [{"track": {"uri": "spotify:track:0"}}]
+            return httpx.Response(200, json={"items": items, "next": None})
+        batches.append(json.loads(request.content)["uris"])
+        return httpx.Response(201, json={"snapshot_id": "s"})
+
+    async def run():
+        client = SpotifyClient(
+            None, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        uris = [f"spotify:track:{i}" for i in range(250)] + ["spotify:track:1"]
+        return await client.add_tracks_to_playlist(
+            "token", "YouTubePlays", uris, user_id="arox"
+        )
+
+    results = asyncio.run(run())
+    assert [len(batch) for batch in batches] == [100, 100, 49]
+    assert results["spotify:track:0"] == "duplicate"
+    assert list(results.values()).count("added") == 249
+
+
+def test_failed_batch_keeps_earlier_results(spotify_client):
+    posts = []
+
+    async def handler(request):
+        if request.url.path == "/v1/me/playlists":
+            items = [{"id": "yt", "name": "YouTubePlays"}]
+            return httpx.Response(200, json={"items": items, "next": None})
+        if request.method == "GET":
+            return httpx.Response(200, json={"items": [], "next": None})
+        posts.append(request)
+        if len(posts) == 2:
+            raise httpx.ConnectError("connection reset", request=request)
+        return httpx.Response(201, json={"snapshot_id": "s"})
+
+    async def run():
+        client = SpotifyClient(
+            None, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        uris = [f"spotify:track:{i}" for i in range(150)]
+        return await client.add_tracks_to_playlist(
+            "token", "YouTubePlays", uris, user_id="arox"
+        )
+
+    results = list(asyncio.run(run()).values())
+    assert results.count("added") == 100
+    assert results.count("failed") == 50
+
+
+def test_iter_playlist_tracks_walks_every_page(spotify_client):
+    requested = []
+
+    async def handler(request):
+        offset = int(request.url.params.get("offset", 0))
+        requested.append(offset)
+        items = [{"track": {"uri": f"spotify:track:{offset + i}"}} for i in range(100)]
+        next_url = None
+        if offset < 200:
+            next_url = f"https://api.spotify.com/v1/playlists/p/tracks?offset={offset + 100}&limit=100"
+        return httpx.Response(200, json={"items": items, "next": next_url})
+
+    async def run():
+        client = SpotifyClient(
+            None, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        pages = []
+        async for items in client.iter_playlist_tracks("token", "p"):
+            # The next page is already on its way while we handle this one
+            await asyncio.sleep(0.01)
+            pages.append((len(items), len(requested)))
+        return pages
+
+    pages = asyncio.run(run())
+    assert [count for count, _ in pages] == [100, 100, 100]
+    assert pages[0][1] == 2
+    assert requested == [0, 100, 200]
+
+
+def test_playlist_listing_revalidates_with_spotify_etag(spotify_client):
+    sent_etags = []
+
+    async def handler(request):
+        sent_etags.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        items = [{"id": "p1", "name": "Mix"}]
+        return httpx.Response(
+            200, json={"items": items, "next": None}, headers={"ETag": '"v1"'}
+        )
+
+    async def run():
+        client = SpotifyClient(
+            None, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        first = await client.fetch_user_playlists("token", user_id="arox")
+        # A rotated access token still revalidates the same user's entry
+        second = await client.fetch_user_playlists("new-token", user_id="arox")
+        return first, second, client.not_modified
+
+    first, second, not_modified = asyncio.run(run())
+    assert sent_etags == [None, '"v1"']
+    assert first == second
+    assert second["items"][0]["name"] == "Mix"
+    assert not_modified == 1
+
+
+def test_etag_cache_is_bounded_by_body_size(spotify_client, monkeypatch):
+    monkeypatch.setattr("SpotifyClient.SPOTIFY_ETAG_CACHE_BYTES", 1000)
+
+    async def handler(request):
+        items = [{"id": "p1", "name": "x" * 300}]
+        return httpx.Response(
+            200, json={"items": items, "next": None}, headers={"ETag": '"v1"'}
+        )
+
+    async def run():
+        client = SpotifyClient(
+            None, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        )
+        for user_id in ("u1", "u2", "u3", "u4"):
+            await client.fetch_user_playlists("token", user_id=user_id)
+        return client
+
+    client = asyncio.run(run())
+    assert [key[2] for key in client.etags] == ["u3", "u4"]
+    assert client.etag_bytes <= 1000
@@ -0,0 +1,115 @@
+import asyncio
+import time
+import pytest
+from TieredCache import TieredCache
+
+
+class CountingBackend:
+    def __init__(self):
+        self.store = {}
+        # key -> seconds left, as PTTL would report it
+        self.ttls = {}
+        self.gets = 0
+
+    async def get(self, key):
+        self.gets += 1
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+        self.ttls[key] = ex
+
+    async def delete(self, key):
+        self.store.pop(key, None)
+
+    async def mget(self, keys):
+        self.gets += 1
+        return [self.store.get(key) for key in keys]
+
+    async def mget_with_ttl(self, keys):
+        self.gets += 1
+        return [(self.store.get(key), self.ttls.get(key)) for key in keys]
+
+    async def mset(self, values, ex=None):
+        self.store.update(values)
+
+    async def delete_many(self, keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+
+@pytest.fixture
+def backend():
+    return CountingBackend()
+
+
+def test_hot_reads_skip_backend(backend):
+    cache = TieredCache(backend)
+    asyncio.run(cache.set("token:abc", "arox", ex=60))
+    for _ in range(5):
+        assert asyncio.run(cache.get("token:abc")) == "arox"
+    assert backend.gets == 0
+    assert cache.stats()["hits"] == 5
+
+
+def test_miss_fills_from_backend(backend):
+    backend.store["user:arox:access_token"] = "xyz"
+    cache = TieredCache(backend)
+    assert asyncio.run(cache.get("user:arox:access_token")) == "xyz"
+    assert asyncio.run(cache.get("user:arox:access_token")) == "xyz"
+    assert backend.gets == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_entry_expires_with_ex(backend):
+    cache = TieredCache(backend)
+    asyncio.run(cache.set("short", "lived", ex=1))
+    backend.store.pop("short")
+    time.sleep(1.1)
+    assert asyncio.run(cache.get("short")) is None
+
+
+def test_delete_goes_through(backend):
+    cache = TieredCache(backend)
+    asyncio.run(cache.set("token:abc", "arox", ex=60))
+    asyncio.run(cache.delete("token:abc"))
+    assert "token:abc" not in backend.store
+    assert asyncio.run(cache.get("token:abc")) is None
+
+
+def test_stays_within_memory_budget(backend):
+    cache = TieredCache(backend, max_bytes=4096)
+    for i in range(100):
+        asyncio.run(cache.set(f"key:{i}", "v" * 100, ex=60))
+    stats = cache.stats()
+    assert stats["bytes"] <= 4096
+    assert stats["evictions"] > 0
+    # Most recently written keys survive
+    assert asyncio.run(cache.get("key:99")) == "v" * 100
+
+
+def test_mget_only_asks_backend_for_local_misses(backend):
+    cache = TieredCache(backend)
+    backend.store["user:arox:refresh_token"] = "refresh"
+    asyncio.run(cache.mset({"token:abc": "arox", "user:arox:access_token": "abc"}))
+
+    keys = ["token:abc", "user:arox:refresh_token", "missing"]
+    assert asyncio.run(cache.mget(keys)) == ["arox", "refresh", None]
+    assert backend.gets == 1
+    assert asyncio.run(cache.mget(keys[:2])) == ["arox", "refresh"]
+    assert backend.gets == 1
+
+    asyncio.run(cache.delete_many(["token:abc", "user:arox:refresh_token"]))
+    assert asyncio.run(cache.mget(keys)) == [None, None, None]
+
+
+def test_fill_never_outlives_the_backend_ttl(backend):
+    backend.store["token:abc"] = "arox"
+    backend.ttls["token:abc"] = 0.1
+    cache = TieredCache(backend, fill_ttl=60)
+    assert asyncio.run(cache.get("token:abc")) == "arox"
+    # Expired in the backend (e.g. on another worker's logout path)
+    backend.store.pop("token:abc")
+    time.sleep(0.15)
+    assert asyncio.run(cache.get("token:abc")) is None
+    assert backend.gets == 2
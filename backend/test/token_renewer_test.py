@@ -0,0 +1,76 @@
+import asyncio
+from TokenRenewer import TokenRenewer
+
+
+def make_renew_fn(renewed, key):
+    async def renew():
+        renewed.append(key)
+        return True
+
+    return renew
+
+
+def test_due_tokens_are_renewed():
+    renewed = []
+    renewer = TokenRenewer(lead_time=60, idle_timeout=600)
+    renewer.schedule("user:due", 30, make_renew_fn(renewed, "user:due"))
+    renewer.schedule("user:later", 3600, make_renew_fn(renewed, "user:later"))
+    asyncio.run(renewer.run_pending())
+    assert renewed == ["user:due"]
+
+
+def test_idle_users_are_not_renewed():
+    renewed = []
+    renewer = TokenRenewer(lead_time=60, idle_timeout=-1)
+    renewer.schedule("user:idle", 30, make_renew_fn(renewed, "user:idle"))
+    renewer.schedule(
+        "_service", 30, make_renew_fn(renewed, "_service"), track_idle=False
+    )
+    asyncio.run(renewer.run_pending())
+    assert renewed == ["_service"]
+
+
+def test_background_loop_renews_before_expiry():
+    renewed = []
+
+    async def run():
+        renewer = TokenRenewer(lead_time=60, idle_timeout=600)
+        renewer.start()
+        renewer.schedule("user:arox", 60.2, make_renew_fn(renewed, "user:arox"))
+        await asyncio.sleep(0.4)
+        await renewer.stop()
+
+    asyncio.run(run())
+    assert renewed == ["user:arox"]
+
+
+def test_renewer_restarts_on_a_new_event_loop():
+    renewed = []
+    renewer = TokenRenewer(lead_time=60, idle_timeout=600)
+
+    async def run(key):
+        renewer.start()
+        renewer.schedule(key, 60.1, make_renew_fn(renewed, key))
+        await asyncio.sleep(0.3)
+        await renewer.stop()
+
+    # Like a second app startup in the same process, e.g. another TestClient
+    asyncio.run(run("user:first"))
+    asyncio.run(run("user:second"))
+    assert renewed == ["user:first", "user:second"]
+
+
+def test_last_seen_only_tracks_scheduled_keys():
+    renewer = TokenRenewer(lead_time=60, idle_timeout=600)
+    for i in range(100):
+        renewer.touch(f"user:stranger{i}")
+    assert renewer.last_seen == {}
+
+    async def fail():
+        return False
+
+    renewer.schedule("user:failing", 30, fail)
+    renewer.touch("user:failing")
+    asyncio.run(renewer.run_pending())
+    # The renewal failed, so nothing is scheduled and nothing is remembered
+    assert renewer.last_seen == {}
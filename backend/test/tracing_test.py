@@ -0,0 +1,75 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from Tracing import NOOP_SPAN, end_trace, span, start_trace, traced
+from TracingMiddleware import Profiler, TracingMiddleware
+
+
+def test_spans_nest_across_tasks():
+    @traced("auth.verify")
+    async def verify():
+        await asyncio.sleep(0)
+
+    async def upstream(i):
+        with span("spotify GET /v1/me", attempt=i):
+            await asyncio.sleep(0.01)
+
+    async def run():
+        token = start_trace("req-1")
+        with span("route"):
+            await verify()
+            await asyncio.gather(upstream(1), upstream(2))
+        return end_trace(token)
+
+    trace = asyncio.run(run())
+    depths = {(span.name, span.depth) for span in trace.spans}
+    assert depths == {("route", 0), ("auth.verify", 1), ("spotify GET /v1/me", 1)}
+    waterfall = trace.waterfall()
+    assert waterfall.startswith("[req-1] trace, 4 spans")
+    assert "  spotify GET /v1/me attempt=2" in waterfall
+
+
+def test_spans_are_free_outside_a_trace():
+    assert span("cache.get") is NOOP_SPAN
+
+
+app = FastAPI()
+app.add_middleware(
+    TracingMiddleware,
+    log_threshold_ms=0,
+    profiler=Profiler(token="let-me-profile", sample_rate=0),
+)
+
+
+@app.get("/spotify/playlists/{playlist_id}")
+async def playlist(playlist_id: str):
+    return {"id": playlist_id}
+
+
+client = TestClient(app)
+
+
+def test_request_id_is_propagated(capsys):
+    response = client.get("/spotify/playlists/p1", headers={"X-Request-ID": "abc-123"})
+    assert response.headers["x-request-id"] == "abc-123"
+    out = capsys.readouterr().out
+    assert "[abc-123] trace, 1 spans" in out
+    assert "route=/spotify/playlists/{playlist_id}" in out
+    assert "status=200" in out
+
+
+def test_unsafe_request_ids_are_replaced():
+    response = client.get("/spotify/playlists/p1", headers={"X-Request-ID": "a b\nc"})
+    assert len(response.headers["x-request-id"]) == 32
+
+
+def test_profile_needs_the_token(capsys):
+    client.get("/spotify/playlists/p1", headers={"X-Profile": "guess"})
+    assert "profile" not in capsys.readouterr().out
+    client.get(
+        "/spotify/playlists/p1",
+        headers={"X-Profile": "let-me-profile", "X-Request-ID": "prof-1"},
+    )
+    out = capsys.readouterr().out
+    assert "[prof-1] profile" in out
+    assert "function calls" in out
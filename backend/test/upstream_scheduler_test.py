@@ -0,0 +1,98 @@
+import asyncio
+import time
+import httpx
+from UpstreamScheduler import UpstreamScheduler, UpstreamBusyError
+
+
+def make_request_fn(statuses, calls, headers=None):
+    async def request_fn():
+        calls.append(time.monotonic())
+        return httpx.Response(statuses.pop(0), headers=headers or {})
+
+    return request_fn
+
+
+def test_retry_after_is_honored():
+    calls = []
+    scheduler = UpstreamScheduler()
+    request_fn = make_request_fn([429, 200], calls, headers={"Retry-After": "0.3"})
+    response = asyncio.run(scheduler.send(request_fn))
+    assert response.status_code == 200
+    assert calls[1] - calls[0] >= 0.3
+    assert scheduler.stats()["throttled"] == 1
+
+
+def test_server_errors_are_only_retried_for_gets():
+    calls = []
+    scheduler = UpstreamScheduler()
+    response = asyncio.run(scheduler.send(make_request_fn([503, 200], calls)))
+    assert response.status_code == 200
+
+    response = asyncio.run(
+        scheduler.send(make_request_fn([503, 200], calls), idempotent=False)
+    )
+    assert response.status_code == 503
+
+
+def test_user_bucket_paces_requests():
+    calls = []
+    scheduler = UpstreamScheduler(user_rate=10, user_burst=1)
+
+    async def run():
+        await asyncio.gather(
+            *(
+                scheduler.send(make_request_fn([200], calls), user_key="arox")
+                for _ in range(4)
+            )
+        )
+
+    asyncio.run(run())
+    # One request from the burst, then one every 100ms
+    assert calls[-1] - calls[0] >= 0.29
+
+
+def test_queue_deadline_rejects_excess_requests():
+    calls = []
+    scheduler = UpstreamScheduler(user_rate=1, user_burst=1, deadline=0.5)
+
+    async def run():
+        return await asyncio.gather(
+            *(
+                scheduler.send(make_request_fn([200], calls), user_key="arox")
+                for _ in range(3)
+            ),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+    assert sum(isinstance(r, UpstreamBusyError) for r in results) == 2
+    assert len(calls) == 1
+
+
+def test_app_rate_backs_off_on_429_and_recovers(monkeypatch):
+    calls = []
+    scheduler = UpstreamScheduler(app_rate=100, app_burst=100, app_min_rate=10)
+    request_fn = make_request_fn([429, 200], calls, headers={"Retry-After": "0"})
+    asyncio.run(scheduler.send(request_fn))
+    # Halved by the 429, then nudged back up by the successful retry
+    assert 50 < scheduler.stats()["app_rate"] < 51
+
+    # A healthy process isn't paced by the app bucket at all
+    scheduler = UpstreamScheduler(app_rate=1000, app_burst=1000)
+
+    async def run():
+        await asyncio.gather(
+            *(scheduler.send(make_request_fn([200], calls)) for _ in range(200))
+        )
+
+    waits = []
+    sleep = asyncio.sleep
+
+    async def recording_sleep(delay, *args, **kwargs):
+        waits.append(delay)
+        await sleep(delay, *args, **kwargs)
+
+    monkeypatch.setattr(asyncio, "sleep", recording_sleep)
+    asyncio.run(run())
+    assert waits == []
+    assert scheduler.stats()["app_rate"] == 1000
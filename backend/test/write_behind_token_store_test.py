@@ -0,0 +1,123 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from WriteBehindTokenStore import WriteBehindTokenStore
+
+
+class MockStore:
+    def __init__(self):
+        self.docs = {}
+        self.writes = []
+        self.fail = False
+
+    async def upsert_user_tokens(self, token_docs):
+        self.writes.append([doc["user_id"] for doc in token_docs])
+        if self.fail:
+            return None
+        for doc in token_docs:
+            self.docs[doc["user_id"]] = doc
+        return len(token_docs)
+
+    async def delete_user_tokens(self, user_ids):
+        self.writes.append(list(user_ids))
+        if self.fail:
+            return None
+        for user_id in user_ids:
+            self.docs.pop(user_id, None)
+        return len(user_ids)
+
+    async def get_user_tokens(self, user_id):
+        return self.docs.get(user_id)
+
+    async def find_user_tokens_by_access_token(self, access_token):
+        for doc in self.docs.values():
+            if doc["access_token"] == access_token:
+                return doc
+        return None
+
+
+def token_doc(access_token, access_ttl=3600):
+    now = datetime.now(timezone.utc)
+    return {
+        "access_token": access_token,
+        "access_expires_at": now + timedelta(seconds=access_ttl),
+        "refresh_token": "refresh",
+        "expires_at": now + timedelta(days=30),
+    }
+
+
+def test_writes_are_coalesced_and_batched():
+    async def run():
+        store = MockStore()
+        token_store = WriteBehindTokenStore(store, batch_size=2)
+        for access_token in ("a1", "a2", "a3"):
+            token_store.put("arox", token_doc(access_token))
+        token_store.put("brix", token_doc("b1"))
+        token_store.put("cole", token_doc("c1"))
+        # Buffered writes are readable before they reach the store
+        assert (await token_store.get("arox"))["access_token"] == "a3"
+        assert store.docs == {}
+        assert await token_store.flush()
+        return store
+
+    store = asyncio.run(run())
+    assert store.writes == [["arox", "brix"], ["cole"]]
+    assert store.docs["arox"]["access_token"] == "a3"
+
+
+def test_failed_flush_is_retried_behind_newer_writes():
+    async def run():
+        store = MockStore()
+        token_store = WriteBehindTokenStore(store)
+        token_store.put("arox", token_doc("old"))
+        store.fail = True
+        assert not await token_store.flush()
+        token_store.put("arox", token_doc("new"))
+        store.fail = False
+        assert await token_store.flush()
+        return store, token_store
+
+    store, token_store = asyncio.run(run())
+    assert store.docs["arox"]["access_token"] == "new"
+    assert token_store.pending == {}
+
+
+def test_removed_users_do_not_verify_before_flush():
+    async def run():
+        store = MockStore()
+        token_store = WriteBehindTokenStore(store)
+        token_store.put("arox", token_doc("abc"))
+        await token_store.flush()
+        token_store.remove("arox")
+        return (
+            await token_store.get("arox"),
+            await token_store.find_by_access_token("abc"),
+        )
+
+    assert asyncio.run(run()) == (None, None)
+
+
+def test_stop_flushes_buffered_writes():
+    async def run():
+        store = MockStore()
+        token_store = WriteBehindTokenStore(store, flush_interval=60)
+        token_store.start()
+        token_store.put("arox", token_doc("abc"))
+        await token_store.stop()
+        return store
+
+    assert "arox" in asyncio.run(run()).docs
+
+
+def test_lock_belongs_to_the_loop_that_started_it():
+    token_store = WriteBehindTokenStore(MockStore(), flush_interval=60)
+
+    async def run():
+        token_store.start()
+        token_store.put("arox", token_doc("abc"))
+        await token_store.stop()
+
+    # Constructed outside any loop, then reused across two
+    asyncio.run(run())
+    asyncio.run(run())
+    assert token_store.lock is None
+    assert "arox" in token_store.store.docs
@@ -30,35 +30,18 @@ export default function Dashboard() {
 			if (!accessToken) return;
 
 			try {
-				// Fetch profile
-				const profileRes = await fetch(
-					"http://localhost:8080/spotify/profile",
-					{
-						headers: { Authorization: `Bearer ${accessToken}` },
-					}
-				);
-				if (profileRes.ok) {
-					setProfile(await profileRes.json());
-				}
-
-				// Fetch top tracks
-				const tracksRes = await fetch(
-					`http://localhost:8080/spotify/top-tracks?time_range=${timeRange}&limit=10`,
+				// Fetch profile, top tracks and top artists in one round trip
+				const dashboardRes = await fetch(
+					`http://localhost:8080/spotify/dashboard?time_range=${timeRange}&limit=10`,
 					{ headers: { Authorization: `Bearer ${accessToken}` } }
 				);
-				if (tracksRes.ok) {
-					const data = await tracksRes.json();
-					setTopTracks(data.items || []);
-				}
-
-				// Fetch top artists
-				const artistsRes = await fetch(
-					`http://localhost:8080/spotify/top-artists?time_range=${timeRange}&limit=10`,
-					{ headers: { Authorization: `Bearer ${accessToken}` } }
-				);
-				if (artistsRes.ok) {
-					const data = await artistsRes.json();
-					setTopArtists(data.items || []);
+				if (dashboardRes.ok) {
+					const data = await dashboardRes.json();
+					if (data.profile?.data) {
+						setProfile(data.profile.data);
+					}
+					setTopTracks(data.top_tracks?.data?.items || []);
+					setTopArtists(data.top_artists?.data?.items || []);
 				}
 
 				setLoading(false);